@@ -0,0 +1,71 @@
+import numpy as np
+
+DEFAULT_ARC_TOLERANCE = 0.002  # Errore di corda massimo in mm, come l'arc_tolerance di grbl
+MAX_ARC_SEGMENTS = 10000
+FULL_CIRCLE_EPSILON = 1e-9
+
+
+def arc_geometry(x0, y0, x1, y1, i, j, r, clockwise):
+    """Centro, raggi iniziale e finale, angolo iniziale e angolo spazzato (con segno) di ogni arco.
+
+    Il centro si ricava da I/J (offset dal punto iniziale, NaN = 0) oppure, se R è presente, dal raggio:
+    con R positivo l'arco è il più corto dei due possibili, con R negativo il più lungo. Un arco con
+    punto finale uguale a quello iniziale e centro da I/J è un cerchio completo.
+    """
+    cx = x0 + np.nan_to_num(i)
+    cy = y0 + np.nan_to_num(j)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        by_radius = ~np.isnan(r)
+        dx = x1 - x0
+        dy = y1 - y0
+        chord = np.hypot(dx, dy)
+        # Se R è troppo piccolo per la corda l'arco degenera in un semicerchio
+        offset = np.sqrt(np.maximum(r ** 2 - chord ** 2 / 4, 0.0))
+        # Per G2 con R positivo il centro sta a destra della corda percorsa da inizio a fine
+        side = np.where(clockwise, 1.0, -1.0) * np.sign(r)
+        by_radius &= chord > 0
+        cx = np.where(by_radius, (x0 + x1) / 2 + side * offset * dy / chord, cx)
+        cy = np.where(by_radius, (y0 + y1) / 2 - side * offset * dx / chord, cy)
+
+    start_radius = np.hypot(x0 - cx, y0 - cy)
+    end_radius = np.hypot(x1 - cx, y1 - cy)
+    start_angle = np.arctan2(y0 - cy, x0 - cx)
+    counterclockwise_sweep = np.mod(np.arctan2(y1 - cy, x1 - cx) - start_angle, 2 * np.pi)
+    full_circle = counterclockwise_sweep < FULL_CIRCLE_EPSILON
+    counterclockwise_sweep = np.where(full_circle, 2 * np.pi, counterclockwise_sweep)
+    sweep = np.where(clockwise, counterclockwise_sweep - 2 * np.pi, counterclockwise_sweep)
+    sweep = np.where(clockwise & full_circle, -2 * np.pi, sweep)
+    return cx, cy, start_radius, end_radius, start_angle, sweep
+
+
+def arc_segment_counts(radius, sweep, tolerance=DEFAULT_ARC_TOLERANCE):
+    """Numero di corde per arco: il minimo con cui la freccia di ogni corda non supera tolerance."""
+    with np.errstate(invalid='ignore', divide='ignore'):
+        max_angle = 2 * np.arccos(np.clip(1 - tolerance / radius, -1.0, 1.0))
+        counts = np.ceil(np.abs(sweep) / max_angle)
+    counts = np.where(np.isfinite(counts) & (radius > 0), counts, 1)
+    return np.clip(counts, 1, MAX_ARC_SEGMENTS).astype(np.int64)
+
+
+def interpolate_arcs(x0, y0, x1, y1, i, j, r, clockwise, tolerance=DEFAULT_ARC_TOLERANCE):
+    """Converte in blocco gli archi in spezzate.
+
+    Restituisce (counts, xs, ys): counts[k] è il numero di corde dell'arco k, xs/ys i punti finali di tutte
+    le corde in ordine, arco dopo arco (il punto iniziale di ogni arco è escluso). Se i raggi iniziale e finale
+    differiscono, il raggio varia linearmente lungo l'arco; l'ultimo punto coincide sempre con quello programmato.
+    """
+    cx, cy, start_radius, end_radius, start_angle, sweep = arc_geometry(x0, y0, x1, y1, i, j, r, clockwise)
+    counts = arc_segment_counts(np.maximum(start_radius, end_radius), sweep, tolerance)
+
+    arc = np.repeat(np.arange(len(counts)), counts)
+    ends = np.cumsum(counts)
+    step = np.arange(len(arc)) - (ends - counts)[arc] + 1
+    t = step / counts[arc]
+    angle = start_angle[arc] + sweep[arc] * t
+    radius = start_radius[arc] + (end_radius - start_radius)[arc] * t
+    xs = cx[arc] + radius * np.cos(angle)
+    ys = cy[arc] + radius * np.sin(angle)
+    xs[ends - 1] = x1
+    ys[ends - 1] = y1
+    return counts, xs, ys
@@ -1,5 +1,8 @@
-import os
-import subprocess
+import queue
+from gcode_translator import translate_gcode_file, MODE_UNROLLED
+from job_scheduler import JOB_UPLOAD, JOB_STREAM
+
+UPLOAD_POLL_INTERVAL_MS = 100
 
 def translate_gcode(app):
     """Traduci un programma G-code in un programma Arduino."""
@@ -8,7 +11,7 @@ def translate_gcode(app):
         app.show_message("Errore: Nessun programma selezionato", "error")
         return
 
-    program_path = app.program_listbox.get(selected_program_index)
+    program_path = app.program_listbox.get(selected_program_index[0])
     if program_path.endswith('.gcode'):
         app.translate_gcode_to_arduino(program_path)
     else:
@@ -17,144 +20,72 @@ def translate_gcode(app):
 def translate_gcode_to_arduino(app, program_path):
     """Traduci un programma G-code in comandi Arduino e scrivilo in un file .ino."""
     try:
-        with open(program_path, 'r') as file:
-            gcode_data = file.readlines()
-
-        arduino_commands = app.convert_gcode_to_arduino(gcode_data)
-
-        arduino_file_base = os.path.splitext(os.path.basename(program_path))[0]
-        arduino_dir = os.path.join(os.path.dirname(program_path), arduino_file_base)
-        os.makedirs(arduino_dir, exist_ok=True)
-
-        arduino_file_path = os.path.join(arduino_dir, f"{arduino_file_base}.ino")
-        with open(arduino_file_path, 'w') as arduino_file:
-            arduino_file.write(arduino_commands)
-
+        mode = app.translation_mode.get()
+        arduino_file_path = translate_gcode_file(program_path, mode=mode)
         app.show_message(f"Programma tradotto e salvato in {arduino_file_path}", "info")
         return arduino_file_path
     except Exception as e:
         app.show_message(f"Errore: Impossibile tradurre il programma G-code: {e}", "error")
         return None
 
-def convert_gcode_to_arduino(gcode_data):
-    """Converti le istruzioni G-code in comandi Arduino."""
-    arduino_code = """
-// Dichiarazione delle funzioni
-void blink(int x, int y, int z);
-void turnOnPin(int pin, int duration);
-void turnOnAnalogPin(int pin, int duration);
-
-// Configurazione iniziale
-void setup() {
-  pinMode(13, OUTPUT);  // Pin per il controllo
-  Serial.begin(115200);  // Inizializza la comunicazione seriale
-}
-
-// Funzioni di utilità
-void blink(int x, int y, int z) {
-  int onTime = y * 1000;  // Converti in millisecondi
-  int offTime = z * 1000; // Converti in millisecondi
-
-  for (int i = 0; i < x; i++) {
-    digitalWrite(13, HIGH); // Accendi il pin
-    delay(onTime);          // Aspetta il tempo di accensione
-    digitalWrite(13, LOW);  // Spegni il pin
-    delay(offTime);         // Aspetta il tempo di spegnimento
-  }
-}
+def upload_to_arduino(app):
+    """Accoda il caricamento del programma selezionato sulla macchina scelta."""
+    program_path = selected_program(app)
+    if program_path is None:
+        return
+    if not (program_path.endswith('.gcode') or program_path.endswith('.ino')):
+        app.show_message("Errore: Seleziona un file .ino per caricare su Arduino", "error")
+        return
 
-void turnOnPin(int pin, int duration) {
-  pinMode(pin, OUTPUT);
-  digitalWrite(pin, HIGH);
-  delay(duration * 1000); // Converti in millisecondi
-  digitalWrite(pin, LOW);
-}
+    mode = app.translation_mode.get()
+    submit_device_job(app, JOB_UPLOAD, program_path, mode)
 
-void turnOnAnalogPin(int pin, int duration) {
-  pinMode(pin, OUTPUT);
-  analogWrite(pin, 255); // Imposta il valore analogico massimo
-  delay(duration * 1000); // Converti in millisecondi
-  analogWrite(pin, 0); // Spegni il pin analogico
-}
+def stream_to_arduino(app):
+    """Accoda l'invio in streaming del programma selezionato sulla macchina scelta, senza compilarlo né caricarlo."""
+    program_path = selected_program(app)
+    if program_path is None:
+        return
+    if not program_path.endswith('.gcode'):
+        app.show_message("Errore: Seleziona un file G-code", "error")
+        return
 
-void loop() {
-"""
-    for line in gcode_data:
-        line = line.strip()
-        if line.startswith('G1'):
-            parts = line.split()
-            x = y = z = None
-            for part in parts:
-                if part.startswith('X'):
-                    x = part[1:]
-                elif part.startswith('Y'):
-                    y = part[1:]
-                elif part.startswith('Z'):
-                    z = part[1:]
-            if x and y and z:
-                arduino_code += f'  blink({x}, {y}, {z});\n'
-        elif line.startswith('G2'):
-            parts = line.split()
-            pin = duration = None
-            for part in parts:
-                if part.startswith('X'):
-                    pin = part[1:]
-                elif part.startswith('Y'):
-                    duration = part[1:]
-            if pin and duration:
-                arduino_code += f'  turnOnPin({pin}, {duration});\n'
-        elif line.startswith('G3'):
-            parts = line.split()
-            pin = duration = None
-            for part in parts:
-                if part.startswith('X'):
-                    pin = part[1:]
-                elif part.startswith('Y'):
-                    duration = part[1:]
-            if pin and duration:
-                arduino_code += f'  turnOnAnalogPin({pin}, {duration});\n'
-    arduino_code += """
-}
-"""
-    return arduino_code
+    submit_device_job(app, JOB_STREAM, program_path)
 
-def upload_to_arduino(app):
-    """Carica il programma selezionato su Arduino."""
+def selected_program(app):
+    """Percorso del primo programma selezionato, o None dopo aver segnalato l'errore."""
     selected_program_index = app.program_listbox.curselection()
     if not selected_program_index:
         app.show_message("Errore: Nessun programma selezionato", "error")
-        return
-
-    program_path = app.program_listbox.get(selected_program_index)
-
-    if program_path.endswith('.gcode'):
-        program_path = app.translate_gcode_to_arduino(program_path)
-        if not program_path:
-            return
-
-    if program_path.endswith('.ino'):
-        try:
-            if not os.path.isfile(program_path):
-                app.show_message(f"Errore: Il file {program_path} non esiste.", "error")
-                return
+        return None
+    return app.program_listbox.get(selected_program_index[0])
 
-            arduino_cli_path = os.path.join(os.path.dirname(__file__), 'arduino-cli', 'arduino-cli.exe')
-            sketch_dir = os.path.dirname(program_path)
+def submit_device_job(app, kind, program_path, mode=MODE_UNROLLED):
+    """Accoda il lavoro sulla macchina selezionata: le macchine diverse lavorano in parallelo."""
+    try:
+        app.scheduler.submit(app.device_var.get(), kind, program_path, mode)
+    except ValueError as e:
+        app.show_message(f"Errore: {e}", "error")
 
-            compile_result = subprocess.run([arduino_cli_path, "compile", "--fqbn", "arduino:avr:uno", sketch_dir], capture_output=True, text=True)
-            if compile_result.returncode != 0:
-                app.show_message(f"Errore durante la compilazione: {compile_result.stderr}", "error")
-                print(f"Errore durante la compilazione: {compile_result.stderr}")
-                return
+def poll_device_jobs(app):
+    """Riporta nell'interfaccia gli eventi dei lavori in background, dal ciclo di Tk."""
+    try:
+        while True:
+            job, kind, message = app.scheduler.events.get_nowait()
+            if kind == 'error':
+                print(f"[{job.device.name}] {message}")
+            app.show_message(f"[{job.device.name}] {message}", "error" if kind == 'error' else "info")
+    except queue.Empty:
+        pass
+    app.root.after(UPLOAD_POLL_INTERVAL_MS, lambda: poll_device_jobs(app))
+
+def cancel_upload(app):
+    """Annulla i lavori in corso e in coda sulla macchina selezionata."""
+    device_name = app.device_var.get()
+    if app.scheduler.cancel_device(device_name) == 0:
+        app.show_message(f"Errore: Nessun lavoro in corso su {device_name}", "error")
+        return
+    app.show_message(f"Annullamento dei lavori su {device_name} in corso...", "info")
 
-            upload_result = subprocess.run([arduino_cli_path, "upload", "-p", "COM3", "--fqbn", "arduino:avr:uno", sketch_dir], capture_output=True, text=True)
-            if upload_result.returncode == 0:
-                app.show_message("Programma caricato su Arduino con successo", "info")
-            else:
-                app.show_message(f"Errore durante il caricamento: {upload_result.stderr}", "error")
-                print(f"Errore durante il caricamento: {upload_result.stderr}")
-        except Exception as e:
-            app.show_message(f"Errore: Impossibile caricare il programma su Arduino: {e}", "error")
-            print(f"Impossibile caricare il programma su Arduino: {e}")
-    else:
-        app.show_message("Errore: Seleziona un file .ino per caricare su Arduino", "error")
\ No newline at end of file
+def show_device_status(app):
+    """Mostra lo stato di tutte le macchine registrate."""
+    app.show_message(app.scheduler.describe_status(), "info")
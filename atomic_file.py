@@ -0,0 +1,44 @@
+import os
+import shutil
+import threading
+from contextlib import contextmanager
+
+
+@contextmanager
+def atomic_write(path, mode='w', encoding=None, buffering=-1):
+    """Apre un file temporaneo accanto a path e, se il blocco with termina senza errori, lo sostituisce a path.
+
+    Il file temporaneo sta nella stessa cartella e viene forzato su disco (fsync) prima del rename, che
+    mantiene i permessi del file sostituito: un'interruzione durante la scrittura lascia intatta la versione
+    precedente, e un errore nel blocco elimina il file temporaneo senza toccare path.
+    """
+    temporary_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(temporary_path, mode, buffering=buffering, encoding=encoding) as file:
+            yield file
+            file.flush()
+            os.fsync(file.fileno())
+        if os.path.exists(path):
+            shutil.copymode(path, temporary_path)
+        os.replace(temporary_path, path)
+    except BaseException:
+        try:
+            os.remove(temporary_path)
+        except OSError:
+            pass
+        raise
+    fsync_directory(os.path.dirname(os.path.abspath(path)))
+
+
+def fsync_directory(directory):
+    """Rende persistente il rename sui sistemi che lo consentono (su Windows le cartelle non si aprono)."""
+    try:
+        descriptor = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(descriptor)
+    except OSError:
+        pass
+    finally:
+        os.close(descriptor)
@@ -0,0 +1,151 @@
+import argparse
+import os
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from gcode_translator import translate_gcode_file, TRANSLATION_MODES, MODE_UNROLLED
+from upload_pipeline import UploadJob, DEFAULT_FQBN, ARDUINO_CLI_PATH
+
+BATCH_POLL_INTERVAL_MS = 200
+
+
+def build_program(program_path, mode=MODE_UNROLLED, fqbn=DEFAULT_FQBN, compile_sketch=True,
+                  arduino_cli_path=ARDUINO_CLI_PATH):
+    """Traduce (e opzionalmente compila) un programma; eseguita nei processi del pool.
+
+    Restituisce un dizionario con percorso, esito, tempi per fase e messaggio d'errore.
+    """
+    start = time.perf_counter()
+    result = {'path': program_path, 'ok': False, 'cached': False, 'timings': {}, 'message': ""}
+    try:
+        if compile_sketch:
+            job = UploadJob(program_path, mode, fqbn, arduino_cli_path=arduino_cli_path)
+            result['ok'] = job.compile() is not None
+            result['cached'] = job.cache_hit
+            result['timings'] = job.timings
+            errors = [message for kind, message in drain_events(job.events) if kind == 'error']
+            result['message'] = errors[-1] if errors else ""
+        else:
+            translate_start = time.perf_counter()
+            translate_gcode_file(program_path, mode=mode)
+            result['timings'] = {'translate': time.perf_counter() - translate_start}
+            result['ok'] = True
+    except Exception as e:
+        result['message'] = str(e)
+    result['timings']['total'] = time.perf_counter() - start
+    return result
+
+
+def drain_events(events):
+    """Estrae tutti gli eventi presenti in una coda senza bloccare."""
+    drained = []
+    try:
+        while True:
+            drained.append(events.get_nowait())
+    except queue.Empty:
+        return drained
+
+
+def find_programs(directory):
+    """Elenca in ordine i file .gcode di una cartella."""
+    return sorted(os.path.join(directory, file_name) for file_name in os.listdir(directory)
+                  if file_name.endswith('.gcode'))
+
+
+def batch_build(program_paths, mode=MODE_UNROLLED, fqbn=DEFAULT_FQBN, compile_sketch=True,
+                max_workers=None, on_result=None):
+    """Traduce e compila in parallelo una lista di programmi usando un pool di processi."""
+    results = []
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(build_program, program_path, mode, fqbn, compile_sketch)
+                   for program_path in program_paths]
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+            if on_result is not None:
+                on_result(result)
+    results.sort(key=lambda result: result['path'])
+    return results
+
+
+def format_result(result):
+    """Formatta una riga di riepilogo per un programma."""
+    timings = ' '.join(f"{stage}={seconds:.2f}s" for stage, seconds in result['timings'].items())
+    status = "OK" if result['ok'] else "ERRORE"
+    if result['cached']:
+        status += " (cache)"
+    line = f"{status:<12} {os.path.basename(result['path'])}  {timings}"
+    if result['message']:
+        line += f"\n             {result['message']}"
+    return line
+
+
+def format_summary(results, elapsed):
+    """Formatta il riepilogo complessivo di un'elaborazione batch."""
+    failed = sum(1 for result in results if not result['ok'])
+    return f"{len(results)} programmi elaborati in {elapsed:.2f}s, {failed} errori"
+
+
+def batch_selected_programs(app):
+    """Traduce e compila in background tutti i programmi selezionati nella lista."""
+    selected_indexes = app.program_listbox.curselection()
+    program_paths = [app.program_listbox.get(index) for index in selected_indexes]
+    program_paths = [path for path in program_paths if path.endswith('.gcode')]
+    if not program_paths:
+        app.show_message("Errore: Nessun programma G-code selezionato", "error")
+        return
+
+    mode = app.translation_mode.get()
+    outcome = {}
+
+    def run_batch():
+        start = time.perf_counter()
+        outcome['results'] = batch_build(program_paths, mode)
+        outcome['elapsed'] = time.perf_counter() - start
+
+    worker = threading.Thread(target=run_batch, name="batch", daemon=True)
+    worker.start()
+    app.show_message(f"Elaborazione di {len(program_paths)} programmi in corso...", "info")
+    poll_batch(app, worker, outcome)
+
+
+def poll_batch(app, worker, outcome):
+    """Attende dal ciclo di Tk la fine dell'elaborazione batch e ne mostra il riepilogo."""
+    if worker.is_alive():
+        app.root.after(BATCH_POLL_INTERVAL_MS, lambda: poll_batch(app, worker, outcome))
+        return
+    if 'results' not in outcome:
+        app.show_message("Errore: Elaborazione batch interrotta", "error")
+        return
+    results = outcome['results']
+    for result in results:
+        print(format_result(result))
+    failed = any(not result['ok'] for result in results)
+    app.show_message(format_summary(results, outcome['elapsed']), "error" if failed else "info")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Traduce e compila in parallelo tutti i programmi G-code di una cartella.")
+    parser.add_argument('directory', help="cartella contenente i file .gcode")
+    parser.add_argument('--mode', choices=TRANSLATION_MODES, default=MODE_UNROLLED, help="modalità di traduzione")
+    parser.add_argument('--fqbn', default=DEFAULT_FQBN, help="scheda di destinazione per la compilazione")
+    parser.add_argument('--no-compile', action='store_true', help="esegue solo la traduzione")
+    parser.add_argument('--workers', type=int, default=None, help="numero di processi paralleli")
+    args = parser.parse_args(argv)
+
+    program_paths = find_programs(args.directory)
+    if not program_paths:
+        print(f"Nessun file .gcode trovato in {args.directory}")
+        return 1
+
+    start = time.perf_counter()
+    results = batch_build(program_paths, args.mode, args.fqbn, not args.no_compile, args.workers,
+                          on_result=lambda result: print(format_result(result), flush=True))
+    print(format_summary(results, time.perf_counter() - start))
+    return 0 if all(result['ok'] for result in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
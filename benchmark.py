@@ -0,0 +1,289 @@
+import argparse
+import json
+import math
+import multiprocessing
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from atomic_file import atomic_write
+from gcode_translator import TRANSLATION_MODES, MODE_UNROLLED
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), 'benchmark_baseline.json')
+DEFAULT_LINE_COUNTS = (10_000, 100_000, 1_000_000)
+DEFAULT_REPEAT = 3
+DEFAULT_TOLERANCE = 0.15
+RENDER_SIZE = (800, 800)
+
+STAGE_VALIDATE = 'validate'
+STAGE_PARSE = 'parse'
+STAGE_TRANSLATE = 'translate'
+STAGE_TOOLPATH = 'toolpath'
+STAGE_RENDER = 'render'
+STAGES = (STAGE_VALIDATE, STAGE_PARSE, STAGE_TRANSLATE, STAGE_TOOLPATH, STAGE_RENDER)
+
+# Area di lavoro dei programmi sintetici (mm) e composizione delle lavorazioni generate
+WORK_AREA = (0.0, 100.0, -50.0, 50.0)
+FEATURE_LENGTH = (20, 200)
+DWELL_PROBABILITY = 0.002
+
+
+def synthetic_program_path(line_count, seed, directory):
+    """Percorso del programma sintetico con quel numero di righe e quel seme (generato una volta sola)."""
+    return os.path.join(directory, f"synthetic_{line_count}_{seed}.gcode")
+
+
+def iter_synthetic_lines(line_count, seed=0):
+    """Produce le righe di un programma simile all'uscita di un CAM: esattamente line_count righe.
+
+    Il programma alterna lavorazioni composte da un rapido di avvicinamento, tratti lineari con cambi
+    di avanzamento, archi G2/G3 con centro I/J coerente e qualche sosta G4; si chiude con M30.
+    """
+    rng = random.Random(seed)
+    xmin, xmax, ymin, ymax = WORK_AREA
+    yield "G21"
+    yield "G90"
+    x, y = 30.0, -10.0
+    remaining = line_count - 3
+    while remaining >= 2:
+        x, y = rng.uniform(xmin, xmax), rng.uniform(ymin, ymax)
+        yield f"G0 X{x:.3f} Y{y:.3f}"
+        yield f"G1 Z-1 F{rng.choice((5, 10, 20)):.0f}"
+        remaining -= 2
+        for _ in range(min(rng.randint(*FEATURE_LENGTH), remaining)):
+            kind = rng.random()
+            if kind < DWELL_PROBABILITY:
+                yield f"G4 P{rng.choice((0.1, 0.5, 1)):g}"
+            elif kind < 0.65:
+                x = min(max(x + rng.uniform(-5, 5), xmin), xmax)
+                y = min(max(y + rng.uniform(-5, 5), ymin), ymax)
+                feed = f" F{rng.choice((10, 20, 30, 40)):.0f}" if rng.random() < 0.05 else ""
+                yield f"G1 X{x:.3f} Y{y:.3f}{feed}"
+            else:
+                # Arco di raggio e ampiezza casuali: il punto finale sta sulla circonferenza del centro I/J
+                radius = rng.uniform(0.5, 10)
+                angle = rng.uniform(0, 2 * math.pi)
+                cx, cy = x - radius * math.cos(angle), y - radius * math.sin(angle)
+                clockwise = rng.random() < 0.5
+                sweep = rng.uniform(0.1, math.pi) * (-1 if clockwise else 1)
+                end_x, end_y = cx + radius * math.cos(angle + sweep), cy + radius * math.sin(angle + sweep)
+                yield (f"{'G2' if clockwise else 'G3'} X{end_x:.3f} Y{end_y:.3f} "
+                       f"I{cx - x:.3f} J{cy - y:.3f}")
+                x, y = end_x, end_y
+            remaining -= 1
+    if remaining:
+        yield "G1 Z0"
+    yield "M30"
+
+
+def generate_program(line_count, seed=0, directory=None):
+    """Scrive (se non esiste già) il programma sintetico e ne restituisce il percorso."""
+    directory = directory or tempfile.gettempdir()
+    program_path = synthetic_program_path(line_count, seed, directory)
+    if os.path.exists(program_path):
+        return program_path
+    os.makedirs(directory, exist_ok=True)
+    with atomic_write(program_path, buffering=1 << 20) as program_file:
+        for line in iter_synthetic_lines(line_count, seed):
+            program_file.write(line)
+            program_file.write("\n")
+    return program_path
+
+
+def peak_rss():
+    """Picco di memoria residente del processo in byte, o None dove il modulo resource non esiste."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux riporta kB, macOS byte
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def prepare_stage(stage, program_path, mode):
+    """Prepara (fuori dal tempo misurato) l'input della fase e restituisce la funzione da cronometrare."""
+    from gcode_parser import parse_gcode_file, validate_gcode_file
+
+    if stage == STAGE_VALIDATE:
+        return lambda: validate_gcode_file(program_path)
+    if stage == STAGE_PARSE:
+        return lambda: parse_gcode_file(program_path)
+
+    program = parse_gcode_file(program_path)
+    if stage == STAGE_TRANSLATE:
+        from gcode_translator import convert_gcode_to_arduino
+        return lambda: convert_gcode_to_arduino(program, mode)
+
+    from toolpath import compute_toolpath
+    if stage == STAGE_TOOLPATH:
+        return lambda: compute_toolpath(program)
+    if stage == STAGE_RENDER:
+        toolpath = compute_toolpath(program)
+        return lambda: render_toolpath(toolpath)
+    raise ValueError(f"Fase sconosciuta: {stage}")
+
+
+def render_toolpath(toolpath, size=RENDER_SIZE):
+    """Disegna l'intero percorso con il backend Agg, come fa il simulatore a fine programma."""
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from gcode_parser import OP_G0, OP_G1
+
+    figure = Figure(figsize=(size[0] / 100, size[1] / 100), dpi=100)
+    canvas = FigureCanvasAgg(figure)
+    ax = figure.add_subplot(111)
+    view = toolpath.bounds()
+    ax.set_xlim(view[:2])
+    ax.set_ylim(view[2:])
+    pixels = (ax.bbox.width, ax.bbox.height)
+    for opcode, style in ((OP_G0, 'ro-'), (OP_G1, 'bo-')):
+        ax.plot(*toolpath.polyline(opcode, len(toolpath), view=view, size=pixels), style)
+    canvas.draw()
+
+
+def run_stage(stage, program_path, line_count, mode=MODE_UNROLLED, repeat=DEFAULT_REPEAT):
+    """Misura una fase su un programma; eseguita in un processo nuovo, così il picco di memoria è solo suo.
+
+    Il tempo riportato è il migliore di repeat esecuzioni, il picco di memoria comprende la preparazione.
+    """
+    result = {'stage': stage, 'lines': line_count, 'mode': mode, 'seconds': None, 'lines_per_second': None,
+              'peak_rss': None, 'message': ""}
+    try:
+        measured = prepare_stage(stage, program_path, mode)
+        best = math.inf
+        for _ in range(repeat):
+            start = time.perf_counter()
+            measured()
+            best = min(best, time.perf_counter() - start)
+        result['seconds'] = best
+        result['lines_per_second'] = line_count / best if best > 0 else math.inf
+    except ImportError as e:
+        result['message'] = f"saltata: {e}"
+    result['peak_rss'] = peak_rss()
+    return result
+
+
+def run_benchmarks(line_counts, stages=STAGES, mode=MODE_UNROLLED, repeat=DEFAULT_REPEAT, seed=0,
+                   directory=None, on_result=None):
+    """Genera i programmi sintetici ed esegue ogni fase su ciascuno, una alla volta."""
+    results = []
+    context = multiprocessing.get_context('spawn')
+    for line_count in line_counts:
+        program_path = generate_program(line_count, seed, directory)
+        for stage in stages:
+            # Un processo per misura: il picco di memoria di una fase non si somma a quello delle altre
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                result = executor.submit(run_stage, stage, program_path, line_count, mode, repeat).result()
+            result['seed'] = seed
+            results.append(result)
+            if on_result is not None:
+                on_result(result)
+    return results
+
+
+def baseline_key(result):
+    """Chiave di confronto di una misura: si confrontano solo misure dello stesso programma sintetico (righe e seme)
+    e, per la traduzione, della stessa modalità. I riferimenti salvati senza seme non corrispondono a nessuna misura.
+    """
+    mode = result.get('mode') if result['stage'] == 'translate' else None
+    return result['stage'], result['lines'], mode, result.get('seed')
+
+
+def load_baseline(path=BASELINE_PATH):
+    """Legge i risultati di riferimento, indicizzati per baseline_key; vuoto se il file non esiste."""
+    try:
+        with open(path, 'r') as baseline_file:
+            entries = json.load(baseline_file)['results']
+    except FileNotFoundError:
+        return {}
+    except (ValueError, KeyError, TypeError) as e:
+        raise ValueError(f"Riferimento dei benchmark non valido in {path}: {e}") from None
+    return {baseline_key(entry): entry for entry in entries}
+
+
+def save_baseline(results, path=BASELINE_PATH, baseline=None):
+    """Salva i risultati come nuovo riferimento, in modo atomico.
+
+    Le voci di baseline con una chiave diversa (altre fasi, dimensioni, modalità o semi) vengono conservate.
+    """
+    entries = dict(baseline or {})
+    entries.update((baseline_key(result), result) for result in results if result['seconds'] is not None)
+    with atomic_write(path) as baseline_file:
+        json.dump({'python': platform.python_version(), 'machine': platform.machine(),
+                   'results': list(entries.values())}, baseline_file, indent=2)
+
+
+def find_regressions(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    """Confronta i risultati con il riferimento: throughput calato o memoria cresciuta oltre tolerance."""
+    regressions = []
+    for result in results:
+        reference = baseline.get(baseline_key(result))
+        if reference is None or result['seconds'] is None:
+            continue
+        if result['lines_per_second'] < reference['lines_per_second'] * (1 - tolerance):
+            regressions.append(f"{result['stage']} ({result['lines']} righe): "
+                               f"{format_rate(result['lines_per_second'])} contro "
+                               f"{format_rate(reference['lines_per_second'])}")
+        if result['peak_rss'] and reference.get('peak_rss') and result['peak_rss'] > reference['peak_rss'] * (1 + tolerance):
+            regressions.append(f"{result['stage']} ({result['lines']} righe): memoria "
+                               f"{format_bytes(result['peak_rss'])} contro {format_bytes(reference['peak_rss'])}")
+    return regressions
+
+
+def format_rate(lines_per_second):
+    return f"{lines_per_second:,.0f} righe/s"
+
+
+def format_bytes(size):
+    return f"{size / (1 << 20):.1f} MiB" if size is not None else "n/d"
+
+
+def format_result(result, baseline=None):
+    """Una riga di rapporto per una misura, con la variazione rispetto al riferimento se presente."""
+    label = f"{result['stage']:<10} {result['lines']:>10} righe"
+    if result['stage'] == 'translate':
+        label += f" ({result['mode']})"
+    if result['seconds'] is None:
+        return f"{label}  {result['message']}"
+    line = (f"{label}  {result['seconds']:8.3f}s  {format_rate(result['lines_per_second']):>18}  "
+            f"picco {format_bytes(result['peak_rss'])}")
+    reference = (baseline or {}).get(baseline_key(result))
+    if reference is not None:
+        change = result['lines_per_second'] / reference['lines_per_second'] - 1
+        line += f"  ({change:+.0%} rispetto al riferimento)"
+    return line
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Misura parser, traduttore, percorso utensile e disegno su programmi sintetici.")
+    parser.add_argument('--lines', type=int, nargs='+', default=list(DEFAULT_LINE_COUNTS),
+                        help="righe dei programmi generati (es. 10000 1000000 10000000)")
+    parser.add_argument('--stages', choices=STAGES, nargs='+', default=list(STAGES), help="fasi da misurare")
+    parser.add_argument('--mode', choices=TRANSLATION_MODES, default=MODE_UNROLLED, help="modalità di traduzione")
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT, help="esecuzioni per misura (vale la migliore)")
+    parser.add_argument('--seed', type=int, default=0, help="seme dei programmi generati")
+    parser.add_argument('--workdir', default=None, help="cartella dei programmi generati (predefinita: temporanea)")
+    parser.add_argument('--baseline', default=BASELINE_PATH, help="file dei risultati di riferimento")
+    parser.add_argument('--save-baseline', action='store_true', help="salva i risultati come nuovo riferimento")
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help="peggioramento ammesso prima di segnalare una regressione (0.15 = 15%%)")
+    args = parser.parse_args(argv)
+
+    baseline = load_baseline(args.baseline)
+    results = run_benchmarks(args.lines, args.stages, args.mode, max(1, args.repeat), args.seed, args.workdir,
+                             on_result=lambda result: print(format_result(result, baseline), flush=True))
+    regressions = find_regressions(results, baseline, args.tolerance)
+    for regression in regressions:
+        print(f"REGRESSIONE: {regression}")
+    if args.save_baseline:
+        save_baseline(results, args.baseline, baseline)
+        print(f"Riferimento salvato in {args.baseline}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,101 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+import uuid
+from gcode_translator import TRANSLATOR_VERSION
+
+CACHE_DIR = os.path.join(os.path.dirname(__file__), '.build_cache')
+MAX_CACHE_BYTES = 512 * 1024 * 1024  # 512 MB
+MAX_CACHE_AGE = 30 * 24 * 3600  # 30 giorni
+HASH_CHUNK_SIZE = 1 << 20
+METADATA_FILE = 'entry.json'
+
+
+def cache_key(source_path, fqbn, mode):
+    """Calcola la chiave di cache: hash del sorgente, versione del traduttore, FQBN e modalità."""
+    digest = hashlib.sha256()
+    digest.update(f"{TRANSLATOR_VERSION}\0{fqbn}\0{mode}\0".encode())
+    with open(source_path, 'rb') as file:
+        for chunk in iter(lambda: file.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def lookup_build(key, cache_dir=CACHE_DIR):
+    """Restituisce la cartella della build compilata per la chiave, o None se non è in cache."""
+    entry_dir = os.path.join(cache_dir, key)
+    if not os.path.isfile(os.path.join(entry_dir, METADATA_FILE)):
+        return None
+    os.utime(entry_dir)  # Aggiorna l'ultimo accesso per l'eviction LRU
+    return os.path.join(entry_dir, 'build')
+
+
+def create_staging_dir(key, cache_dir=CACHE_DIR):
+    """Crea una cartella temporanea in cui compilare prima di registrare la build in cache."""
+    staging_dir = os.path.join(cache_dir, f"{key}.{uuid.uuid4().hex}.tmp")
+    os.makedirs(os.path.join(staging_dir, 'build'))
+    return staging_dir
+
+
+def discard_staging_dir(staging_dir):
+    """Elimina una cartella temporanea di compilazione non andata a buon fine."""
+    shutil.rmtree(staging_dir, ignore_errors=True)
+
+
+def store_build(key, staging_dir, sketch_path, fqbn, cache_dir=CACHE_DIR):
+    """Registra in cache la build compilata in staging_dir insieme allo sketch tradotto."""
+    shutil.copy2(sketch_path, os.path.join(staging_dir, os.path.basename(sketch_path)))
+    metadata = {'fqbn': fqbn, 'sketch': os.path.basename(sketch_path), 'translator_version': TRANSLATOR_VERSION,
+                'created': time.time()}
+    with open(os.path.join(staging_dir, METADATA_FILE), 'w') as metadata_file:
+        json.dump(metadata, metadata_file)
+
+    entry_dir = os.path.join(cache_dir, key)
+    try:
+        os.rename(staging_dir, entry_dir)
+    except OSError:
+        # Un'altra build con la stessa chiave è stata registrata nel frattempo
+        discard_staging_dir(staging_dir)
+    return os.path.join(entry_dir, 'build')
+
+
+def directory_size(path):
+    """Calcola la dimensione totale in byte dei file contenuti in una cartella."""
+    total = 0
+    for dir_path, _, file_names in os.walk(path):
+        for file_name in file_names:
+            try:
+                total += os.path.getsize(os.path.join(dir_path, file_name))
+            except OSError:
+                pass
+    return total
+
+
+def evict_cache(cache_dir=CACHE_DIR, max_bytes=MAX_CACHE_BYTES, max_age=MAX_CACHE_AGE):
+    """Rimuove le build più vecchie di max_age e poi le meno usate finché la cache supera max_bytes."""
+    if not os.path.isdir(cache_dir):
+        return []
+    now = time.time()
+    entries = []
+    removed = []
+    for name in os.listdir(cache_dir):
+        entry_dir = os.path.join(cache_dir, name)
+        if not os.path.isdir(entry_dir):
+            continue
+        last_access = os.path.getmtime(entry_dir)
+        if now - last_access > max_age:
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            removed.append(name)
+        elif not name.endswith('.tmp'):
+            entries.append((last_access, name, directory_size(entry_dir)))
+
+    total = sum(size for _, _, size in entries)
+    for last_access, name, size in sorted(entries):
+        if total <= max_bytes:
+            break
+        shutil.rmtree(os.path.join(cache_dir, name), ignore_errors=True)
+        removed.append(name)
+        total -= size
+    return removed
@@ -0,0 +1,272 @@
+import argparse
+import sys
+from gcode_parser import iter_gcode_errors, parse_gcode_file
+from gcode_translator import translate_gcode_file, TRANSLATION_MODES, MODE_UNROLLED
+from instrumentation import recorder, profiler
+
+# Solo parser e traduttore vengono importati all'avvio: matplotlib e la pipeline di caricamento
+# sono importati dai comandi che li usano, così la CLI funziona anche senza display.
+
+
+def command_validate(args):
+    """Valida uno o più file G-code in streaming e stampa ogni errore trovato."""
+    total_errors = 0
+    for program_path in args.programs:
+        with open(program_path, 'r') as file:
+            for line_num, line in iter_gcode_errors(file):
+                print(f"{program_path}:{line_num}: L'istruzione '{line}' non è valida.")
+                total_errors += 1
+                if args.max_errors and total_errors >= args.max_errors:
+                    return 1
+    return 1 if total_errors else 0
+
+
+def command_translate(args):
+    """Traduce un file G-code in uno sketch Arduino."""
+    arduino_file_path = translate_gcode_file(args.program, args.output, args.mode)
+    print(f"Programma tradotto e salvato in {arduino_file_path}")
+    return 0
+
+
+def command_simulate(args):
+    """Calcola il percorso utensile e il tempo ciclo; opzionalmente lo salva come immagine (png, svg, pdf) o CSV."""
+    from toolpath import compute_toolpath
+
+    program = parse_gcode_file(args.program)
+    toolpath = compute_toolpath(program, limits=machine_limits(args))
+    print(f"{len(toolpath)} segmenti, tempo ciclo stimato {toolpath.total_time:.2f}s")
+    if args.output is None:
+        return 0
+    if args.output.lower().endswith('.csv'):
+        write_toolpath_csv(toolpath.iter_segments(), args.output)
+    else:
+        save_toolpath_image(toolpath, args.output)
+    print(f"Percorso utensile salvato in {args.output}")
+    return 0
+
+
+def machine_limits(args):
+    """Limiti della macchina per il pianificatore: quelli predefiniti, sovrascritti dalle opzioni indicate."""
+    from motion_planner import DEFAULT_LIMITS
+
+    overrides = {field: getattr(args, field) for field in DEFAULT_LIMITS._fields if getattr(args, field) is not None}
+    if overrides.get('lookahead') == 0:
+        overrides['lookahead'] = None
+    return DEFAULT_LIMITS._replace(**overrides)
+
+
+def write_toolpath_csv(segments, output_path):
+    """Scrive i segmenti del percorso utensile in formato CSV."""
+    import csv
+
+    with open(output_path, 'w', newline='') as output_file:
+        writer = csv.writer(output_file)
+        writer.writerow(['opcode', 'x0', 'y0', 'x1', 'y1', 'duration'])
+        writer.writerows(segments)
+
+
+def save_toolpath_image(toolpath, output_path):
+    """Disegna il percorso utensile con il backend Agg, senza Tk, decimato alla risoluzione dell'immagine."""
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from gcode_parser import OP_G0, OP_G1
+
+    figure = Figure(figsize=(5, 5), dpi=100)
+    FigureCanvasAgg(figure)
+    ax = figure.add_subplot(111)
+    ax.set_xlabel("X")
+    ax.set_ylabel("Y")
+    xmin, xmax, ymin, ymax = toolpath.bounds()
+    margin = max(xmax - xmin, ymax - ymin, 1) * 0.05
+    view = (xmin - margin, xmax + margin, ymin - margin, ymax + margin)
+    ax.set_xlim(view[:2])
+    ax.set_ylim(view[2:])
+    size = (ax.bbox.width, ax.bbox.height)
+    for opcode, style in ((OP_G0, 'ro-'), (OP_G1, 'bo-')):
+        ax.plot(*toolpath.polyline(opcode, len(toolpath), view=view, size=size), style)
+    figure.savefig(output_path)
+
+
+def command_upload(args):
+    """Traduce, compila e carica un programma, stampando l'avanzamento di arduino-cli."""
+    from upload_pipeline import UploadJob, DEFAULT_FQBN, DEFAULT_PORT
+
+    return follow_job(UploadJob(args.program, args.mode, args.fqbn or DEFAULT_FQBN, args.port or DEFAULT_PORT))
+
+
+def command_stream(args):
+    """Invia un programma al firmware di streaming, senza compilare né caricare uno sketch."""
+    from serial_sender import StreamJob, DEFAULT_PORT
+
+    job = StreamJob(args.program, args.port or DEFAULT_PORT, args.baudrate, args.flow, ack_timeout=args.ack_timeout)
+    return follow_job(job)
+
+
+def command_firmware(args):
+    """Scrive, compila e carica il firmware di streaming (da fare una sola volta per scheda)."""
+    from serial_sender import write_streaming_firmware
+    from upload_pipeline import UploadJob, DEFAULT_FQBN, DEFAULT_PORT
+
+    sketch_path = write_streaming_firmware()
+    print(f"Firmware di streaming salvato in {sketch_path}")
+    return follow_job(UploadJob(sketch_path, fqbn=args.fqbn or DEFAULT_FQBN, port=args.port or DEFAULT_PORT))
+
+
+def follow_job(job):
+    """Esegue un lavoro di caricamento o di streaming stampandone gli eventi fino alla fine."""
+    from upload_pipeline import submit_upload
+
+    submit_upload(job)
+    while True:
+        kind, message = job.events.get()
+        if kind == 'done':
+            return 0 if message else 1
+        print(message, file=sys.stderr if kind == 'error' else sys.stdout, flush=True)
+
+
+def command_devices(args):
+    """Elenca le macchine registrate, dopo averne eventualmente aggiunta o rimossa una."""
+    from device_registry import Device, load_devices, add_device, remove_device, DEVICES_PATH
+    from upload_pipeline import DEFAULT_FQBN
+
+    registry_path = args.registry or DEVICES_PATH
+    if args.add:
+        name, port = args.add
+        devices = add_device(Device(name, port, args.fqbn or DEFAULT_FQBN, args.baudrate), registry_path)
+    elif args.remove:
+        devices = remove_device(args.remove, registry_path)
+    else:
+        devices = load_devices(registry_path)
+    for device in devices:
+        print(f"{device.name}: porta {device.port}, scheda {device.fqbn}, {device.baudrate} baud")
+    return 0
+
+
+def command_dispatch(args):
+    """Distribuisce i programmi sulle macchine indicate (MACCHINA=PROGRAMMA) e segue i lavori fino alla fine."""
+    import queue
+    from device_registry import load_devices, DEVICES_PATH
+    from job_scheduler import JobScheduler, JOB_STREAM, JOB_UPLOAD, STATUS_DONE
+
+    scheduler = JobScheduler(load_devices(args.registry or DEVICES_PATH), max_retries=args.retries)
+    # Si controllano tutte le assegnazioni prima di accodarne una: un errore non lascia lavori avviati a metà
+    assignments = []
+    for assignment in args.assignments:
+        device_name, separator, program_path = assignment.partition('=')
+        if not separator:
+            print(f"Errore: assegnazione non valida '{assignment}', usa MACCHINA=PROGRAMMA", file=sys.stderr)
+            return 1
+        if device_name not in scheduler.devices:
+            print(f"Errore: macchina sconosciuta '{device_name}' in '{assignment}'", file=sys.stderr)
+            return 1
+        assignments.append((device_name, program_path))
+    jobs = [scheduler.submit(device_name, JOB_STREAM if args.stream else JOB_UPLOAD, program_path, args.mode)
+            for device_name, program_path in assignments]
+
+    while scheduler.pending() or not scheduler.events.empty():
+        try:
+            job, kind, message = scheduler.events.get(timeout=0.5)
+        except queue.Empty:
+            continue
+        print(f"[{job.device.name}] {message}", file=sys.stderr if kind == 'error' else sys.stdout, flush=True)
+    scheduler.shutdown()
+    print(scheduler.describe_status())
+    return 0 if all(job.status == STATUS_DONE for job in jobs) else 1
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="cli.py", description="Strumenti G-code per il tornio CNC senza interfaccia grafica.")
+    parser.add_argument('--trace', metavar='FILE', default=None,
+                        help="salva i tempi delle fasi come traccia JSON (chrome://tracing, Perfetto)")
+    parser.add_argument('--profile', metavar='FILE', default=None,
+                        help="esegue il comando sotto cProfile e salva le statistiche (pstats)")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    validate_parser = subparsers.add_parser('validate', help="valida uno o più file G-code")
+    validate_parser.add_argument('programs', nargs='+', help="file .gcode da validare")
+    validate_parser.add_argument('--max-errors', type=int, default=0, help="interrompe dopo N errori (0 = nessun limite)")
+    validate_parser.set_defaults(handler=command_validate)
+
+    translate_parser = subparsers.add_parser('translate', help="traduce un file G-code in uno sketch Arduino")
+    translate_parser.add_argument('program', help="file .gcode da tradurre")
+    translate_parser.add_argument('-o', '--output', default=None, help="percorso del file .ino (predefinito: accanto al programma)")
+    translate_parser.add_argument('--mode', choices=TRANSLATION_MODES, default=MODE_UNROLLED, help="modalità di traduzione")
+    translate_parser.set_defaults(handler=command_translate)
+
+    simulate_parser = subparsers.add_parser('simulate', help="stima il tempo ciclo e salva il percorso utensile su file")
+    simulate_parser.add_argument('program', help="file .gcode da simulare")
+    simulate_parser.add_argument('-o', '--output', default=None, help="file di uscita (.png, .svg, .pdf o .csv)")
+    simulate_parser.add_argument('--acceleration', type=float, default=None, help="accelerazione massima (mm/s²)")
+    simulate_parser.add_argument('--junction-deviation', type=float, default=None, help="deviazione ammessa agli spigoli (mm)")
+    simulate_parser.add_argument('--rapid-rate', type=float, default=None, help="velocità dei rapidi G0 (mm/s)")
+    simulate_parser.add_argument('--max-feed-rate', type=float, default=None, help="avanzamento massimo e predefinito dei G1 (mm/s)")
+    simulate_parser.add_argument('--arc-tolerance', type=float, default=None, help="errore di corda massimo degli archi (mm)")
+    simulate_parser.add_argument('--lookahead', type=int, default=None, help="movimenti nel buffer del pianificatore (0 = illimitato)")
+    simulate_parser.set_defaults(handler=command_simulate)
+
+    upload_parser = subparsers.add_parser('upload', help="traduce, compila e carica un programma su Arduino")
+    upload_parser.add_argument('program', help="file .gcode o .ino da caricare")
+    upload_parser.add_argument('--mode', choices=TRANSLATION_MODES, default=MODE_UNROLLED, help="modalità di traduzione")
+    upload_parser.add_argument('--fqbn', default=None, help="scheda di destinazione (predefinita: arduino:avr:uno)")
+    upload_parser.add_argument('--port', default=None, help="porta seriale della scheda (predefinita: COM3)")
+    upload_parser.set_defaults(handler=command_upload)
+
+    stream_parser = subparsers.add_parser('stream', help="invia un programma in streaming al firmware interprete")
+    stream_parser.add_argument('program', help="file .gcode da inviare")
+    stream_parser.add_argument('--port', default=None, help="porta seriale della scheda (predefinita: COM3)")
+    stream_parser.add_argument('--baudrate', type=int, default=115200, help="velocità della porta seriale")
+    stream_parser.add_argument('--flow', choices=('count', 'ack'), default='count',
+                               help="controllo di flusso: conteggio dei caratteri o conferma di ogni riga")
+    stream_parser.add_argument('--ack-timeout', type=float, default=30.0,
+                               help="secondi senza risposte dopo i quali il dispositivo è considerato scollegato")
+    stream_parser.set_defaults(handler=command_stream)
+
+    firmware_parser = subparsers.add_parser('firmware', help="compila e carica il firmware interprete per lo streaming")
+    firmware_parser.add_argument('--fqbn', default=None, help="scheda di destinazione (predefinita: arduino:avr:uno)")
+    firmware_parser.add_argument('--port', default=None, help="porta seriale della scheda (predefinita: COM3)")
+    firmware_parser.set_defaults(handler=command_firmware)
+
+    devices_parser = subparsers.add_parser('devices', help="elenca, aggiunge o rimuove le macchine registrate")
+    devices_parser.add_argument('--add', nargs=2, metavar=('NOME', 'PORTA'), help="registra una macchina")
+    devices_parser.add_argument('--fqbn', default=None, help="scheda della macchina da aggiungere (predefinita: arduino:avr:uno)")
+    devices_parser.add_argument('--baudrate', type=int, default=115200, help="velocità della macchina da aggiungere")
+    devices_parser.add_argument('--remove', metavar='NOME', default=None, help="rimuove una macchina")
+    devices_parser.add_argument('--registry', default=None, help="file del registro (predefinito: devices.json)")
+    devices_parser.set_defaults(handler=command_devices)
+
+    dispatch_parser = subparsers.add_parser('dispatch', help="carica o invia programmi su più macchine in parallelo")
+    dispatch_parser.add_argument('assignments', nargs='+', metavar='MACCHINA=PROGRAMMA', help="programma da eseguire su ogni macchina")
+    dispatch_parser.add_argument('--stream', action='store_true', help="invia in streaming invece di compilare e caricare")
+    dispatch_parser.add_argument('--mode', choices=TRANSLATION_MODES, default=MODE_UNROLLED, help="modalità di traduzione")
+    dispatch_parser.add_argument('--retries', type=int, default=2, help="tentativi aggiuntivi per ogni lavoro fallito")
+    dispatch_parser.add_argument('--registry', default=None, help="file del registro (predefinito: devices.json)")
+    dispatch_parser.set_defaults(handler=command_dispatch)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.profile:
+        profiler.start()
+    try:
+        return args.handler(args)
+    except (OSError, ValueError) as e:
+        print(f"Errore: {e}", file=sys.stderr)
+        return 1
+    finally:
+        report_instrumentation(args)
+
+
+def report_instrumentation(args):
+    """Salva profilo e traccia richiesti, stampando su stderr le fasi misurate."""
+    for span in reversed(recorder.last_spans()):
+        print(f"[tempi] {span.name}: {span.duration:.3f}s", file=sys.stderr)
+    if args.profile:
+        print(profiler.stop(args.profile), file=sys.stderr)
+        print(f"Profilo salvato in {args.profile}", file=sys.stderr)
+    if args.trace:
+        print(f"Traccia salvata in {recorder.export_trace(args.trace)}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
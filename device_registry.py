@@ -0,0 +1,56 @@
+import json
+import os
+from collections import namedtuple
+from atomic_file import atomic_write
+from upload_pipeline import DEFAULT_FQBN, DEFAULT_PORT
+from serial_sender import DEFAULT_BAUDRATE
+
+DEVICES_PATH = os.path.join(os.path.dirname(__file__), 'devices.json')
+
+Device = namedtuple('Device', ('name', 'port', 'fqbn', 'baudrate'))
+
+# Senza configurazione c'è una sola macchina, con la porta e la scheda usate finora
+DEFAULT_DEVICES = (Device("Tornio 1", DEFAULT_PORT, DEFAULT_FQBN, DEFAULT_BAUDRATE),)
+
+
+def load_devices(path=DEVICES_PATH):
+    """Legge il registro delle macchine; se il file non esiste restituisce DEFAULT_DEVICES."""
+    try:
+        with open(path, 'r') as registry_file:
+            entries = json.load(registry_file)['devices']
+    except FileNotFoundError:
+        return list(DEFAULT_DEVICES)
+    except (ValueError, KeyError, TypeError) as e:
+        raise ValueError(f"Registro delle macchine non valido in {path}: {e}") from None
+
+    devices = []
+    for entry in entries:
+        if 'name' not in entry or 'port' not in entry:
+            raise ValueError(f"Registro delle macchine non valido in {path}: ogni macchina richiede name e port")
+        devices.append(Device(entry['name'], entry['port'], entry.get('fqbn', DEFAULT_FQBN),
+                              int(entry.get('baudrate', DEFAULT_BAUDRATE))))
+    names = [device.name for device in devices]
+    if len(set(names)) != len(names):
+        raise ValueError(f"Registro delle macchine non valido in {path}: nomi duplicati")
+    return devices
+
+
+def save_devices(devices, path=DEVICES_PATH):
+    """Scrive il registro in modo atomico, così un'interruzione non lo lascia a metà."""
+    with atomic_write(path) as registry_file:
+        json.dump({'devices': [device._asdict() for device in devices]}, registry_file, indent=2)
+
+
+def add_device(device, path=DEVICES_PATH):
+    """Aggiunge una macchina al registro, sostituendo quella con lo stesso nome."""
+    devices = [existing for existing in load_devices(path) if existing.name != device.name]
+    devices.append(device)
+    save_devices(devices, path)
+    return devices
+
+
+def remove_device(name, path=DEVICES_PATH):
+    """Rimuove una macchina dal registro."""
+    devices = [device for device in load_devices(path) if device.name != name]
+    save_devices(devices, path)
+    return devices
@@ -0,0 +1,149 @@
+import argparse
+import os
+import select
+import sys
+import threading
+import time
+from collections import deque
+from serial_sender import RX_BUFFER_SIZE, COMMAND_QUEUE_LENGTH, LINE_LENGTH, command_duration
+
+
+class FakeDevice:
+    """Imitazione del firmware di streaming su uno pseudo-terminale, per provare il sender senza una scheda.
+
+    Riproduce i limiti della scheda reale: un buffer di ricezione di rx_buffer_size byte (i byte in eccesso
+    vanno persi e vengono contati in overflow_bytes), una coda di comandi e l'esecuzione bloccante, accelerata
+    di time_scale. Il sender si collega al percorso port come a una porta seriale.
+    """
+
+    def __init__(self, rx_buffer_size=RX_BUFFER_SIZE, queue_length=COMMAND_QUEUE_LENGTH, time_scale=0.0):
+        import pty
+        import tty
+
+        self.rx_buffer_size = rx_buffer_size
+        self.queue_length = queue_length
+        self.time_scale = time_scale
+        self.master, self._slave = pty.openpty()
+        tty.setraw(self._slave)
+        self.port = os.ttyname(self._slave)
+        self.executed = []
+        self.rejected = []
+        self.overflow_bytes = 0
+        self._rx = bytearray()
+        self._commands = deque()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def receive(self, timeout):
+        """Trasferisce nel buffer di ricezione i byte arrivati, scartando quelli che non ci stanno."""
+        ready, _, _ = select.select([self.master], [], [], timeout)
+        if not ready:
+            return
+        try:
+            data = os.read(self.master, 4096)
+        except OSError:
+            return
+        room = self.rx_buffer_size - len(self._rx)
+        self._rx += data[:room]
+        self.overflow_bytes += max(0, len(data) - room)
+
+    def parse_lines(self):
+        """Sposta le righe complete dal buffer di ricezione alla coda dei comandi, rispondendo come il firmware."""
+        while len(self._commands) < self.queue_length and b'\n' in self._rx:
+            line, _, rest = bytes(self._rx).partition(b'\n')
+            self._rx = bytearray(rest)
+            text = line.decode('ascii', errors='replace').strip()[:LINE_LENGTH - 1]
+            if not text:
+                self.respond("ok")
+                continue
+            command = parse_command(text)
+            if command is None:
+                self.rejected.append(text)
+                self.respond("error")
+            else:
+                self._commands.append(command)
+                self.respond("ok")
+
+    def respond(self, message):
+        os.write(self.master, f"{message}\r\n".encode('ascii'))
+
+    def step(self, timeout=0.05):
+        """Un giro del loop() del firmware: ricezione, parsing ed esecuzione di un comando."""
+        self.receive(0 if self._commands else timeout)
+        self.parse_lines()
+        if self._commands:
+            code, args = self._commands.popleft()
+            if self.time_scale:
+                time.sleep(command_duration(code, args) * self.time_scale)
+            self.executed.append((code, args))
+
+    def serve(self):
+        while not self._stop.is_set():
+            self.step()
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        os.close(self.master)
+        os.close(self._slave)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def parse_command(text):
+    """Interpreta una riga come parseLine() del firmware; restituisce (codice, argomenti) o None."""
+    values = {}
+    for word in text.split():
+        letter, number = word[0], word[1:]
+        try:
+            values[letter] = int(number)
+        except ValueError:
+            return None
+        if letter not in 'GXYZ':
+            return None
+    g = values.get('G')
+    if g == 1 and all(letter in values for letter in 'XYZ'):
+        return 1, (values['X'], values['Y'], values['Z'])
+    if g in (2, 3) and 'X' in values and 'Y' in values:
+        return g, (values['X'], values['Y'], 0)
+    return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="fake_device.py",
+                                     description="Dispositivo finto su pseudo-terminale che imita il firmware di streaming.")
+    parser.add_argument('--time-scale', type=float, default=0.0, help="frazione della durata reale dei comandi (0 = istantanei)")
+    parser.add_argument('--rx-buffer', type=int, default=RX_BUFFER_SIZE, help="dimensione del buffer di ricezione")
+    args = parser.parse_args(argv)
+
+    device = FakeDevice(args.rx_buffer, time_scale=args.time_scale)
+    print(device.port, flush=True)
+    executed = 0
+    try:
+        device.start()
+        while True:
+            time.sleep(0.5)
+            for code, command_args in device.executed[executed:]:
+                print(f"G{code} {' '.join(str(arg) for arg in command_args)}", flush=True)
+            executed = len(device.executed)
+            if device.overflow_bytes:
+                print(f"overflow: {device.overflow_bytes} byte persi", file=sys.stderr, flush=True)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        device.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
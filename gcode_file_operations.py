@@ -1,15 +1,95 @@
 import os
-import re
+import queue
+import threading
 import tkinter as tk
-from tkinter import ttk
+from tkinter import ttk, filedialog
+from gcode_parser import iter_gcode_errors
+from program_loader import MappedProgram, write_program
+from gcode_view import LiveValidator
+from simulation_operations import stop_frames, close_mapped_program
+from instrumentation import span, profiler
+
+EDITOR_CHUNK_LINES = 10000
+# Oltre questa dimensione il widget Text di Tk diventa lentissimo e occupa molte volte il file in memoria:
+# i programmi più grandi si aprono nel simulatore, e si modificano con un editor di testo esterno
+EDITOR_MAX_BYTES = 8 << 20
+LIBRARY_POLL_INTERVAL_MS = 2000
+SAVE_POLL_INTERVAL_MS = 50
 
 def load_existing_programs(app):
-    """Carica i programmi G-code dalla cartella corrente."""
-    current_dir = os.path.dirname(__file__)
-    for file_name in os.listdir(current_dir):
-        if file_name.endswith('.gcode'):
-            file_path = os.path.join(current_dir, file_name)
-            app.program_listbox.insert(tk.END, file_path)
+    """Carica nella lista i programmi della libreria che corrispondono alla ricerca, senza riscansionare le cartelle."""
+    if not app.program_listbox.winfo_exists():
+        return
+    app.program_paths = app.program_library.search(app.search_var.get())
+    show_program_paths(app)
+
+def show_program_paths(app):
+    """Riempie la lista con i risultati dell'ultima ricerca già in memoria, senza interrogare l'indice."""
+    app.program_listbox.delete(0, tk.END)
+    app.program_listbox.insert(tk.END, *app.program_paths)
+
+def add_program_path(app, program_path):
+    """Inserisce nella lista un programma appena salvato, se manca e corrisponde alla ricerca.
+
+    Rispetta l'ordine di ProgramLibrary.search (nome, poi percorso), così la lista resta quella
+    che darebbe un ricaricamento completo.
+    """
+    program_path = os.path.abspath(program_path)
+    name = os.path.basename(program_path)
+    if program_path in app.program_paths or app.search_var.get().lower() not in name.lower():
+        return
+    row = next((row for row, path in enumerate(app.program_paths)
+                if (os.path.basename(path), path) > (name, program_path)), len(app.program_paths))
+    app.program_paths.insert(row, program_path)
+    if app.program_listbox.winfo_exists():
+        app.program_listbox.insert(row, program_path)
+
+def poll_program_library(app):
+    """Aggiorna periodicamente l'indice in background e ricarica la lista solo se è cambiata."""
+    if app.library_worker is None or not app.library_worker.is_alive():
+        if app.library_changed.is_set():
+            app.library_changed.clear()
+            load_existing_programs(app)
+        app.library_worker = threading.Thread(target=sync_program_library,
+                                              args=(app.program_library, app.library_changed), daemon=True)
+        app.library_worker.start()
+    app.root.after(LIBRARY_POLL_INTERVAL_MS, lambda: poll_program_library(app))
+
+def sync_program_library(library, changed):
+    """Allinea l'indice alle cartelle e analizza i programmi nuovi o modificati (gira fuori dal thread di Tk)."""
+    with profiler.profiled():
+        if library.sync():
+            changed.set()
+        for program_path in library.pending_analysis():
+            library.analyze(program_path)
+
+def add_library_directory(app):
+    """Aggiunge una cartella alla libreria dei programmi."""
+    directory = filedialog.askdirectory(title="Cartella dei programmi G-code")
+    if not directory:
+        return
+    app.program_library.add_directory(directory)
+    app.program_library.sync()
+    load_existing_programs(app)
+    app.show_message(f"Cartella {directory} aggiunta alla libreria", "info")
+
+def show_program_info(app):
+    """Mostra i dati indicizzati del programma selezionato."""
+    selected_program_index = app.program_listbox.curselection()
+    if len(selected_program_index) != 1:
+        return
+    info = app.program_library.info(app.program_listbox.get(selected_program_index[0]))
+    if info is None:
+        return
+    if info['analyzed_mtime_ns'] != info['mtime_ns']:
+        app.show_message(f"{info['name']}: {info['size']} byte, analisi in corso...", "info")
+        return
+    if info['analysis_error'] is not None:
+        app.show_message(f"{info['name']}: analisi non riuscita: {info['analysis_error']}", "error")
+        return
+    app.show_message(f"{info['name']}: {info['line_count']} righe, "
+                     f"X {info['xmin']:g}..{info['xmax']:g}, Y {info['ymin']:g}..{info['ymax']:g}, "
+                     f"tempo ciclo stimato {info['cycle_time']:.1f}s", "info")
 
 def create_new_program(app):
     """Mostra i campi per la creazione di un nuovo programma."""
@@ -26,6 +106,7 @@ def show_new_program_form(app):
     ttk.Label(app.left_frame, text="Istruzioni G-code:").pack(pady=10)
     app.gcode_text = tk.Text(app.left_frame, width=40, height=10)
     app.gcode_text.pack(pady=10)
+    app.gcode_validator = LiveValidator(app.gcode_text, lambda count, first: report_validation(app, count, first))
 
     app.save_button = ttk.Button(app.left_frame, text="Salva Programma", command=app.save_new_program)
     app.save_button.pack(pady=10)
@@ -42,14 +123,20 @@ def edit_selected_program(app):
         app.show_message("Errore: Nessun programma selezionato", "error")
         return
 
-    program_path = app.program_listbox.get(selected_program_index)
+    program_path = app.program_listbox.get(selected_program_index[0])
     if program_path.endswith('.gcode'):
         edit_program(app, program_path)
     else:
         app.show_message("Errore: Seleziona un file G-code", "error")
 
 def edit_program(app, program_path):
-    """Mostra il form per modificare un programma esistente."""
+    """Mostra il form per modificare un programma esistente, se non è troppo grande per l'editor."""
+    size = os.path.getsize(program_path)
+    if size > EDITOR_MAX_BYTES:
+        app.show_message(f"Errore: {os.path.basename(program_path)} ({size / (1 << 20):.0f} MB) è troppo grande "
+                         f"per l'editor (massimo {EDITOR_MAX_BYTES >> 20} MB): modificalo con un editor di testo.",
+                         "error")
+        return
     app.clear_left_frame()
     show_edit_program_form(app, program_path)
     app.hide_graph()
@@ -58,12 +145,16 @@ def show_edit_program_form(app, program_path):
     """Mostra il form per modificare un programma esistente."""
     ttk.Label(app.left_frame, text=f"Modifica Programma: {os.path.basename(program_path)}").pack(pady=10)
 
-    with open(program_path, 'r') as file:
-        gcode_instructions = file.read()
-
     app.gcode_text = tk.Text(app.left_frame, width=40, height=10)
-    app.gcode_text.insert(tk.END, gcode_instructions)
+    # Il testo arriva dal file mappato a blocchi di righe, senza copiarlo tutto nell'heap di Python;
+    # il file viene validato una volta sola qui, poi il validatore ricontrolla solo le righe modificate
+    with span('editor.load', 'ui', path=program_path), MappedProgram(program_path) as program:
+        for start in range(0, len(program), EDITOR_CHUNK_LINES):
+            app.gcode_text.insert(tk.END, program.text(start, start + EDITOR_CHUNK_LINES).replace("\r\n", "\n"))
+        invalid_lines = [line_num for line_num, line in iter_gcode_errors(program.iter_lines())]
     app.gcode_text.pack(pady=10)
+    app.gcode_validator = LiveValidator(app.gcode_text, lambda count, first: report_validation(app, count, first))
+    app.gcode_validator.mark_invalid(invalid_lines)
 
     app.save_button = ttk.Button(app.left_frame, text="Salva Modifiche", command=lambda: save_edited_program(app, program_path))
     app.save_button.pack(pady=10)
@@ -71,68 +162,114 @@ def show_edit_program_form(app, program_path):
     app.cancel_button = ttk.Button(app.left_frame, text="Annulla", command=app.cancel_new_program)
     app.cancel_button.pack(pady=10)
 
-    app.show_message("Modifica le istruzioni G-code e premi 'Salva Modifiche'.")
+    if invalid_lines:
+        report_validation(app, len(invalid_lines), invalid_lines[0])
+    else:
+        app.show_message("Modifica le istruzioni G-code e premi 'Salva Modifiche'.")
 
 def save_new_program(app):
     """Salva un nuovo programma G-code."""
     program_name = app.program_name_entry.get()
-    gcode_instructions = app.gcode_text.get("1.0", tk.END).strip()
+    chunks = read_editor_chunks(app.gcode_text)
 
-    if not program_name or not gcode_instructions:
+    if not program_name or chunks is None:
         app.show_message("Errore: Nome del programma e istruzioni G-code non possono essere vuoti.", "error")
         return
 
-    valid, error_message = validate_gcode(gcode_instructions)
-    if not valid:
-        app.show_message(f"Errore: {error_message}", "error")
+    errors = app.gcode_validator.errors()
+    if errors:
+        app.show_message(f"Errore: {describe_gcode_errors(errors)}", "error")
         return
 
     gcode_file_path = os.path.join(os.path.dirname(__file__), f"{program_name}.gcode")
-    with open(gcode_file_path, 'w') as gcode_file:
-        gcode_file.write(gcode_instructions)
-
-    app.initialize_left_frame()
-    app.load_existing_programs()
-    app.program_listbox.insert(tk.END, gcode_file_path)
-    app.show_message(f"Nuovo programma creato in {gcode_file_path}", "info")
-    app.show_graph()
+    start_program_save(app, gcode_file_path, chunks, f"Nuovo programma creato in {gcode_file_path}")
 
 def save_edited_program(app, program_path):
     """Salva le modifiche a un programma G-code esistente."""
-    gcode_instructions = app.gcode_text.get("1.0", tk.END).strip()
+    chunks = read_editor_chunks(app.gcode_text)
 
-    if not gcode_instructions:
+    if chunks is None:
         app.show_message("Errore: Le istruzioni G-code non possono essere vuote.", "error")
         return
 
-    valid, error_message = validate_gcode(gcode_instructions)
-    if not valid:
-        app.show_message(f"Errore: {error_message}", "error")
+    errors = app.gcode_validator.errors()
+    if errors:
+        app.show_message(f"Errore: {describe_gcode_errors(errors)}", "error")
         return
 
-    with open(program_path, 'w') as gcode_file:
-        gcode_file.write(gcode_instructions)
+    start_program_save(app, program_path, chunks, f"Modifiche salvate in {program_path}")
+
+def read_editor_chunks(text_widget):
+    """Testo dell'editor senza spazi iniziali e finali, a blocchi di EDITOR_CHUNK_LINES righe; None se è vuoto."""
+    start = text_widget.search(r'\S', "1.0", tk.END, regexp=True)
+    if not start:
+        return None
+    end = text_widget.index(text_widget.search(r'\S', tk.END, "1.0", backwards=True, regexp=True) + " +1c")
+    first_line, last_line = int(start.split('.')[0]), int(end.split('.')[0])
+    bounds = [start] + [f"{line}.0" for line in range(first_line + EDITOR_CHUNK_LINES, last_line + 1,
+                                                          EDITOR_CHUNK_LINES)] + [end]
+    return [text_widget.get(chunk_start, chunk_end) for chunk_start, chunk_end in zip(bounds, bounds[1:])]
+
+def start_program_save(app, program_path, chunks, message):
+    """Scrive il programma in un thread e, a scrittura completata, torna alla lista dei programmi."""
+    app.save_button.config(state=tk.DISABLED)
+    app.cancel_button.config(state=tk.DISABLED)
+    app.show_message("Salvataggio in corso...", "info")
+    result = queue.Queue()
+    threading.Thread(target=save_program_file, args=(app.program_library, program_path, chunks, result),
+                     name="program-save").start()
+    poll_program_save(app, program_path, result, message)
+
+def save_program_file(library, program_path, chunks, result):
+    """Scrittura atomica e aggiornamento dell'indice (gira fuori dal thread di Tk); l'esito va su result."""
+    try:
+        with profiler.profiled():
+            write_program(program_path, chunks)
+            library.update_file(program_path)
+    except Exception as e:
+        result.put(e)
+    else:
+        result.put(None)
+
+def poll_program_save(app, program_path, result, message):
+    """Attende l'esito del salvataggio; la lista viene aggiornata solo per il programma salvato."""
+    try:
+        error = result.get_nowait()
+    except queue.Empty:
+        app.root.after(SAVE_POLL_INTERVAL_MS, lambda: poll_program_save(app, program_path, result, message))
+        return
+    if error is not None:
+        app.save_button.config(state=tk.NORMAL)
+        app.cancel_button.config(state=tk.NORMAL)
+        app.show_message(f"Errore: Impossibile salvare il programma: {error}", "error")
+        return
 
     app.initialize_left_frame()
-    app.load_existing_programs()
-    app.show_message(f"Modifiche salvate in {program_path}", "info")
+    show_program_paths(app)
+    add_program_path(app, program_path)
+    app.show_message(message, "info")
     app.show_graph()
 
-def validate_gcode(gcode):
-    """Valida le istruzioni G-code."""
-    valid_commands = {"G0", "G1", "G2", "G3", "G4", "G17", "G18", "G19", "G20", "G21", "G28", "G30", "G90", "G91", "G92", "G00", "G01", "M30"}
-    for line_num, line in enumerate(gcode.splitlines(), start=1):
-        line = line.strip()
-        if not line:
-            continue
-        match = re.match(r'^(G\d+|M\d+)', line)
-        if match and match.group(1) in valid_commands:
-            continue
-        return False, f"L'istruzione '{line}' alla linea {line_num} non è valida."
-    return True, ""
+def describe_gcode_errors(errors):
+    """Descrive il primo errore di validazione e quanti altri ne sono stati trovati."""
+    line_num, line = errors[0]
+    message = f"L'istruzione '{line}' alla linea {line_num} non è valida."
+    if len(errors) > 1:
+        message += f" (altri {len(errors) - 1} errori)"
+    return message
+
+def report_validation(app, error_count, first_line):
+    """Riporta nella barra dei messaggi l'esito dell'ultima validazione incrementale dell'editor."""
+    if not error_count:
+        app.show_message("Istruzioni G-code valide.", "info")
+        return
+    others = f" (altre {error_count - 1} righe non valide)" if error_count > 1 else ""
+    app.show_message(f"Errore: la riga {first_line} non è valida{others}", "error")
 
 def cancel_new_program(app):
     """Annulla la creazione o modifica di un programma."""
+    stop_frames(app)
+    close_mapped_program(app)
     app.initialize_left_frame()
     app.load_existing_programs()
     app.show_graph()
\ No newline at end of file
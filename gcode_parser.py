@@ -0,0 +1,186 @@
+import math
+import re
+from array import array
+from collections import namedtuple
+from instrumentation import span, count
+
+VALID_COMMANDS = {"G0", "G1", "G2", "G3", "G4", "G17", "G18", "G19", "G20", "G21", "G28", "G30", "G90", "G91", "G92", "G00", "G01", "M30"}
+
+# Codici operativi: i comandi G mantengono il loro numero, i comandi M sono spostati di 1000
+OP_G0 = 0
+OP_G1 = 1
+OP_G2 = 2
+OP_G3 = 3
+OP_G4 = 4
+OP_G20 = 20
+OP_G21 = 21
+OP_G28 = 28
+OP_G90 = 90
+OP_G91 = 91
+OP_G92 = 92
+OP_M30 = 1030
+
+MISSING = math.nan
+MAX_EXACT_INTEGER = 2 ** 53
+FIELDS = ("X", "Y", "Z", "F", "I", "J", "R", "P")
+
+Instruction = namedtuple('Instruction', ('opcode', 'line_number', 'x', 'y', 'z', 'f', 'i', 'j', 'r', 'p'))
+
+_COMMAND_RE = re.compile(r'^(G\d+|M\d+)')
+_WORD_RE = re.compile(r'([A-Z])([-+]?(?:\d+\.?\d*|\.\d+))')
+# Commenti tra parentesi (anche non chiuse) e da ';' a fine riga
+_COMMENT_RE = re.compile(r'\([^)]*\)?|;.*')
+# Un esponente come X1e3 non è G-code: letto come X1 sposterebbe la macchina di mille volte meno
+_EXPONENT_RE = re.compile(r'[\d.][eE][-+]?\d')
+
+
+def has_value(value):
+    """Indica se un campo del programma compilato è presente (non NaN)."""
+    return value == value
+
+
+def format_number(value):
+    """Formatta un valore numerico senza zeri decimali superflui e senza perdere cifre.
+
+    I valori interi diventano letterali interi; gli altri usano repr, che rilegge esattamente lo stesso double.
+    """
+    if value.is_integer() and abs(value) < MAX_EXACT_INTEGER:
+        return str(int(value))
+    return repr(value)
+
+
+def command_opcode(command):
+    """Converte un comando testuale (es. 'G01', 'M30') nel suo codice operativo."""
+    number = int(command[1:])
+    return number + 1000 if command[0] == 'M' else number
+
+
+class GCodeProgram:
+    """Programma G-code compilato: un array compatto per ciascun campo delle istruzioni."""
+
+    def __init__(self):
+        self.opcodes = array('i')
+        self.line_numbers = array('l')
+        self.x = array('d')
+        self.y = array('d')
+        self.z = array('d')
+        self.f = array('d')
+        self.i = array('d')
+        self.j = array('d')
+        self.r = array('d')
+        self.p = array('d')
+        self.errors = []
+
+    def __len__(self):
+        return len(self.opcodes)
+
+    def append_instruction(self, instruction):
+        """Aggiunge al programma un'Instruction già compilata."""
+        self.opcodes.append(instruction.opcode)
+        self.line_numbers.append(instruction.line_number)
+        self.x.append(instruction.x)
+        self.y.append(instruction.y)
+        self.z.append(instruction.z)
+        self.f.append(instruction.f)
+        self.i.append(instruction.i)
+        self.j.append(instruction.j)
+        self.r.append(instruction.r)
+        self.p.append(instruction.p)
+
+    def __iter__(self):
+        return map(Instruction, self.opcodes, self.line_numbers, self.x, self.y,
+                   self.z, self.f, self.i, self.j, self.r, self.p)
+
+
+def strip_comments(line):
+    """Toglie dalla riga i commenti, così le parole al loro interno non vengono lette come valori."""
+    if '(' in line or ';' in line:
+        line = _COMMENT_RE.sub(' ', line)
+    return line.strip()
+
+
+def has_exponent(line):
+    """Indica se la riga contiene un numero con esponente, che il G-code non ammette."""
+    return ('e' in line or 'E' in line) and _EXPONENT_RE.search(line) is not None
+
+
+def is_valid_line(line):
+    """Verifica che una riga inizi con un comando supportato; una riga di soli commenti è valida."""
+    line = strip_comments(line)
+    if not line:
+        return True
+    match = _COMMAND_RE.match(line)
+    return bool(match) and match.group(1) in VALID_COMMANDS and not has_exponent(line)
+
+
+def parse_line(line):
+    """Scompone una riga G-code senza commenti in (comando, parole); comando è None se la riga non è valida."""
+    match = _COMMAND_RE.match(line)
+    if not match or match.group(1) not in VALID_COMMANDS or has_exponent(line):
+        return None, None
+    words = {}
+    for letter, value in _WORD_RE.findall(line, match.end()):
+        if letter in FIELDS:
+            words[letter] = float(value)
+    return match.group(1), words
+
+
+def iter_instructions(lines, errors=None):
+    """Compila pigramente le righe G-code, producendo una Instruction per ogni riga valida.
+
+    Le righe non valide vengono saltate e, se errors è una lista, vi vengono aggiunte.
+    """
+    for line_num, line in enumerate(lines, start=1):
+        code = strip_comments(line)
+        if not code:
+            continue
+        command, words = parse_line(code)
+        if command is None:
+            if errors is not None:
+                errors.append((line_num, line.strip()))
+            continue
+        get = words.get
+        yield Instruction(command_opcode(command), line_num, get('X', MISSING), get('Y', MISSING),
+                          get('Z', MISSING), get('F', MISSING), get('I', MISSING),
+                          get('J', MISSING), get('R', MISSING), get('P', MISSING))
+
+
+def parse_gcode(lines):
+    """Compila in una sola passata un iterabile di righe G-code in un GCodeProgram."""
+    program = GCodeProgram()
+    with span('parse', 'gcode'):
+        for instruction in iter_instructions(lines, program.errors):
+            program.append_instruction(instruction)
+    count('lines_parsed', len(program))
+    return program
+
+
+def parse_gcode_file(program_path):
+    """Compila un file .gcode leggendolo riga per riga."""
+    with open(program_path, 'r') as file:
+        return parse_gcode(file)
+
+
+def iter_gcode_errors(lines):
+    """Scorre le righe una alla volta e produce (numero_linea, riga) per ogni istruzione non valida."""
+    for line_num, line in enumerate(lines, start=1):
+        line = line.strip()
+        if line and not is_valid_line(line):
+            yield line_num, line
+
+
+def validate_gcode_stream(lines, max_errors=None):
+    """Valida in streaming un iterabile di righe e restituisce tutti gli errori trovati (al più max_errors)."""
+    errors = []
+    with span('validate', 'gcode'):
+        for error in iter_gcode_errors(lines):
+            errors.append(error)
+            if max_errors is not None and len(errors) >= max_errors:
+                break
+    return errors
+
+
+def validate_gcode_file(program_path, max_errors=None):
+    """Valida un file .gcode senza caricarlo interamente in memoria."""
+    with open(program_path, 'r') as file:
+        return validate_gcode_stream(file, max_errors)
@@ -0,0 +1,368 @@
+import os
+from instrumentation import span
+from gcode_parser import GCodeProgram, parse_gcode, iter_instructions, has_value, format_number, OP_G1, OP_G2, OP_G3
+
+# Da incrementare ad ogni modifica dell'output generato: invalida la cache delle build
+TRANSLATOR_VERSION = 1
+
+WRITE_BUFFER_SIZE = 1 << 16
+
+MODE_UNROLLED = 'unrolled'
+MODE_PROGMEM = 'progmem'
+MODE_MOTION = 'motion'
+TRANSLATION_MODES = (MODE_UNROLLED, MODE_PROGMEM, MODE_MOTION)
+
+# Codici della tabella PROGMEM: un byte di codice seguito da argomenti int16 little endian
+TABLE_END = 0
+TABLE_BLINK = 1
+TABLE_PIN = 2
+TABLE_ANALOG_PIN = 3
+TABLE_BYTES_PER_ROW = 16
+
+# Modalità di movimento standard: coordinate in centesimi di mm, velocità in centesimi di mm/s
+MOTION_SCALE = 100
+MOTION_MAX_SPEED = 0xFFFF
+
+ARDUINO_FUNCTIONS = """
+// Dichiarazione delle funzioni
+void blink(int x, int y, int z);
+void turnOnPin(int pin, int duration);
+void turnOnAnalogPin(int pin, int duration);
+
+// Configurazione iniziale
+void setup() {
+  pinMode(13, OUTPUT);  // Pin per il controllo
+  Serial.begin(115200);  // Inizializza la comunicazione seriale
+}
+
+// Funzioni di utilità
+void blink(int x, int y, int z) {
+  int onTime = y * 1000;  // Converti in millisecondi
+  int offTime = z * 1000; // Converti in millisecondi
+
+  for (int i = 0; i < x; i++) {
+    digitalWrite(13, HIGH); // Accendi il pin
+    delay(onTime);          // Aspetta il tempo di accensione
+    digitalWrite(13, LOW);  // Spegni il pin
+    delay(offTime);         // Aspetta il tempo di spegnimento
+  }
+}
+
+void turnOnPin(int pin, int duration) {
+  pinMode(pin, OUTPUT);
+  digitalWrite(pin, HIGH);
+  delay(duration * 1000); // Converti in millisecondi
+  digitalWrite(pin, LOW);
+}
+
+void turnOnAnalogPin(int pin, int duration) {
+  pinMode(pin, OUTPUT);
+  analogWrite(pin, 255); // Imposta il valore analogico massimo
+  delay(duration * 1000); // Converti in millisecondi
+  analogWrite(pin, 0); // Spegni il pin analogico
+}
+"""
+
+ARDUINO_HEADER = ARDUINO_FUNCTIONS + """
+void loop() {
+"""
+
+ARDUINO_FOOTER = """
+}
+"""
+
+PROGMEM_TABLE_HEADER = """
+// Programma compattato: eseguito dall'interprete in loop()
+const uint8_t program[] PROGMEM = {
+"""
+
+PROGMEM_INTERPRETER = """};
+
+int readArgument(uint16_t &pc) {
+  uint16_t low = pgm_read_byte(&program[pc]);
+  uint16_t high = pgm_read_byte(&program[pc + 1]);
+  pc += 2;
+  return (int16_t)(low | (high << 8));
+}
+
+void loop() {
+  uint16_t pc = 0;
+  while (pc < sizeof(program)) {
+    uint8_t code = pgm_read_byte(&program[pc++]);
+    if (code == %d) {
+      return;
+    } else if (code == %d) {
+      int x = readArgument(pc);
+      int y = readArgument(pc);
+      int z = readArgument(pc);
+      blink(x, y, z);
+    } else if (code == %d) {
+      int pin = readArgument(pc);
+      int duration = readArgument(pc);
+      turnOnPin(pin, duration);
+    } else if (code == %d) {
+      int pin = readArgument(pc);
+      int duration = readArgument(pc);
+      turnOnAnalogPin(pin, duration);
+    }
+  }
+}
+""" % (TABLE_END, TABLE_BLINK, TABLE_PIN, TABLE_ANALOG_PIN)
+
+# Movimento standard: G0/G1 e archi G2/G3 (già convertiti in corde) diventano una tabella di segmenti
+# eseguiti da due motori passo-passo con i pin di uno shield CNC. La velocità di ogni segmento è quella
+# media calcolata dal pianificatore, così lo sketch rispetta accelerazioni e rallentamenti agli spigoli.
+# Una riga con velocità 0 è una sosta G4, e x ne indica la durata in millisecondi.
+MOTION_HEADER = """
+#define X_STEP_PIN 2
+#define Y_STEP_PIN 3
+#define X_DIR_PIN 5
+#define Y_DIR_PIN 6
+#define ENABLE_PIN 8
+#define STEPS_PER_MM 80.0
+#define MOTION_SCALE %d
+
+struct Segment {
+  long x;
+  long y;
+  unsigned int speed;
+};
+
+long positionX = lround(%d * STEPS_PER_MM / MOTION_SCALE);
+long positionY = lround(%d * STEPS_PER_MM / MOTION_SCALE);
+
+const Segment program[] PROGMEM = {
+"""
+
+MOTION_INTERPRETER = """};
+
+void setup() {
+  pinMode(X_STEP_PIN, OUTPUT);
+  pinMode(Y_STEP_PIN, OUTPUT);
+  pinMode(X_DIR_PIN, OUTPUT);
+  pinMode(Y_DIR_PIN, OUTPUT);
+  pinMode(ENABLE_PIN, OUTPUT);
+  digitalWrite(ENABLE_PIN, LOW);  // Abilita i driver
+}
+
+void pulse(int pin) {
+  digitalWrite(pin, HIGH);
+  delayMicroseconds(2);
+  digitalWrite(pin, LOW);
+}
+
+// delayMicroseconds è preciso solo fino a circa 16 ms: le attese più lunghe passano da delay
+void waitMicros(unsigned long duration) {
+  if (duration > 16000) {
+    delay(duration / 1000);
+    duration %= 1000;
+  }
+  delayMicroseconds(duration);
+}
+
+// Movimento lineare a velocità costante con l'algoritmo di Bresenham
+void moveTo(long x, long y, unsigned int speed) {
+  long targetX = lround(x * STEPS_PER_MM / MOTION_SCALE);
+  long targetY = lround(y * STEPS_PER_MM / MOTION_SCALE);
+  long deltaX = labs(targetX - positionX);
+  long deltaY = labs(targetY - positionY);
+  long steps = max(deltaX, deltaY);
+  if (steps == 0 || speed == 0) {
+    return;
+  }
+  digitalWrite(X_DIR_PIN, targetX >= positionX ? HIGH : LOW);
+  digitalWrite(Y_DIR_PIN, targetY >= positionY ? HIGH : LOW);
+  float length = sqrt((float)deltaX * deltaX + (float)deltaY * deltaY) / STEPS_PER_MM;
+  unsigned long stepInterval = length / ((float)speed / MOTION_SCALE) * 1000000.0 / steps;
+  long errorX = steps / 2;
+  long errorY = steps / 2;
+  for (long i = 0; i < steps; i++) {
+    errorX -= deltaX;
+    if (errorX < 0) {
+      errorX += steps;
+      pulse(X_STEP_PIN);
+    }
+    errorY -= deltaY;
+    if (errorY < 0) {
+      errorY += steps;
+      pulse(Y_STEP_PIN);
+    }
+    waitMicros(stepInterval);
+  }
+  positionX = targetX;
+  positionY = targetY;
+}
+
+void loop() {
+  // Il programma viene eseguito una sola volta: poi la macchina resta ferma
+  for (unsigned int i = 0; i < sizeof(program) / sizeof(Segment); i++) {
+    Segment segment;
+    memcpy_P(&segment, &program[i], sizeof(Segment));
+    if (segment.speed == 0) {
+      delay(segment.x);
+    } else {
+      moveTo(segment.x, segment.y, segment.speed);
+    }
+  }
+  while (true) {
+  }
+}
+"""
+
+
+def sketch_path_for(program_path):
+    """Restituisce il percorso del file .ino generato per un programma G-code."""
+    arduino_file_base = os.path.splitext(os.path.basename(program_path))[0]
+    arduino_dir = os.path.join(os.path.dirname(program_path), arduino_file_base)
+    return os.path.join(arduino_dir, f"{arduino_file_base}.ino")
+
+
+def iter_arduino_statements(instructions):
+    """Produce un'istruzione C++ per ogni Instruction G-code traducibile."""
+    for instruction in instructions:
+        opcode, x, y = instruction.opcode, instruction.x, instruction.y
+        if opcode == OP_G1:
+            z = instruction.z
+            if has_value(x) and has_value(y) and has_value(z):
+                yield f'  blink({format_number(x)}, {format_number(y)}, {format_number(z)});\n'
+        elif opcode == OP_G2:
+            if has_value(x) and has_value(y):
+                yield f'  turnOnPin({format_number(x)}, {format_number(y)});\n'
+        elif opcode == OP_G3:
+            if has_value(x) and has_value(y):
+                yield f'  turnOnAnalogPin({format_number(x)}, {format_number(y)});\n'
+
+
+def encode_argument(value, line_number):
+    """Codifica un argomento come int16 little endian, troncandolo come farebbe la conversione C++ a int."""
+    number = int(value)
+    if not -32768 <= number <= 32767:
+        raise ValueError(f"Il valore {format_number(value)} alla linea {line_number} non entra in un int a 16 bit")
+    return (number & 0xFF, (number >> 8) & 0xFF)
+
+
+def iter_table_records(instructions):
+    """Produce i record binari (tuple di byte) della tabella PROGMEM, terminati da TABLE_END."""
+    for instruction in instructions:
+        opcode, x, y = instruction.opcode, instruction.x, instruction.y
+        if opcode == OP_G1:
+            code, arguments = TABLE_BLINK, (x, y, instruction.z)
+        elif opcode == OP_G2:
+            code, arguments = TABLE_PIN, (x, y)
+        elif opcode == OP_G3:
+            code, arguments = TABLE_ANALOG_PIN, (x, y)
+        else:
+            continue
+        if not all(has_value(argument) for argument in arguments):
+            continue
+        record = [code]
+        for argument in arguments:
+            record.extend(encode_argument(argument, instruction.line_number))
+        yield tuple(record)
+    yield (TABLE_END,)
+
+
+def iter_progmem_rows(instructions):
+    """Raggruppa i byte della tabella in righe di inizializzatore C++ di lunghezza fissa."""
+    row = []
+    for record in iter_table_records(instructions):
+        row.extend(record)
+        while len(row) >= TABLE_BYTES_PER_ROW:
+            yield '  ' + ', '.join(f'0x{byte:02X}' for byte in row[:TABLE_BYTES_PER_ROW]) + ',\n'
+            del row[:TABLE_BYTES_PER_ROW]
+    if row:
+        yield '  ' + ', '.join(f'0x{byte:02X}' for byte in row) + ',\n'
+
+
+def iter_motion_rows(toolpath):
+    """Produce una riga di inizializzatore per ogni segmento del percorso pianificato (archi e soste compresi)."""
+    import numpy as np
+    from gcode_parser import OP_G4
+
+    targets_x = np.rint(toolpath.x[1:] * MOTION_SCALE).astype(np.int64)
+    targets_y = np.rint(toolpath.y[1:] * MOTION_SCALE).astype(np.int64)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        speeds = np.clip(np.nan_to_num(np.rint(toolpath.lengths / toolpath.durations * MOTION_SCALE)),
+                         1, MOTION_MAX_SPEED).astype(np.int64)
+    dwelling = (toolpath.opcodes == OP_G4) & (toolpath.durations > 0)
+    # Le soste diventano righe {millisecondi, 0, 0}; i movimenti nulli non producono righe
+    targets_x[dwelling] = np.rint(toolpath.durations[dwelling] * 1000)
+    targets_y[dwelling] = 0
+    speeds[dwelling] = 0
+    rows = np.flatnonzero((toolpath.lengths > 0) | dwelling)
+    for x, y, speed in zip(targets_x[rows].tolist(), targets_y[rows].tolist(), speeds[rows].tolist()):
+        yield f'  {{{x}, {y}, {speed}}},\n'
+
+
+def iter_motion_code(instructions):
+    """Produce lo sketch di movimento standard; serve l'intero programma per pianificarlo.
+
+    Il percorso pianificato è lo stesso che esegue lo sketch, quindi in fondo viene riportato anche
+    il tempo ciclo stimato.
+    """
+    from toolpath import START_POSITION, compute_toolpath
+
+    program = instructions if isinstance(instructions, GCodeProgram) else collect_program(instructions)
+    toolpath = compute_toolpath(program)
+    start_x, start_y = (round(value * MOTION_SCALE) for value in START_POSITION)
+    yield MOTION_HEADER % (MOTION_SCALE, start_x, start_y)
+    yield from iter_motion_rows(toolpath)
+    yield MOTION_INTERPRETER
+    yield cycle_time_comment(toolpath)
+
+
+def collect_program(instructions):
+    """Raccoglie un iterabile di Instruction in un GCodeProgram."""
+    program = GCodeProgram()
+    for instruction in instructions:
+        program.append_instruction(instruction)
+    return program
+
+
+def iter_arduino_code(instructions, mode=MODE_UNROLLED):
+    """Produce in ordine i frammenti dello sketch Arduino: intestazione, corpo del programma e chiusura."""
+    if mode == MODE_PROGMEM:
+        yield ARDUINO_FUNCTIONS
+        yield PROGMEM_TABLE_HEADER
+        yield from iter_progmem_rows(instructions)
+        yield PROGMEM_INTERPRETER
+    elif mode == MODE_UNROLLED:
+        yield ARDUINO_HEADER
+        yield from iter_arduino_statements(instructions)
+        yield ARDUINO_FOOTER
+    elif mode == MODE_MOTION:
+        yield from iter_motion_code(instructions)
+    else:
+        raise ValueError(f"Modalità di traduzione sconosciuta: {mode}")
+
+
+def convert_gcode_to_arduino(instructions, mode=MODE_UNROLLED):
+    """Converti le istruzioni G-code (un GCodeProgram o un iterabile di Instruction) in comandi Arduino."""
+    return ''.join(iter_arduino_code(instructions, mode))
+
+
+def write_arduino_sketch(instructions, arduino_file_path, mode=MODE_UNROLLED, buffer_size=WRITE_BUFFER_SIZE):
+    """Scrive lo sketch in streaming attraverso un writer bufferizzato."""
+    os.makedirs(os.path.dirname(arduino_file_path), exist_ok=True)
+    with open(arduino_file_path, 'w', buffering=buffer_size) as arduino_file:
+        arduino_file.writelines(iter_arduino_code(instructions, mode))
+    return arduino_file_path
+
+
+def translate_gcode_file(program_path, arduino_file_path=None, mode=MODE_UNROLLED):
+    """Traduce un file .gcode in un file .ino leggendo e scrivendo una riga alla volta.
+
+    Le modalità unrolled e progmem restano in streaming a memoria costante; la modalità di movimento
+    standard ha bisogno dell'intero programma prima di scrivere, quindi lo compila subito.
+    """
+    if arduino_file_path is None:
+        arduino_file_path = sketch_path_for(program_path)
+    with span('translate', 'gcode', mode=mode), open(program_path, 'r') as file:
+        instructions = parse_gcode(file) if mode == MODE_MOTION else iter_instructions(file)
+        write_arduino_sketch(instructions, arduino_file_path, mode)
+    return arduino_file_path
+
+
+def cycle_time_comment(toolpath):
+    """Commento C++ con il tempo ciclo stimato dal pianificatore di movimento."""
+    return f"\n// Tempo ciclo stimato: {toolpath.total_time:.1f}s ({len(toolpath)} movimenti)\n"
@@ -0,0 +1,216 @@
+import tkinter as tk
+from tkinter import ttk
+from tkinter import font as tkfont
+from gcode_parser import is_valid_line
+
+HIGHLIGHT_COLOR = 'yellow'
+BACKGROUND_COLOR = 'white'
+WHEEL_ROWS = 3
+
+INVALID_TAG = 'invalid'
+DIRTY_TAG = 'dirty'
+INVALID_COLOR = '#ffc8c8'
+VALIDATION_DELAY_MS = 250
+VALIDATION_CHUNK_LINES = 5000
+
+
+class VirtualListView(ttk.Frame):
+    """Lista di sola lettura che materializza nel Listbox soltanto le righe visibili.
+
+    lines può essere qualunque sequenza indicizzabile con slice (una lista, un indice su file mappato);
+    la riga evidenziata è tracciata qui, quindi aprire, evidenziare e deselezionare non dipendono
+    dalla lunghezza del programma.
+    """
+
+    def __init__(self, master, lines, **kwargs):
+        super().__init__(master, **kwargs)
+        self.lines = lines
+        self.first = 0
+        self.visible_rows = 1
+        self.highlighted_row = None
+
+        self.listbox = tk.Listbox(self, activestyle='none', exportselection=False)
+        self.scrollbar = ttk.Scrollbar(self, orient='vertical', command=self.yview)
+        self.scrollbar.pack(side='right', fill='y')
+        self.listbox.pack(side='left', fill='both', expand=True)
+        self.line_height = tkfont.Font(font=self.listbox.cget('font')).metrics('linespace')
+
+        self.listbox.bind('<Configure>', self.on_resize)
+        self.listbox.bind('<MouseWheel>', lambda event: self.scroll_to(self.first - WHEEL_ROWS * (1 if event.delta > 0 else -1)))
+        self.listbox.bind('<Button-4>', lambda event: self.scroll_to(self.first - WHEEL_ROWS))
+        self.listbox.bind('<Button-5>', lambda event: self.scroll_to(self.first + WHEEL_ROWS))
+        self.render()
+
+    def size(self):
+        return len(self.lines)
+
+    def get(self, row):
+        """Testo della riga indicata, senza spazi e terminatori."""
+        return self.lines[row].strip()
+
+    def yview(self, *args):
+        """Gestisce i comandi della scrollbar ('moveto' e 'scroll')."""
+        if args[0] == 'moveto':
+            self.scroll_to(int(float(args[1]) * self.size()))
+        elif args[0] == 'scroll':
+            amount = int(args[1])
+            if args[2] == 'pages':
+                amount *= self.visible_rows
+            self.scroll_to(self.first + amount)
+
+    def scroll_to(self, first):
+        """Mostra la finestra di righe che inizia da first."""
+        first = max(0, min(first, self.size() - self.visible_rows))
+        if first != self.first:
+            self.first = first
+            self.render()
+
+    def see(self, row):
+        """Porta la riga nella finestra visibile, centrandola se è fuori vista."""
+        if not self.first <= row < self.first + self.visible_rows:
+            self.scroll_to(row - self.visible_rows // 2)
+
+    def highlight(self, row):
+        """Evidenzia una riga (None per nessuna), aggiornando solo le righe interessate."""
+        previous, self.highlighted_row = self.highlighted_row, row
+        for changed_row, color in ((previous, BACKGROUND_COLOR), (row, HIGHLIGHT_COLOR)):
+            if changed_row is not None and self.first <= changed_row < self.first + self.listbox.size():
+                self.listbox.itemconfig(changed_row - self.first, {'bg': color})
+
+    def clear_highlight(self):
+        self.highlight(None)
+
+    def on_resize(self, event):
+        visible_rows = max(1, event.height // self.line_height + 1)
+        if visible_rows != self.visible_rows:
+            self.visible_rows = visible_rows
+            self.first = max(0, min(self.first, self.size() - self.visible_rows))
+            self.render()
+
+    def render(self):
+        """Ricarica nel Listbox le sole righe della finestra visibile."""
+        rows = [line.rstrip('\r\n') for line in self.lines[self.first:self.first + self.visible_rows]]
+        self.listbox.delete(0, tk.END)
+        if rows:
+            self.listbox.insert(tk.END, *rows)
+        if self.highlighted_row is not None and self.first <= self.highlighted_row < self.first + len(rows):
+            self.listbox.itemconfig(self.highlighted_row - self.first, {'bg': HIGHLIGHT_COLOR})
+        total = self.size()
+        if total:
+            self.scrollbar.set(self.first / total, (self.first + len(rows)) / total)
+        else:
+            self.scrollbar.set(0, 1)
+
+
+class LiveValidator:
+    """Validazione incrementale di un widget Text mentre l'operatore scrive.
+
+    I comandi insert/delete/replace del widget passano da un proxy Tcl che marca con il tag 'dirty'
+    soltanto le righe toccate; i tag si spostano con il testo, quindi restano corretti anche se nel
+    frattempo si aggiungono o tolgono righe sopra. Dopo VALIDATION_DELAY_MS senza modifiche le righe
+    marcate vengono ricontrollate, a blocchi di VALIDATION_CHUNK_LINES per non bloccare l'interfaccia,
+    e quelle non valide ricevono il tag 'invalid'. on_result(errori, prima_riga) viene chiamata alla fine.
+    """
+
+    def __init__(self, text, on_result=None, delay_ms=VALIDATION_DELAY_MS):
+        self.text = text
+        self.on_result = on_result
+        self.delay_ms = delay_ms
+        self._job = None
+        self._original = f"{text._w}_original"
+        text.tk.call('rename', text._w, self._original)
+        text.tk.createcommand(text._w, self._dispatch)
+        text.tag_configure(INVALID_TAG, background=INVALID_COLOR)
+        text.tag_lower(INVALID_TAG, 'sel')  # La selezione resta visibile anche sulle righe non valide
+        text.bind('<Destroy>', self._on_destroy, add=True)
+
+    def _call(self, *args):
+        return self.text.tk.call(self._original, *args)
+
+    def _line_of(self, index):
+        return int(str(self._call('index', index)).split('.')[0])
+
+    def _dispatch(self, command, *args):
+        """Inoltra il comando al widget originale e, se modifica il testo, marca le righe interessate."""
+        if command not in ('insert', 'delete', 'replace'):
+            return self._call(command, *args)
+        first = self._line_of(args[0])
+        result = self._call(command, *args)
+        inserted = args[1::2] if command == 'insert' else args[2::2] if command == 'replace' else ()
+        last = first + sum(str(chars).count('\n') for chars in inserted)
+        # Il tag comprende il fine riga, così anche le righe rimaste vuote restano marcate
+        self._call('tag', 'add', DIRTY_TAG, f"{first}.0", f"{last}.0 lineend +1c")
+        self.schedule()
+        return result
+
+    def schedule(self, delay_ms=None):
+        """Rimanda il controllo: ogni nuova modifica riavvia l'attesa."""
+        if self._job is not None:
+            self.text.after_cancel(self._job)
+        self._job = self.text.after(self.delay_ms if delay_ms is None else delay_ms, self.validate_pending)
+
+    def validate_pending(self):
+        """Ricontrolla un blocco di righe marcate; se ne restano altre si ripianifica subito dopo."""
+        self._job = None
+        if self.validate_chunk(VALIDATION_CHUNK_LINES):
+            self._job = self.text.after(1, self.validate_pending)
+        elif self.on_result is not None:
+            self.on_result(*self.summary())
+
+    def validate_chunk(self, max_lines):
+        """Valida al più max_lines righe marcate; restituisce True se ne restano da validare."""
+        remaining = max_lines
+        while remaining > 0:
+            found = self._call('tag', 'nextrange', DIRTY_TAG, '1.0')
+            if not found:
+                return False
+            first = self._line_of(found[0])
+            last = min(self._line_of(f"{found[1]} -1c"), first + remaining - 1)
+            lines = str(self._call('get', f"{first}.0", f"{last}.0 lineend")).split('\n')
+            self._call('tag', 'remove', INVALID_TAG, f"{first}.0", f"{last}.0 lineend")
+            for line_num, line in enumerate(lines, start=first):
+                line = line.strip()
+                if line and not is_valid_line(line):
+                    self._call('tag', 'add', INVALID_TAG, f"{line_num}.0", f"{line_num}.0 lineend")
+            self._call('tag', 'remove', DIRTY_TAG, f"{first}.0", f"{last}.0 lineend +1c")
+            remaining -= last - first + 1
+        return bool(self._call('tag', 'nextrange', DIRTY_TAG, '1.0'))
+
+    def mark_invalid(self, line_numbers):
+        """Marca direttamente righe già note come non valide (es. trovate validando il file all'apertura)."""
+        for line_num in line_numbers:
+            self._call('tag', 'add', INVALID_TAG, f"{line_num}.0", f"{line_num}.0 lineend")
+
+    def flush(self):
+        """Completa subito la validazione in sospeso (prima di salvare)."""
+        if self._job is not None:
+            self.text.after_cancel(self._job)
+            self._job = None
+        while self.validate_chunk(VALIDATION_CHUNK_LINES):
+            pass
+
+    def errors(self):
+        """Righe non valide come (numero_linea, riga), senza rileggere il testo già validato."""
+        self.flush()
+        ranges = self._call('tag', 'ranges', INVALID_TAG)
+        errors = []
+        for start in ranges[::2]:
+            line_num = self._line_of(start)
+            errors.append((line_num, str(self._call('get', f"{line_num}.0", f"{line_num}.0 lineend")).strip()))
+        return errors
+
+    def summary(self):
+        """Numero di righe non valide e numero della prima, o None."""
+        ranges = self._call('tag', 'ranges', INVALID_TAG)
+        return len(ranges) // 2, self._line_of(ranges[0]) if ranges else None
+
+    def _on_destroy(self, event):
+        if event.widget is not self.text:
+            return
+        if self._job is not None:
+            self.text.after_cancel(self._job)
+            self._job = None
+        try:
+            self.text.tk.deletecommand(self.text._w)
+        except tk.TclError:
+            pass
@@ -0,0 +1,227 @@
+import cProfile
+import json
+import os
+import threading
+import time
+from collections import deque, namedtuple
+from atomic_file import atomic_write
+
+MAX_EVENTS = 100000
+TRACE_PATH = os.path.join(os.path.dirname(__file__), 'trace.json')
+PROFILE_PATH = os.path.join(os.path.dirname(__file__), 'profile.prof')
+PROFILE_SUMMARY_LINES = 25
+
+# Una fase misurata: start è in secondi dall'avvio del registratore, duration in secondi
+Span = namedtuple('Span', ('name', 'category', 'start', 'duration', 'thread', 'args'))
+
+
+class SpanTimer:
+    """Misura il blocco with che racchiude e lo registra come Span; dopo l'uscita duration è disponibile."""
+
+    __slots__ = ('recorder', 'name', 'category', 'args', 'start', 'duration')
+
+    def __init__(self, recorder, name, category, args):
+        self.recorder = recorder
+        self.name = name
+        self.category = category
+        self.args = args
+        self.start = None
+        self.duration = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.duration = time.perf_counter() - self.start
+        if exc_type is not None:
+            self.args['error'] = exc_type.__name__
+        self.recorder.add_span(Span(self.name, self.category, self.start - self.recorder.origin, self.duration,
+                                    threading.get_ident(), self.args))
+        return False
+
+
+class Recorder:
+    """Raccoglie in memoria le fasi misurate, i contatori e gli eventi puntuali di tutti i thread.
+
+    Gli eventi sono tenuti in una coda limitata (MAX_EVENTS), quindi la registrazione può restare
+    sempre attiva: il costo è di due letture dell'orologio e un append per ogni fase.
+    """
+
+    def __init__(self, max_events=MAX_EVENTS):
+        self.origin = time.perf_counter()
+        self.events = deque(maxlen=max_events)
+        self.latest = {}
+        self.counters = {}
+        self.thread_names = {}
+        self._lock = threading.Lock()
+
+    def span(self, name, category='app', **args):
+        return SpanTimer(self, name, category, args)
+
+    def add_span(self, span):
+        with self._lock:
+            self.thread_names.setdefault(span.thread, threading.current_thread().name)
+            self.events.append(('X', span))
+            self.latest[span.name] = span
+
+    def count(self, name, value=1):
+        """Incrementa un contatore; ogni variazione finisce anche nella traccia."""
+        now = time.perf_counter() - self.origin
+        with self._lock:
+            total = self.counters[name] = self.counters.get(name, 0) + value
+            self.events.append(('C', (name, now, total)))
+
+    def mark(self, name, category='app', **args):
+        """Registra un evento istantaneo (es. un errore mostrato all'operatore)."""
+        now = time.perf_counter() - self.origin
+        with self._lock:
+            self.thread_names.setdefault(threading.get_ident(), threading.current_thread().name)
+            self.events.append(('i', Span(name, category, now, 0.0, threading.get_ident(), args)))
+
+    def last_spans(self):
+        """L'ultima misura di ogni fase, dalla più recente."""
+        with self._lock:
+            spans = list(self.latest.values())
+        return sorted(spans, key=lambda span: span.start + span.duration, reverse=True)
+
+    def thread_name(self, thread):
+        return self.thread_names.get(thread, str(thread))
+
+    def trace_events(self):
+        """Eventi nel formato Trace Event di Chrome (chrome://tracing, Perfetto), con tempi in microsecondi."""
+        pid = os.getpid()
+        with self._lock:
+            events = list(self.events)
+            thread_names = dict(self.thread_names)
+        trace = [{'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': thread, 'args': {'name': name}}
+                 for thread, name in thread_names.items()]
+        for phase, event in events:
+            if phase == 'C':
+                name, start, total = event
+                trace.append({'name': name, 'ph': 'C', 'ts': start * 1e6, 'pid': pid, 'args': {name: total}})
+                continue
+            entry = {'name': event.name, 'cat': event.category, 'ph': phase, 'ts': event.start * 1e6,
+                     'pid': pid, 'tid': event.thread, 'args': event.args}
+            if phase == 'X':
+                entry['dur'] = event.duration * 1e6
+            else:
+                entry['s'] = 't'
+            trace.append(entry)
+        return trace
+
+    def export_trace(self, path=TRACE_PATH):
+        """Scrive la traccia JSON in modo atomico e ne restituisce il percorso."""
+        with atomic_write(path) as trace_file:
+            json.dump({'traceEvents': self.trace_events(), 'displayTimeUnit': 'ms'}, trace_file, default=str)
+        return path
+
+    def reset(self):
+        with self._lock:
+            self.events.clear()
+            self.latest.clear()
+            self.counters.clear()
+
+
+class Profiler:
+    """cProfile attivabile a comando.
+
+    cProfile misura solo il thread che lo attiva: il thread che chiama start viene profilato subito,
+    i lavori in background vengono profilati se partono (con profiled) mentre la profilazione è attiva.
+    stop unisce tutti i profili raccolti.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self._profiles = []
+        self._own = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        if self.enabled:
+            return
+        with self._lock:
+            self._profiles = []
+        self._own = cProfile.Profile()
+        self.enabled = True
+        self._own.enable()
+
+    def profiled(self):
+        """Context manager per l'ingresso dei thread di lavoro: profila il blocco se la profilazione è attiva."""
+        return _ProfiledBlock(self) if self.enabled else _NOT_PROFILED
+
+    def collect(self, profile):
+        with self._lock:
+            self._profiles.append(profile)
+
+    def stop(self, path=PROFILE_PATH):
+        """Ferma la profilazione, salva le statistiche unite in path e ne restituisce un riepilogo testuale."""
+        import io
+        import pstats
+
+        if not self.enabled:
+            return ""
+        self.enabled = False
+        self._own.disable()
+        with self._lock:
+            profiles = [self._own] + self._profiles
+            self._profiles = []
+        stats = pstats.Stats(profiles[0], stream=io.StringIO())
+        for profile in profiles[1:]:
+            stats.add(profile)
+        stats.dump_stats(path)
+        stats.sort_stats('cumulative').print_stats(PROFILE_SUMMARY_LINES)
+        return stats.stream.getvalue()
+
+
+class _ProfiledBlock:
+    def __init__(self, profiler):
+        self.profiler = profiler
+        self.profile = cProfile.Profile()
+        self.active = False
+
+    def __enter__(self):
+        try:
+            self.profile.enable()
+            self.active = True
+        except ValueError:
+            # Da Python 3.12 il profilo attivato da start vede già tutti i thread e non ne ammette un secondo
+            pass
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.active:
+            self.profile.disable()
+            self.profiler.collect(self.profile)
+        return False
+
+
+class _NotProfiled:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NOT_PROFILED = _NotProfiled()
+
+recorder = Recorder()
+profiler = Profiler()
+
+
+def span(name, category='app', **args):
+    """Misura un blocco with: `with span('compile', 'arduino-cli') as timer: ...` (poi timer.duration)."""
+    return recorder.span(name, category, **args)
+
+
+def count(name, value=1):
+    recorder.count(name, value)
+
+
+def mark(name, category='app', **args):
+    recorder.mark(name, category, **args)
+
+
+def export_trace(path=TRACE_PATH):
+    return recorder.export_trace(path)
@@ -0,0 +1,210 @@
+import itertools
+import os
+import queue
+import threading
+from gcode_translator import MODE_UNROLLED
+from upload_pipeline import UploadJob
+from serial_sender import StreamJob
+
+JOB_UPLOAD = 'upload'
+JOB_STREAM = 'stream'
+JOB_KINDS = (JOB_UPLOAD, JOB_STREAM)
+
+STATUS_QUEUED = 'queued'
+STATUS_RUNNING = 'running'
+STATUS_RETRYING = 'retrying'
+STATUS_DONE = 'done'
+STATUS_FAILED = 'failed'
+STATUS_CANCELLED = 'cancelled'
+FINAL_STATUSES = (STATUS_DONE, STATUS_FAILED, STATUS_CANCELLED)
+
+STATUS_LABELS = {
+    STATUS_QUEUED: "in coda",
+    STATUS_RUNNING: "in corso",
+    STATUS_RETRYING: "in attesa di un nuovo tentativo",
+    STATUS_DONE: "completato",
+    STATUS_FAILED: "fallito",
+    STATUS_CANCELLED: "annullato",
+}
+
+DEFAULT_RETRIES = 2
+RETRY_DELAY = 3.0
+
+
+class ScheduledJob:
+    """Un caricamento o un invio in streaming destinato a una macchina, con il suo stato e i tentativi fatti."""
+
+    def __init__(self, job_id, device, kind, program_path, mode=MODE_UNROLLED):
+        self.job_id = job_id
+        self.device = device
+        self.kind = kind
+        self.program_path = program_path
+        self.mode = mode
+        self.status = STATUS_QUEUED
+        self.attempts = 0
+        self.message = ""
+        self.current = None
+        self._cancelled = threading.Event()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    @property
+    def finished(self):
+        return self.status in FINAL_STATUSES
+
+    def describe(self):
+        return f"{os.path.basename(self.program_path)} su {self.device.name}"
+
+    def create_attempt(self):
+        """Crea il lavoro da eseguire per un tentativo: ogni tentativo riparte da zero."""
+        if self.kind == JOB_STREAM:
+            return StreamJob(self.program_path, self.device.port, self.device.baudrate)
+        return UploadJob(self.program_path, self.mode, self.device.fqbn, self.device.port)
+
+    def cancel(self):
+        self._cancelled.set()
+        current = self.current
+        if current is not None:
+            current.cancel()
+
+
+class DeviceEvents:
+    """Coda degli eventi di un tentativo che li inoltra, etichettati con il lavoro, alla coda dello scheduler."""
+
+    def __init__(self, events, job):
+        self._events = events
+        self._job = job
+
+    def put(self, event):
+        kind, message = event
+        if kind == 'done':
+            return  # L'esito del lavoro lo comunica lo scheduler, dopo gli eventuali tentativi
+        if kind != 'progress':
+            self._job.message = message
+        self._events.put((self._job, kind, message))
+
+
+class JobScheduler:
+    """Distribuisce i lavori sulle macchine registrate: ogni macchina ha la sua coda e il suo thread.
+
+    I lavori della stessa macchina vengono eseguiti uno alla volta, quelli di macchine diverse in parallelo.
+    Un tentativo fallito viene ripetuto fino a max_retries volte, tranne un invio in streaming che ha già
+    mandato istruzioni alla macchina: ripeterlo rieseguirebbe da capo movimenti già fatti. Lo scheduler non tocca l'interfaccia:
+    pubblica tuple (lavoro, tipo, messaggio) sulla coda events, con tipo tra 'status', 'progress', 'info' ed 'error'.
+    """
+
+    def __init__(self, devices, max_retries=DEFAULT_RETRIES, retry_delay=RETRY_DELAY):
+        self.devices = {device.name: device for device in devices}
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.events = queue.Queue()
+        self.jobs = []
+        self._queues = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def set_status(self, job, status, message=None):
+        job.status = status
+        self.events.put((job, 'status', message or f"{job.describe()}: {STATUS_LABELS[status]}"))
+
+    def submit(self, device_name, kind, program_path, mode=MODE_UNROLLED):
+        """Accoda un lavoro sulla macchina indicata e restituisce il ScheduledJob per seguirne lo stato."""
+        if device_name not in self.devices:
+            raise ValueError(f"Macchina sconosciuta: {device_name}")
+        if kind not in JOB_KINDS:
+            raise ValueError(f"Tipo di lavoro sconosciuto: {kind}")
+
+        with self._lock:
+            job = ScheduledJob(next(self._ids), self.devices[device_name], kind, program_path, mode)
+            self.jobs.append(job)
+            device_queue = self._queues.get(device_name)
+            if device_queue is None:
+                device_queue = self._queues[device_name] = queue.Queue()
+                threading.Thread(target=self.work, args=(device_queue,), name=f"device-{device_name}",
+                                 daemon=True).start()
+        self.set_status(job, STATUS_QUEUED)
+        device_queue.put(job)
+        return job
+
+    def work(self, device_queue):
+        while True:
+            job = device_queue.get()
+            if job is None:
+                return
+            self.run_job(job)
+
+    def run_job(self, job):
+        """Esegue un lavoro ripetendo i tentativi falliti; gira nel thread della sua macchina."""
+        while not job.cancelled:
+            job.attempts += 1
+            self.set_status(job, STATUS_RUNNING, f"{job.describe()}: tentativo {job.attempts}")
+            attempt = job.create_attempt()
+            attempt.events = DeviceEvents(self.events, job)
+            job.current = attempt
+            if job.cancelled:
+                attempt.cancel()
+            success = attempt.run()
+            job.current = None
+            if success:
+                self.set_status(job, STATUS_DONE)
+                return
+            if job.cancelled:
+                break
+            if job.attempts > self.max_retries:
+                self.set_status(job, STATUS_FAILED, f"{job.describe()}: fallito dopo {job.attempts} tentativi")
+                return
+            if job.kind == JOB_STREAM and attempt.lines_sent:
+                self.set_status(job, STATUS_FAILED, f"{job.describe()}: fallito dopo l'invio di {attempt.lines_sent} "
+                                                    f"istruzioni, non ripetuto per non rieseguirle")
+                return
+            self.set_status(job, STATUS_RETRYING)
+            job._cancelled.wait(self.retry_delay)
+        if not job.finished:
+            self.set_status(job, STATUS_CANCELLED)
+
+    def cancel(self, job):
+        """Annulla un lavoro in coda o in corso; un lavoro in coda risulta annullato subito."""
+        if job.finished:
+            return
+        job.cancel()
+        if job.status == STATUS_QUEUED:
+            self.set_status(job, STATUS_CANCELLED)
+
+    def cancel_device(self, device_name):
+        """Annulla tutti i lavori non ancora conclusi di una macchina; restituisce quanti sono."""
+        with self._lock:
+            pending = [job for job in self.jobs if job.device.name == device_name and not job.finished]
+        for job in pending:
+            self.cancel(job)
+        return len(pending)
+
+    def device_status(self, device_name):
+        """Riepilogo di una macchina: il lavoro in corso (o None) e quanti ne restano in coda."""
+        with self._lock:
+            jobs = [job for job in self.jobs if job.device.name == device_name and not job.finished]
+        running = next((job for job in jobs if job.status in (STATUS_RUNNING, STATUS_RETRYING)), None)
+        queued = sum(1 for job in jobs if job.status == STATUS_QUEUED)
+        return running, queued
+
+    def describe_status(self):
+        """Una riga di stato per ogni macchina registrata."""
+        lines = []
+        for name, device in self.devices.items():
+            running, queued = self.device_status(name)
+            state = f"{running.describe()} ({STATUS_LABELS[running.status]})" if running else "libera"
+            lines.append(f"{name} ({device.port}): {state}, {queued} in coda")
+        return "\n".join(lines)
+
+    def pending(self):
+        """True se almeno un lavoro non è ancora concluso."""
+        with self._lock:
+            return any(not job.finished for job in self.jobs)
+
+    def shutdown(self):
+        """Ferma i thread delle macchine dopo i lavori già accodati."""
+        with self._lock:
+            for device_queue in self._queues.values():
+                device_queue.put(None)
+            self._queues.clear()
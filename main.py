@@ -1,18 +1,36 @@
+import threading
 import tkinter as tk
 from ui_setup import (setup_ui, initialize_left_frame, initialize_graph,
                       plot_initial_graph, clear_left_frame, show_graph)
 from gcode_file_operations import (
     load_existing_programs, create_new_program, edit_selected_program,
-    save_new_program, cancel_new_program, save_edited_program)
-from arduino_operations import translate_gcode, upload_to_arduino
+    save_new_program, cancel_new_program, save_edited_program,
+    poll_program_library, add_library_directory, show_program_info)
+from arduino_operations import (translate_gcode, translate_gcode_to_arduino, upload_to_arduino, cancel_upload,
+                                stream_to_arduino, poll_device_jobs, show_device_status)
+from batch_operations import batch_selected_programs
 from simulation_operations import prepare_simulation, simulate_program, step_simulation
+from profiling_operations import show_timings
+from program_library import ProgramLibrary
+from device_registry import load_devices
+from job_scheduler import JobScheduler
 
 class CNCApp:
     def __init__(self, root):
         self.root = root
         self.root.title("CNC Tornio")
+        self.scheduler = JobScheduler(load_devices())
+        self.frame_job = None
+        self.mapped_program = None
+        self.program_library = ProgramLibrary()
+        self.program_library.sync()
+        self.library_worker = None
+        self.library_changed = threading.Event()
+        self.program_paths = []
         self.setup_ui()
         self.load_existing_programs()
+        poll_program_library(self)
+        poll_device_jobs(self)
 
     def setup_ui(self): setup_ui(self)
     def initialize_left_frame(self): initialize_left_frame(self)
@@ -22,104 +40,25 @@ class CNCApp:
     def show_graph(self): show_graph(self)
     def hide_graph(self): self.canvas.get_tk_widget().pack_forget()
     def load_existing_programs(self): load_existing_programs(self)
+    def add_library_directory(self): add_library_directory(self)
+    def show_program_info(self): show_program_info(self)
     def create_new_program(self): create_new_program(self)
     def edit_selected_program(self): edit_selected_program(self)
     def prepare_simulation(self): prepare_simulation(self)
     def upload_to_arduino(self): upload_to_arduino(self)
+    def stream_to_arduino(self): stream_to_arduino(self)
+    def cancel_upload(self): cancel_upload(self)
+    def show_device_status(self): show_device_status(self)
+    def show_timings(self): show_timings(self)
     def translate_gcode(self): translate_gcode(self)
+    def batch_selected_programs(self): batch_selected_programs(self)
     def save_new_program(self): save_new_program(self)
     def cancel_new_program(self): cancel_new_program(self)
     def save_edited_program(self, program_path): save_edited_program(self, program_path)
     def show_message(self, message, message_type="info"):
         self.message_label.config(text=message, fg="green" if message_type == "info" else "red")
 
-    def translate_gcode_to_arduino(self, program_path):
-        try:
-            with open(program_path, 'r') as file:
-                gcode_data = file.readlines()
-            arduino_commands = self.convert_gcode_to_arduino(gcode_data)
-
-            arduino_file_base = os.path.splitext(os.path.basename(program_path))[0]
-            arduino_dir = os.path.join(os.path.dirname(program_path), arduino_file_base)
-            os.makedirs(arduino_dir, exist_ok=True)
-
-            arduino_file_path = os.path.join(arduino_dir, f"{arduino_file_base}.ino")
-            with open(arduino_file_path, 'w') as arduino_file:
-                arduino_file.write(arduino_commands)
-
-            self.show_message(f"Programma tradotto e salvato in {arduino_file_path}", "info")
-            return arduino_file_path
-        except Exception as e:
-            self.show_message(f"Errore: Impossibile tradurre il programma G-code: {e}", "error")
-            return None
-
-    def convert_gcode_to_arduino(self, gcode_data):
-        arduino_code = """
-// Dichiarazione delle funzioni
-void blink(int x, int y, int z);
-void turnOnPin(int pin, int duration);
-void turnOnAnalogPin(int pin, int duration);
-
-// Configurazione iniziale
-void setup() {
-  pinMode(13, OUTPUT);
-  Serial.begin(115200);
-}
-
-// Funzioni di utilità
-void blink(int x, int y, int z) {
-  int onTime = y * 1000;
-  int offTime = z * 1000;
-
-  for (int i = 0; i < x; i++) {
-    digitalWrite(13, HIGH);
-    delay(onTime);
-    digitalWrite(13, LOW);
-    delay(offTime);
-  }
-}
-
-void turnOnPin(int pin, int duration) {
-  pinMode(pin, OUTPUT);
-  digitalWrite(pin, HIGH);
-  delay(duration * 1000);
-  digitalWrite(pin, LOW);
-}
-
-void turnOnAnalogPin(int pin, int duration) {
-  pinMode(pin, OUTPUT);
-  analogWrite(pin, 255);
-  delay(duration * 1000);
-  analogWrite(pin, 0);
-}
-
-void loop() {
-"""
-        for line in gcode_data:
-            parts = line.strip().split()
-            if line.startswith('G1'):
-                x = y = z = None
-                for part in parts:
-                    if part.startswith('X'): x = part[1:]
-                    elif part.startswith('Y'): y = part[1:]
-                    elif part.startswith('Z'): z = part[1:]
-                if x and y and z: arduino_code += f'  blink({x}, {y}, {z});\n'
-            elif line.startswith('G2'):
-                pin = duration = None
-                for part in parts:
-                    if part.startswith('X'): pin = part[1:]
-                    elif part.startswith('Y'): duration = part[1:]
-                if pin and duration: arduino_code += f'  turnOnPin({pin}, {duration});\n'
-            elif line.startswith('G3'):
-                pin = duration = None
-                for part in parts:
-                    if part.startswith('X'): pin = part[1:]
-                    elif part.startswith('Y'): duration = part[1:]
-                if pin and duration: arduino_code += f'  turnOnAnalogPin({pin}, {duration});\n'
-        arduino_code += """
-}
-"""
-        return arduino_code
+    def translate_gcode_to_arduino(self, program_path): return translate_gcode_to_arduino(self, program_path)
 
 if __name__ == "__main__":
     root = tk.Tk()
@@ -0,0 +1,120 @@
+from collections import namedtuple
+import numpy as np
+from gcode_parser import (OP_G0, OP_G1, OP_G2, OP_G3, OP_G4, OP_G20, OP_G21, OP_G28, OP_G90, OP_G91, OP_G92,
+                          OP_M30)
+
+MM_PER_INCH = 25.4
+MOTION_OPCODES = (OP_G0, OP_G1, OP_G2, OP_G3)
+
+# Blocchi di movimento in coordinate macchina (mm, secondi), nell'ordine in cui la macchina li esegue.
+# Ogni movimento G0-G3 e ogni sosta G4 diventa un blocco, G28 due (punto intermedio e ritorno a casa).
+# x/y sono i punti finali; i, j, r sono già convertiti in mm (NaN dove assenti); dwells è la durata
+# delle soste (0 per i movimenti).
+MotionBlocks = namedtuple('MotionBlocks', ('instruction_indexes', 'opcodes', 'x', 'y', 'feed_rates',
+                                           'i', 'j', 'r', 'dwells'))
+
+
+def forward_fill(values, present, initial):
+    """Sostituisce i valori assenti con l'ultimo valore presente (initial se non ce n'è ancora uno)."""
+    last = np.where(present, np.arange(len(values)), -1)
+    np.maximum.accumulate(last, out=last)
+    return np.where(last >= 0, values[np.maximum(last, 0)], initial)
+
+
+def program_end(opcodes):
+    """Indice del primo M30 (le istruzioni successive non vengono eseguite), o la lunghezza del programma."""
+    stops = np.flatnonzero(opcodes == OP_M30)
+    return int(stops[0]) if len(stops) else len(opcodes)
+
+
+def modal_units(opcodes):
+    """Fattore di conversione in mm in vigore su ogni riga: G20 (pollici) e G21 (mm) valgono da quella riga in poi."""
+    units = (opcodes == OP_G20) | (opcodes == OP_G21)
+    return forward_fill(np.where(opcodes == OP_G20, MM_PER_INCH, 1.0), units, 1.0)
+
+
+def modal_incremental(opcodes):
+    """True sulle righe in modalità incrementale (G91), False in modalità assoluta (G90, predefinita)."""
+    distance = (opcodes == OP_G90) | (opcodes == OP_G91)
+    return forward_fill(opcodes == OP_G91, distance, False)
+
+
+def resolve_axis(opcodes, words, incremental, start, home):
+    """Posizione macchina di un asse dopo ogni riga, e punto intermedio delle righe G28.
+
+    words sono i valori già convertiti in mm (NaN dove assenti). Con l'offset di G92 costante le
+    posizioni si calcolano in blocco: ogni movimento assoluto (e ogni G28) fissa la posizione, quelli
+    incrementali la spostano, quindi basta una somma cumulativa che riparte da ogni punto fisso.
+    Solo le righe G92 che nominano l'asse cambiano l'offset e spezzano il calcolo, una volta ciascuna.
+    """
+    present = ~np.isnan(words)
+    homing = opcodes == OP_G28
+    moves = present & (np.isin(opcodes, MOTION_OPCODES) | homing)
+    absolute = moves & ~incremental
+    relative = moves & incremental
+
+    positions = np.empty(len(opcodes))
+    intermediate = np.empty(len(opcodes))
+    offset = 0.0
+    current = start
+    settings = np.flatnonzero(present & (opcodes == OP_G92))
+    for begin, end in zip(np.concatenate(([0], settings + 1)), np.append(settings + 1, len(opcodes))):
+        span = slice(begin, end)
+        steps = np.where(relative[span] & ~homing[span], words[span], 0.0)
+        travelled = np.cumsum(steps)
+        fixed = absolute[span] | homing[span]
+        targets = np.where(homing[span], home, words[span] + offset)
+        positions[span] = forward_fill(targets - travelled, fixed, current) + travelled
+
+        before = np.concatenate(([current], positions[begin:end - 1]))
+        intermediate[span] = np.where(absolute[span], words[span] + offset,
+                                      np.where(relative[span], before + words[span], before))
+        current = positions[end - 1] if end > begin else current
+        if end - 1 in settings:
+            # G92: la posizione attuale prende il valore indicato, senza muovere la macchina
+            offset = current - words[end - 1]
+    return positions, intermediate
+
+
+def compile_blocks(program, start, limits):
+    """Interpreta in blocco lo stato modale del programma e restituisce i suoi MotionBlocks.
+
+    Gestisce unità (G20/G21), modalità assoluta e incrementale (G90/G91), origine temporanea (G92),
+    ritorno a casa (G28, passando dal punto intermedio indicato; casa è start) e soste (G4, P in secondi
+    come in grbl). F è modale e segue le unità della riga in cui è programmata; G0 e G28 si muovono
+    a limits.rapid_rate, gli altri movimenti all'ultima F (limitata a limits.max_feed_rate).
+    """
+    opcodes = np.frombuffer(program.opcodes, dtype=np.int32)
+    opcodes = opcodes[:program_end(opcodes)]
+    count = len(opcodes)
+    scale = modal_units(opcodes)
+    incremental = modal_incremental(opcodes)
+
+    def field(values):
+        return np.frombuffer(values, dtype=np.float64)[:count] * scale
+
+    x, x_intermediate = resolve_axis(opcodes, field(program.x), incremental, start[0], start[0])
+    y, y_intermediate = resolve_axis(opcodes, field(program.y), incremental, start[1], start[1])
+
+    feeds = field(program.f)
+    programmed = forward_fill(feeds, ~np.isnan(feeds) & (feeds > 0), limits.max_feed_rate)
+    homing = opcodes == OP_G28
+    feed_rates = np.where((opcodes == OP_G0) | homing, limits.rapid_rate, np.minimum(programmed, limits.max_feed_rate))
+
+    block_counts = np.isin(opcodes, MOTION_OPCODES + (OP_G4,)).astype(np.int64) + 2 * homing
+    instruction_indexes = np.repeat(np.arange(count), block_counts)
+    block_x = x[instruction_indexes]
+    block_y = y[instruction_indexes]
+    # Il primo dei due blocchi di G28 va al punto intermedio
+    via = np.cumsum(block_counts)[homing] - 2
+    block_x[via] = x_intermediate[homing]
+    block_y[via] = y_intermediate[homing]
+
+    block_opcodes = np.where(homing, OP_G0, opcodes)[instruction_indexes].astype(np.int32)
+    dwelling = block_opcodes == OP_G4
+    pauses = np.frombuffer(program.p, dtype=np.float64)[instruction_indexes]
+    dwells = np.where(dwelling & (pauses > 0), pauses, 0.0)
+    return MotionBlocks(instruction_indexes, block_opcodes, block_x, block_y,
+                        np.where(dwelling, 0.0, feed_rates[instruction_indexes]),
+                        field(program.i)[instruction_indexes], field(program.j)[instruction_indexes],
+                        field(program.r)[instruction_indexes], dwells)
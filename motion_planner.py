@@ -0,0 +1,115 @@
+from collections import namedtuple
+import numpy as np
+from arc_engine import DEFAULT_ARC_TOLERANCE
+
+# Limiti della macchina, nelle stesse unità di F usate dal simulatore (mm e secondi).
+# junction_deviation è la deviazione ammessa agli spigoli (modello di grbl); lookahead è il numero
+# di movimenti nel buffer del pianificatore (None = il pianificatore vede tutto il programma);
+# arc_tolerance è l'errore di corda massimo con cui gli archi vengono convertiti in segmenti.
+MachineLimits = namedtuple('MachineLimits', ('acceleration', 'junction_deviation', 'rapid_rate', 'max_feed_rate',
+                                             'lookahead', 'arc_tolerance'))
+
+DEFAULT_LIMITS = MachineLimits(acceleration=200.0, junction_deviation=0.01, rapid_rate=50.0, max_feed_rate=50.0,
+                               lookahead=16, arc_tolerance=DEFAULT_ARC_TOLERANCE)
+
+# Profilo trapezoidale di ogni segmento: velocità di ingresso, di crociera (o di picco) e di uscita, e durata
+MotionPlan = namedtuple('MotionPlan', ('entry_speeds', 'cruise_speeds', 'exit_speeds', 'durations'))
+
+STRAIGHT_COSINE = 1 - 1e-9
+
+
+def junction_limits(dx, dy, lengths, limits):
+    """Quadrato della velocità massima a ogni giunzione tra segmenti consecutivi (tutti di lunghezza non nulla).
+
+    Come in grbl, la velocità è quella con cui l'utensile percorrerebbe un arco tangente ai due segmenti
+    che si discosta dallo spigolo di junction_deviation con accelerazione centripeta pari a quella massima.
+    """
+    ux = dx / lengths
+    uy = dy / lengths
+    cos_theta = np.clip(-(ux[:-1] * ux[1:] + uy[:-1] * uy[1:]), -1.0, 1.0)
+    sin_half = np.sqrt((1.0 - cos_theta) / 2.0)
+    speeds = np.full(len(cos_theta), np.inf)
+    curved = cos_theta > -STRAIGHT_COSINE  # Sui tratti allineati la giunzione non impone limiti
+    speeds[curved] = (limits.acceleration * limits.junction_deviation * sin_half[curved] /
+                      (1.0 - sin_half[curved]))
+    return speeds
+
+
+def plan_motion(dx, dy, lengths, nominal_speeds, limits=DEFAULT_LIMITS, stops=None):
+    """Calcola il profilo di velocità trapezoidale di ogni segmento.
+
+    Il passaggio all'indietro limita ogni velocità di ingresso a quella da cui si riesce a frenare
+    fino alle giunzioni successive, quello in avanti a quella raggiungibile accelerando dalle precedenti.
+    Entrambi sono minimi cumulativi, quindi si calcolano in blocco senza cicli Python. La macchina parte
+    e si ferma da ferma; stops indica gli indici dei segmenti che devono iniziare da fermi (es. dopo una sosta).
+    """
+    count = len(lengths)
+    entry_speeds = np.zeros(count)
+    cruise_speeds = np.zeros(count)
+    exit_speeds = np.zeros(count)
+    durations = np.zeros(count)
+    moving = np.flatnonzero(lengths > 0)
+    if not len(moving):
+        return MotionPlan(entry_speeds, cruise_speeds, exit_speeds, durations)
+
+    a = limits.acceleration
+    length = lengths[moving]
+    nominal = nominal_speeds[moving]
+    # Quadrato della velocità ammessa a ciascuna giunzione: k è l'ingresso del movimento k, l'ultima è la fine
+    caps = np.empty(len(moving) + 1)
+    caps[0] = 0.0
+    caps[-1] = 0.0
+    caps[1:-1] = np.minimum(junction_limits(dx[moving], dy[moving], length, limits),
+                            np.minimum(nominal[:-1], nominal[1:]) ** 2)
+    if stops is not None and len(stops):
+        # Una sosta su un segmento nullo vale per il primo movimento che lo segue
+        caps[np.searchsorted(moving, stops)] = 0.0
+
+    distance = np.zeros(len(moving) + 1)
+    np.cumsum(length, out=distance[1:])
+    if limits.lookahead:
+        # Con un buffer finito la macchina deve poter frenare entro i movimenti che ha già ricevuto
+        horizon = np.minimum(np.arange(len(caps)) + limits.lookahead, len(moving))
+        caps = np.minimum(caps, 2 * a * (distance[horizon] - distance))
+
+    reach = 2 * a * distance
+    backward = np.minimum.accumulate((caps + reach)[::-1])[::-1] - reach
+    speeds_squared = np.maximum(np.minimum.accumulate(backward - reach) + reach, 0.0)
+
+    v0 = np.sqrt(speeds_squared[:-1])
+    v1 = np.sqrt(speeds_squared[1:])
+    accelerate = (nominal ** 2 - v0 ** 2) / (2 * a)
+    decelerate = (nominal ** 2 - v1 ** 2) / (2 * a)
+    cruise = length - accelerate - decelerate
+    # Se il segmento è troppo corto per raggiungere la velocità nominale il profilo diventa triangolare
+    peak = np.where(cruise >= 0, nominal,
+                    np.sqrt(np.maximum((2 * a * length + v0 ** 2 + v1 ** 2) / 2, np.maximum(v0, v1) ** 2)))
+    duration = (peak - v0) / a + (peak - v1) / a + np.maximum(cruise, 0.0) / peak
+
+    entry_speeds[moving] = v0
+    cruise_speeds[moving] = peak
+    exit_speeds[moving] = v1
+    durations[moving] = duration
+    return MotionPlan(entry_speeds, cruise_speeds, exit_speeds, durations)
+
+
+def distance_at(plan, segment, elapsed, length, acceleration):
+    """Distanza percorsa nel segmento dopo elapsed secondi, seguendo il suo profilo trapezoidale."""
+    v0 = plan.entry_speeds[segment]
+    peak = plan.cruise_speeds[segment]
+    v1 = plan.exit_speeds[segment]
+    if peak <= 0:
+        return 0.0
+    accelerate_time = (peak - v0) / acceleration
+    accelerate_distance = (v0 + peak) / 2 * accelerate_time
+    decelerate_distance = (peak + v1) / 2 * (peak - v1) / acceleration
+    cruise_time = max(0.0, length - accelerate_distance - decelerate_distance) / peak
+    if elapsed <= 0:
+        return 0.0
+    if elapsed < accelerate_time:
+        return v0 * elapsed + acceleration * elapsed ** 2 / 2
+    if elapsed < accelerate_time + cruise_time:
+        return accelerate_distance + peak * (elapsed - accelerate_time)
+    braking = min(elapsed - accelerate_time - cruise_time, (peak - v1) / acceleration)
+    distance = length - decelerate_distance + peak * braking - acceleration * braking ** 2 / 2
+    return min(length, distance)
@@ -0,0 +1,67 @@
+import os
+import tkinter as tk
+from tkinter import ttk, filedialog
+from instrumentation import recorder, profiler, TRACE_PATH, PROFILE_PATH
+
+def show_timings(app):
+    """Mostra i tempi dell'ultima esecuzione di ogni fase, i contatori e i comandi di profilazione."""
+    app.clear_left_frame()
+
+    ttk.Label(app.left_frame, text="Tempi delle Fasi").pack(pady=10)
+    app.timings_tree = ttk.Treeview(app.left_frame, columns=("duration", "thread"), height=15)
+    app.timings_tree.heading("#0", text="Fase")
+    app.timings_tree.heading("duration", text="Durata")
+    app.timings_tree.heading("thread", text="Thread")
+    app.timings_tree.column("#0", width=140)
+    app.timings_tree.column("duration", width=80, anchor="e")
+    app.timings_tree.column("thread", width=100)
+    app.timings_tree.pack(padx=10, pady=10, fill="both", expand=True)
+
+    app.counters_label = ttk.Label(app.left_frame, text="", justify="left")
+    app.counters_label.pack(padx=10, pady=5, anchor="w")
+
+    ttk.Button(app.left_frame, text="Aggiorna", command=lambda: refresh_timings(app)).pack(pady=5)
+    ttk.Button(app.left_frame, text="Esporta Traccia", command=lambda: export_trace_file(app)).pack(pady=5)
+    app.profile_button = ttk.Button(app.left_frame, command=lambda: toggle_profiling(app))
+    app.profile_button.pack(pady=5)
+    ttk.Button(app.left_frame, text="Indietro", command=app.cancel_new_program).pack(pady=10)
+
+    refresh_timings(app)
+
+def refresh_timings(app):
+    """Ricarica nel pannello l'ultima misura di ogni fase, dalla più recente."""
+    app.timings_tree.delete(*app.timings_tree.get_children())
+    for span in recorder.last_spans():
+        label = span.name if 'error' not in span.args else f"{span.name} (errore)"
+        app.timings_tree.insert("", tk.END, text=label,
+                                values=(format_duration(span.duration), recorder.thread_name(span.thread)))
+    counters = sorted(recorder.counters.items())
+    app.counters_label.config(text="\n".join(f"{name}: {value}" for name, value in counters))
+    app.profile_button.config(text="Ferma Profilazione" if profiler.enabled else "Avvia Profilazione")
+
+def format_duration(seconds):
+    return f"{seconds * 1000:.1f} ms" if seconds < 1 else f"{seconds:.2f} s"
+
+def export_trace_file(app):
+    """Salva la traccia in formato Chrome (apribile con chrome://tracing o Perfetto)."""
+    trace_path = filedialog.asksaveasfilename(title="Esporta traccia", initialfile=os.path.basename(TRACE_PATH),
+                                              defaultextension=".json", filetypes=[("Traccia JSON", "*.json")])
+    if not trace_path:
+        return
+    try:
+        recorder.export_trace(trace_path)
+    except OSError as e:
+        app.show_message(f"Errore: Impossibile esportare la traccia: {e}", "error")
+        return
+    app.show_message(f"Traccia salvata in {trace_path}", "info")
+
+def toggle_profiling(app):
+    """Avvia o ferma cProfile; alla fermata le statistiche vengono salvate e riassunte sul terminale."""
+    if not profiler.enabled:
+        profiler.start()
+        app.show_message("Profilazione avviata: ripeti l'operazione lenta e poi fermala", "info")
+    else:
+        summary = profiler.stop(PROFILE_PATH)
+        print(summary)
+        app.show_message(f"Profilo salvato in {PROFILE_PATH}", "info")
+    refresh_timings(app)
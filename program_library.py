@@ -0,0 +1,186 @@
+import os
+import sqlite3
+from contextlib import closing
+from gcode_parser import parse_gcode
+from program_loader import MappedProgram
+from instrumentation import span
+
+LIBRARY_PATH = os.path.join(os.path.dirname(__file__), '.program_library.sqlite')
+DEFAULT_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+# Da incrementare quando cambia il modo di calcolare le metriche: le analisi precedenti vengono rifatte
+ANALYSIS_VERSION = 1
+# Errore di corda (mm) degli archi nell'analisi: per ingombro e tempo ciclo indicativi bastano corde molto
+# più lunghe di quelle del simulatore, e un programma da un milione di righe resta sotto il gigabyte
+ANALYSIS_ARC_TOLERANCE = 0.05
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS directories (
+    path TEXT PRIMARY KEY
+);
+CREATE TABLE IF NOT EXISTS programs (
+    path TEXT PRIMARY KEY,
+    directory TEXT NOT NULL,
+    name TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    analyzed_mtime_ns INTEGER,
+    line_count INTEGER,
+    xmin REAL, xmax REAL, ymin REAL, ymax REAL,
+    cycle_time REAL,
+    analysis_error TEXT
+);
+CREATE INDEX IF NOT EXISTS programs_name ON programs (name);
+CREATE INDEX IF NOT EXISTS programs_directory ON programs (directory);
+"""
+
+
+class ProgramLibrary:
+    """Indice persistente (SQLite) dei programmi G-code presenti nelle cartelle configurate.
+
+    sync() confronta solo dimensione e mtime dei file, quindi un aggiornamento costa quanto
+    una scansione delle cartelle; le metriche costose (righe, ingombro, tempo ciclo) vengono
+    calcolate da analyze() soltanto per i file nuovi o modificati. Ogni metodo apre la propria
+    connessione, così la libreria può essere usata anche da un thread in background.
+    """
+
+    def __init__(self, database_path=LIBRARY_PATH):
+        self.database_path = database_path
+        with self.connect() as connection:
+            connection.executescript(SCHEMA)
+            if connection.execute("SELECT COUNT(*) FROM directories").fetchone()[0] == 0:
+                connection.execute("INSERT INTO directories (path) VALUES (?)", (DEFAULT_DIRECTORY,))
+            if connection.execute("PRAGMA user_version").fetchone()[0] != ANALYSIS_VERSION:
+                connection.execute("UPDATE programs SET analyzed_mtime_ns = NULL")
+                connection.execute(f"PRAGMA user_version = {ANALYSIS_VERSION}")
+
+    def connect(self):
+        """Apre una connessione che viene chiusa (dopo il commit) all'uscita dal blocco with."""
+        return _Connection(self.database_path)
+
+    def directories(self):
+        with self.connect() as connection:
+            return [row[0] for row in connection.execute("SELECT path FROM directories ORDER BY path")]
+
+    def add_directory(self, directory):
+        with self.connect() as connection:
+            connection.execute("INSERT OR IGNORE INTO directories (path) VALUES (?)", (os.path.abspath(directory),))
+
+    def remove_directory(self, directory):
+        directory = os.path.abspath(directory)
+        with self.connect() as connection:
+            connection.execute("DELETE FROM directories WHERE path = ?", (directory,))
+            connection.execute("DELETE FROM programs WHERE directory = ?", (directory,))
+
+    def sync(self):
+        """Allinea l'indice al contenuto delle cartelle; restituisce True se l'elenco è cambiato."""
+        changed = False
+        with span('library.sync', 'library'), self.connect() as connection:
+            for directory in [row[0] for row in connection.execute("SELECT path FROM directories")]:
+                known = {path: (size, mtime_ns) for path, size, mtime_ns in connection.execute(
+                    "SELECT path, size, mtime_ns FROM programs WHERE directory = ?", (directory,))}
+                try:
+                    entries = [entry for entry in os.scandir(directory)
+                               if entry.name.endswith('.gcode') and entry.is_file()]
+                except OSError:
+                    entries = []
+
+                for entry in entries:
+                    stat = entry.stat()
+                    if known.pop(entry.path, None) != (stat.st_size, stat.st_mtime_ns):
+                        upsert_program(connection, entry.path, directory, stat)
+                        changed = True
+                if known:
+                    connection.executemany("DELETE FROM programs WHERE path = ?", [(path,) for path in known])
+                    changed = True
+        return changed
+
+    def update_file(self, program_path):
+        """Aggiorna l'indice per un solo file (ad esempio appena salvato), senza riscansionare le cartelle."""
+        program_path = os.path.abspath(program_path)
+        with self.connect() as connection:
+            try:
+                stat = os.stat(program_path)
+            except FileNotFoundError:
+                connection.execute("DELETE FROM programs WHERE path = ?", (program_path,))
+                return
+            upsert_program(connection, program_path, os.path.dirname(program_path), stat)
+
+    def pending_analysis(self):
+        """Programmi le cui metriche mancano o si riferiscono a una versione precedente del file."""
+        with self.connect() as connection:
+            return [row[0] for row in connection.execute(
+                "SELECT path FROM programs WHERE analyzed_mtime_ns IS NOT mtime_ns ORDER BY size")]
+
+    def analyze(self, program_path):
+        """Calcola e salva numero di righe, ingombro e tempo ciclo stimato di un programma.
+
+        Gli archi vengono approssimati con ANALYSIS_ARC_TOLERANCE, non con la tolleranza del simulatore.
+
+        Anche un'analisi fallita viene registrata (in analysis_error), così il file non viene
+        rianalizzato a ogni sincronizzazione ma solo quando cambiano dimensione o data di modifica.
+        """
+        from toolpath import compute_toolpath
+        from motion_planner import DEFAULT_LIMITS
+
+        try:
+            stat = os.stat(program_path)
+        except OSError:
+            return False  # Il file è sparito: lo toglierà dall'indice la prossima sincronizzazione
+        try:
+            with span('library.analyze', 'library', path=program_path), MappedProgram(program_path) as program:
+                line_count = len(program)
+                toolpath = compute_toolpath(parse_gcode(program.iter_lines()),
+                                            limits=DEFAULT_LIMITS._replace(arc_tolerance=ANALYSIS_ARC_TOLERANCE))
+        except (OSError, ValueError) as e:
+            metrics, error = (None,) * 6, str(e) or type(e).__name__
+        else:
+            metrics, error = (line_count, *toolpath.bounds(), toolpath.total_time), None
+        with self.connect() as connection:
+            # Se il file è cambiato durante l'analisi il risultato non viene registrato
+            connection.execute(
+                "UPDATE programs SET analyzed_mtime_ns = ?, line_count = ?, xmin = ?, xmax = ?, ymin = ?, ymax = ?, "
+                "cycle_time = ?, analysis_error = ? WHERE path = ? AND size = ? AND mtime_ns = ?",
+                (stat.st_mtime_ns, *metrics, error, program_path, stat.st_size, stat.st_mtime_ns))
+        return error is None
+
+    def search(self, text=""):
+        """Percorsi dei programmi il cui nome contiene text, in ordine alfabetico."""
+        with self.connect() as connection:
+            return [row[0] for row in connection.execute(
+                "SELECT path FROM programs WHERE name LIKE ? ESCAPE '\\' ORDER BY name, path",
+                (f"%{escape_like(text)}%",))]
+
+    def info(self, program_path):
+        """Metadati indicizzati di un programma come dizionario, o None se non è nell'indice."""
+        with self.connect() as connection:
+            connection.row_factory = sqlite3.Row
+            row = connection.execute("SELECT * FROM programs WHERE path = ?", (program_path,)).fetchone()
+            return dict(row) if row is not None else None
+
+
+class _Connection(closing):
+    """Come closing(), ma esegue commit o rollback prima di chiudere."""
+
+    def __init__(self, database_path):
+        super().__init__(sqlite3.connect(database_path, timeout=10))
+
+    def __exit__(self, exc_type, *exc_info):
+        if exc_type is None:
+            self.thing.commit()
+        else:
+            self.thing.rollback()
+        return super().__exit__(exc_type, *exc_info)
+
+
+def upsert_program(connection, program_path, directory, stat):
+    """Inserisce o aggiorna la riga di un programma; le metriche restano da ricalcolare se il file è cambiato."""
+    connection.execute(
+        "INSERT INTO programs (path, directory, name, size, mtime_ns) VALUES (?, ?, ?, ?, ?) "
+        "ON CONFLICT (path) DO UPDATE SET size = excluded.size, mtime_ns = excluded.mtime_ns, "
+        "analyzed_mtime_ns = CASE WHEN size = excluded.size THEN analyzed_mtime_ns END",
+        (program_path, directory, os.path.basename(program_path), stat.st_size, stat.st_mtime_ns))
+
+
+def escape_like(text):
+    """Protegge i caratteri speciali di LIKE nel testo cercato."""
+    return text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
@@ -0,0 +1,167 @@
+import hashlib
+import mmap
+import os
+import time
+import numpy as np
+from atomic_file import atomic_write
+from instrumentation import span
+
+INDEX_DIR = os.path.join(os.path.dirname(__file__), '.line_index')
+INDEX_CHUNK_SIZE = 1 << 26  # 64 MB per passata di numpy
+MAX_INDEX_BYTES = 256 * 1024 * 1024  # 256 MB
+MAX_INDEX_AGE = 30 * 24 * 3600  # 30 giorni
+ENCODING = 'utf-8'
+
+
+def index_path_for(program_path, index_dir=INDEX_DIR):
+    """Percorso del file d'indice di un programma nell'archivio degli indici."""
+    digest = hashlib.sha1(os.path.abspath(program_path).encode()).hexdigest()
+    return os.path.join(index_dir, f"{digest}.idx")
+
+
+def build_line_offsets(buffer):
+    """Calcola in una passata gli offset di inizio di ogni riga più l'offset di fine file."""
+    size = len(buffer)
+    chunks = [np.zeros(1, dtype=np.int64)]
+    for start in range(0, size, INDEX_CHUNK_SIZE):
+        view = np.frombuffer(buffer, dtype=np.uint8, count=min(INDEX_CHUNK_SIZE, size - start), offset=start)
+        chunks.append(np.flatnonzero(view == ord('\n')).astype(np.int64) + start + 1)
+        del view  # Rilascia il buffer prima che il chiamante chiuda la mappatura
+    offsets = np.concatenate(chunks)
+    if offsets[-1] != size:
+        offsets = np.append(offsets, size)
+    return offsets
+
+
+def load_line_offsets(program_path, buffer, index_dir=INDEX_DIR):
+    """Legge l'indice dall'archivio se è ancora valido per il file, altrimenti lo ricostruisce e lo salva.
+
+    L'indice salvato viene mappato in memoria come il programma, quindi non occupa heap
+    (8 byte per riga) finché non se ne leggono le parti che servono.
+    """
+    stat = os.stat(program_path)
+    index_path = index_path_for(program_path, index_dir)
+    try:
+        stored = np.memmap(index_path, dtype=np.int64, mode='r')
+        if len(stored) >= 3 and stored[0] == stat.st_size and stored[1] == stat.st_mtime_ns:
+            os.utime(index_path)  # Aggiorna l'ultimo accesso per l'eviction LRU
+            return stored[2:]
+        del stored  # Indice scaduto: va chiuso prima di sostituirlo
+    except (OSError, ValueError):
+        pass
+
+    offsets = build_line_offsets(buffer)
+    try:
+        os.makedirs(index_dir, exist_ok=True)
+        temporary_path = f"{index_path}.{os.getpid()}.tmp"
+        np.concatenate(([stat.st_size, stat.st_mtime_ns], offsets)).astype(np.int64).tofile(temporary_path)
+        os.replace(temporary_path, index_path)
+        prune_line_index(index_dir)
+    except OSError:
+        pass  # Senza archivio l'indice resta valido per questa apertura
+    return offsets
+
+
+def prune_line_index(index_dir=INDEX_DIR, max_bytes=MAX_INDEX_BYTES, max_age=MAX_INDEX_AGE):
+    """Rimuove gli indici non usati da max_age e poi i meno usati finché l'archivio supera max_bytes.
+
+    I file portano l'hash del percorso del programma, quindi un indice di un programma cancellato o
+    spostato non viene più aperto e finisce eliminato per età o per spazio.
+    """
+    now = time.time()
+    entries = []
+    removed = []
+    for entry in os.scandir(index_dir):
+        try:
+            stat = entry.stat()
+            if now - stat.st_mtime > max_age:
+                os.remove(entry.path)
+                removed.append(entry.name)
+            elif entry.name.endswith('.idx'):
+                entries.append((stat.st_mtime, entry.path, stat.st_size))
+        except OSError:
+            pass  # Ancora aperto (Windows) o già rimosso da un altro processo
+
+    total = sum(size for _, _, size in entries)
+    for _, path, size in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        removed.append(os.path.basename(path))
+        total -= size
+    return removed
+
+
+class MappedProgram:
+    """Programma G-code mappato in memoria e servito per intervalli di righe.
+
+    Si comporta come una sequenza di righe senza terminatore (len, indice, slice), quindi può alimentare
+    direttamente il parser, la lista virtualizzata del simulatore e l'editor.
+    """
+
+    def __init__(self, program_path, index_dir=INDEX_DIR):
+        self.program_path = program_path
+        self._file = open(program_path, 'rb')
+        size = os.fstat(self._file.fileno()).st_size
+        # Un file vuoto non si può mappare: lo si tratta come un buffer vuoto
+        self._buffer = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b''
+        with span('file.read', 'io', path=program_path, size=size):
+            self.offsets = load_line_offsets(program_path, self._buffer, index_dir) if size else np.zeros(1, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            start, stop, step = key.indices(len(self))
+            if step != 1:
+                return [self[row] for row in range(start, stop, step)]
+            return self.lines(start, stop)
+        if key < 0:
+            key += len(self)
+        if not 0 <= key < len(self):
+            raise IndexError("riga fuori dal programma")
+        return self._buffer[self.offsets[key]:self.offsets[key + 1]].decode(ENCODING, errors='replace').rstrip('\n')
+
+    def __iter__(self):
+        return self.iter_lines()
+
+    def text(self, start, stop):
+        """Testo delle righe [start, stop) come unica stringa."""
+        start = max(0, min(start, len(self)))
+        stop = max(start, min(stop, len(self)))
+        return self._buffer[self.offsets[start]:self.offsets[stop]].decode(ENCODING, errors='replace')
+
+    def lines(self, start, stop):
+        """Righe [start, stop) come lista di stringhe, senza il terminatore '\\n'."""
+        lines = self.text(start, stop).split('\n')
+        if lines[-1] == '':
+            lines.pop()  # Il testo termina con '\n': non c'è una riga in più
+        return lines
+
+    def iter_lines(self, start=0, stop=None, chunk_lines=65536):
+        """Scorre le righe a blocchi, senza mai decodificare l'intero file."""
+        stop = len(self) if stop is None else min(stop, len(self))
+        for chunk_start in range(start, stop, chunk_lines):
+            yield from self.lines(chunk_start, min(chunk_start + chunk_lines, stop))
+
+    def close(self):
+        if isinstance(self._buffer, mmap.mmap):
+            self._buffer.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def write_program(program_path, chunks):
+    """Scrive un programma a blocchi sostituendo l'originale in modo atomico (vedi atomic_write)."""
+    with span('file.write', 'io', path=program_path), atomic_write(program_path, encoding=ENCODING) as file:
+        for chunk in chunks:
+            file.write(chunk)
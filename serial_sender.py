@@ -0,0 +1,425 @@
+import itertools
+import os
+import queue
+import select
+import threading
+import time
+from collections import deque
+from gcode_parser import iter_instructions, has_value, OP_G1, OP_G2, OP_G3
+from gcode_translator import ARDUINO_FUNCTIONS, TABLE_BLINK, TABLE_PIN, TABLE_ANALOG_PIN, encode_argument
+from upload_pipeline import UploadCancelled, DEFAULT_PORT
+from instrumentation import span, count, mark, profiler
+
+DEFAULT_BAUDRATE = 115200
+RX_BUFFER_SIZE = 64  # Buffer di ricezione della seriale hardware dell'Arduino Uno
+COMMAND_QUEUE_LENGTH = 8
+LINE_LENGTH = 48
+
+FLOW_COUNT = 'count'
+FLOW_ACK = 'ack'
+FLOW_CONTROLS = (FLOW_COUNT, FLOW_ACK)
+
+READ_INTERVAL = 0.1
+# Silenzio ammesso oltre la durata del comando più lungo che il dispositivo può avere in esecuzione:
+# mentre un comando gira il firmware non risponde, quindi quella durata si aggiunge sempre all'attesa
+ACK_TIMEOUT = 5.0
+STARTUP_TIMEOUT = 5.0
+PING_INTERVAL = 0.5
+PROGRESS_INTERVAL = 0.5
+
+FIRMWARE_SKETCH_PATH = os.path.join(os.path.dirname(__file__), 'streaming_firmware', 'streaming_firmware.ino')
+
+# Interprete fisso: riceve le istruzioni come righe di testo e risponde "ok" quando ciascuna entra
+# nella coda dei comandi. L'host tiene il buffer di ricezione pieno senza mai farlo traboccare.
+STREAMING_INTERPRETER = """
+#define QUEUE_LENGTH %d
+#define LINE_LENGTH %d
+
+struct Command {
+  uint8_t code;
+  int args[3];
+};
+
+Command commandQueue[QUEUE_LENGTH];
+uint8_t queueHead = 0;
+uint8_t queueCount = 0;
+char line[LINE_LENGTH];
+uint8_t lineLength = 0;
+
+// Riconosce righe del tipo "G1 X3 Y1 Z1": restituisce false se la riga non è eseguibile
+bool parseLine(const char *text, Command &command) {
+  int values[3] = {0, 0, 0};
+  bool seen[3] = {false, false, false};
+  long g = -1;
+  const char *p = text;
+  while (*p) {
+    char letter = *p++;
+    if (letter == ' ') {
+      continue;
+    }
+    char *end;
+    long value = strtol(p, &end, 10);
+    if (end == p) {
+      return false;
+    }
+    p = end;
+    if (letter == 'G') {
+      g = value;
+    } else if (letter >= 'X' && letter <= 'Z') {
+      values[letter - 'X'] = value;
+      seen[letter - 'X'] = true;
+    } else {
+      return false;
+    }
+  }
+  if (g == 1 && seen[0] && seen[1] && seen[2]) {
+    command.code = %d;
+  } else if (g == 2 && seen[0] && seen[1]) {
+    command.code = %d;
+  } else if (g == 3 && seen[0] && seen[1]) {
+    command.code = %d;
+  } else {
+    return false;
+  }
+  for (uint8_t i = 0; i < 3; i++) {
+    command.args[i] = values[i];
+  }
+  return true;
+}
+
+void receiveLines() {
+  while (queueCount < QUEUE_LENGTH && Serial.available()) {
+    char c = Serial.read();
+    if (c == '\\r') {
+      continue;
+    }
+    if (c != '\\n') {
+      if (lineLength < LINE_LENGTH - 1) {
+        line[lineLength++] = c;
+      }
+      continue;
+    }
+    line[lineLength] = '\\0';
+    if (lineLength == 0) {
+      Serial.println("ok");  // Riga vuota: usata dall'host per attendere l'avvio
+    } else if (parseLine(line, commandQueue[(queueHead + queueCount) %% QUEUE_LENGTH])) {
+      queueCount++;
+      Serial.println("ok");
+    } else {
+      Serial.println("error");
+    }
+    lineLength = 0;
+  }
+}
+
+void execute(const Command &command) {
+  if (command.code == %d) {
+    blink(command.args[0], command.args[1], command.args[2]);
+  } else if (command.code == %d) {
+    turnOnPin(command.args[0], command.args[1]);
+  } else if (command.code == %d) {
+    turnOnAnalogPin(command.args[0], command.args[1]);
+  }
+}
+
+void loop() {
+  receiveLines();
+  if (queueCount > 0) {
+    Command command = commandQueue[queueHead];
+    queueHead = (queueHead + 1) %% QUEUE_LENGTH;
+    queueCount--;
+    execute(command);
+  }
+}
+""" % (COMMAND_QUEUE_LENGTH, LINE_LENGTH, TABLE_BLINK, TABLE_PIN, TABLE_ANALOG_PIN,
+       TABLE_BLINK, TABLE_PIN, TABLE_ANALOG_PIN)
+
+STREAMING_FIRMWARE = ARDUINO_FUNCTIONS + STREAMING_INTERPRETER
+
+
+class DeviceError(Exception):
+    """Sollevata quando il dispositivo rifiuta una riga o smette di rispondere."""
+
+
+def write_streaming_firmware(arduino_file_path=FIRMWARE_SKETCH_PATH):
+    """Scrive lo sketch del firmware di streaming, da compilare e caricare una sola volta."""
+    os.makedirs(os.path.dirname(arduino_file_path), exist_ok=True)
+    with open(arduino_file_path, 'w') as arduino_file:
+        arduino_file.write(STREAMING_FIRMWARE)
+    return arduino_file_path
+
+
+def command_duration(code, args):
+    """Secondi per cui il firmware resta bloccato su un comando, come lo eseguono le funzioni dello sketch.
+
+    blink(x, y, z) ripete x volte y + z secondi, turnOnPin e turnOnAnalogPin attendono il secondo argomento;
+    un ciclo o un delay con valori negativi non attende.
+    """
+    if code == TABLE_BLINK:
+        return max(0, args[0] * (args[1] + args[2]))
+    return max(0, args[1])
+
+
+def iter_stream_lines(instructions):
+    """Produce (numero di riga, bytes, durata) per ogni istruzione eseguibile, come le tradurrebbe lo sketch compilato.
+
+    La durata è quella dell'esecuzione sul firmware (command_duration), non del movimento pianificato.
+    """
+    for instruction in instructions:
+        opcode = instruction.opcode
+        if opcode == OP_G1:
+            arguments = (('X', instruction.x), ('Y', instruction.y), ('Z', instruction.z))
+        elif opcode in (OP_G2, OP_G3):
+            arguments = (('X', instruction.x), ('Y', instruction.y))
+        else:
+            continue
+        if not all(has_value(value) for _, value in arguments):
+            continue
+        for _, value in arguments:
+            encode_argument(value, instruction.line_number)  # Stessi limiti int16 della tabella PROGMEM
+        values = [int(value) for _, value in arguments]
+        words = ' '.join(f"{letter}{value}" for (letter, _), value in zip(arguments, values))
+        code = TABLE_BLINK if opcode == OP_G1 else TABLE_PIN
+        yield instruction.line_number, f"G{opcode} {words}\n".encode('ascii'), command_duration(code, values)
+
+
+class SerialConnection:
+    """Collegamento seriale minimo: usa pyserial se è installato, altrimenti apre il terminale POSIX in modalità raw.
+
+    Il ripiego senza pyserial funziona con porte reali e pseudo-terminali su Linux e macOS.
+    """
+
+    def __init__(self, port, baudrate=DEFAULT_BAUDRATE):
+        self._buffer = bytearray()
+        self._serial = None
+        self._fd = None
+        try:
+            import serial
+        except ImportError:
+            serial = None
+        if serial is not None:
+            self._serial = serial.Serial(port, baudrate, timeout=0)
+            return
+        try:
+            import termios
+            import tty
+        except ImportError:
+            raise OSError("Il modulo pyserial è necessario per usare la porta seriale su questo sistema") from None
+        self._fd = os.open(port, os.O_RDWR | os.O_NOCTTY)
+        try:
+            tty.setraw(self._fd)
+            speed = getattr(termios, f"B{baudrate}", None)
+            if speed is not None:
+                attributes = termios.tcgetattr(self._fd)
+                attributes[4] = attributes[5] = speed
+                termios.tcsetattr(self._fd, termios.TCSANOW, attributes)
+        except termios.error:
+            pass  # Uno pseudo-terminale non sempre accetta la velocità: non serve
+        except BaseException:
+            os.close(self._fd)
+            raise
+
+    def write(self, data):
+        if self._serial is not None:
+            self._serial.write(data)
+            return
+        view = memoryview(data)
+        while view:
+            view = view[os.write(self._fd, view):]
+
+    def read(self, timeout):
+        """Legge i byte disponibili, attendendo al più timeout secondi; b'' se non è arrivato nulla."""
+        if self._serial is not None:
+            self._serial.timeout = timeout
+            return self._serial.read(max(1, self._serial.in_waiting))
+        ready, _, _ = select.select([self._fd], [], [], timeout)
+        return os.read(self._fd, 4096) if ready else b''
+
+    def readline(self, timeout):
+        """Restituisce la prossima riga ricevuta senza terminatore, o None se non è completa entro timeout."""
+        deadline = time.monotonic() + timeout
+        while b'\n' not in self._buffer:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            self._buffer += self.read(remaining)
+        line, _, rest = bytes(self._buffer).partition(b'\n')
+        self._buffer = bytearray(rest)
+        return line.decode('ascii', errors='replace').strip()
+
+    def close(self):
+        if self._serial is not None:
+            self._serial.close()
+        elif self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class StreamJob:
+    """Invio di un programma al firmware di streaming, senza compilazione né caricamento dello sketch.
+
+    Come UploadJob pubblica tuple (tipo, messaggio) sulla coda events, quindi può girare sullo stesso
+    pool di thread ed essere seguito dall'interfaccia con lo stesso ciclo di polling.
+    Con FLOW_COUNT l'host tiene in volo tante righe quante ne entrano nel buffer di ricezione del
+    dispositivo (conteggio dei caratteri); con FLOW_ACK attende la conferma di ogni riga prima della successiva.
+    Prima di collegarsi l'intero programma viene codificato e controllato, senza tenerlo in memoria: una riga
+    non valida blocca l'invio prima che la macchina esegua qualcosa. La stessa passata somma le durate dei
+    comandi sul firmware, da cui l'avanzamento ricava il tempo di lavorazione rimanente.
+    """
+
+    def __init__(self, program_path, port=DEFAULT_PORT, baudrate=DEFAULT_BAUDRATE, flow=FLOW_COUNT,
+                 rx_buffer_size=RX_BUFFER_SIZE, ack_timeout=ACK_TIMEOUT):
+        if flow not in FLOW_CONTROLS:
+            raise ValueError(f"Controllo di flusso sconosciuto: {flow}")
+        self.program_path = program_path
+        self.port = port
+        self.baudrate = baudrate
+        self.flow = flow
+        self.rx_buffer_size = rx_buffer_size
+        self.ack_timeout = ack_timeout
+        self.events = queue.Queue()
+        self.timings = {}
+        self.lines_sent = 0
+        self.total_duration = 0
+        self.sent_duration = 0
+        # Durate dei comandi già confermati che possono essere ancora nella coda del dispositivo
+        self._queued_durations = deque(maxlen=COMMAND_QUEUE_LENGTH)
+        self._cancelled = threading.Event()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def emit(self, kind, message):
+        if kind == 'error':
+            mark('error', 'stream', message=message)
+        self.events.put((kind, message))
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def check_cancelled(self):
+        if self.cancelled:
+            raise UploadCancelled()
+
+    def wait_for_device(self, connection):
+        """Attende che il firmware risponda (la scheda si riavvia all'apertura della porta) e scarta le risposte in eccesso."""
+        deadline = time.monotonic() + STARTUP_TIMEOUT
+        while True:
+            self.check_cancelled()
+            if time.monotonic() > deadline:
+                raise DeviceError(f"Il dispositivo su {self.port} non risponde")
+            connection.write(b'\n')
+            if connection.readline(PING_INTERVAL) == 'ok':
+                break
+        while connection.readline(PING_INTERVAL) is not None:
+            pass
+
+    def busy_time(self, in_flight):
+        """Durata del comando più lungo che il dispositivo può avere in esecuzione mentre si attende una risposta."""
+        return max(itertools.chain(self._queued_durations, (duration for _, _, duration in in_flight)), default=0)
+
+    def wait_ack(self, connection, in_flight):
+        """Attende la risposta alla riga in volo più vecchia e ne restituisce la lunghezza.
+
+        Se il dispositivo resta in silenzio più a lungo del comando più lungo che può star eseguendo, più
+        ack_timeout secondi, è considerato scollegato o bloccato e viene sollevato DeviceError.
+        """
+        last_response = time.monotonic()
+        while True:
+            self.check_cancelled()
+            response = connection.readline(READ_INTERVAL)
+            if response is None or response == '':
+                silence = time.monotonic() - last_response
+                # La durata dei comandi si calcola solo quando il silenzio supera già ack_timeout
+                if silence > self.ack_timeout and silence > self.ack_timeout + self.busy_time(in_flight):
+                    raise DeviceError(f"Il dispositivo su {self.port} non risponde da {silence:.0f}s "
+                                      f"(riga {in_flight[0][0]} in attesa di conferma)")
+                continue
+            last_response = time.monotonic()
+            if response == 'ok':
+                _, length, duration = in_flight.popleft()
+                self._queued_durations.append(duration)
+                return length
+            if response.startswith('error'):
+                raise DeviceError(f"Il dispositivo ha rifiutato la riga {in_flight[0][0]}: {response}")
+            self.emit('info', response)
+
+    def stream(self, connection, lines):
+        """Invia le righe (numero, bytes, durata) tenendo in volo al più rx_buffer_size caratteri non confermati."""
+        in_flight = deque()
+        buffered = 0
+        last_progress = time.monotonic()
+        for line_number, line, duration in lines:
+            if len(line) > min(self.rx_buffer_size, LINE_LENGTH):
+                raise ValueError(f"La riga {line_number} è troppo lunga per il buffer del dispositivo")
+            while in_flight and (self.flow == FLOW_ACK or buffered + len(line) > self.rx_buffer_size):
+                buffered -= self.wait_ack(connection, in_flight)
+            connection.write(line)
+            in_flight.append((line_number, len(line), duration))
+            buffered += len(line)
+            self.lines_sent += 1
+            self.sent_duration += duration
+            if time.monotonic() - last_progress >= PROGRESS_INTERVAL:
+                last_progress = time.monotonic()
+                self.emit('progress', f"Inviata la riga {line_number} ({self.lines_sent} istruzioni), "
+                                      f"circa {self.remaining_time():.0f}s di lavorazione rimanenti")
+        while in_flight:
+            buffered -= self.wait_ack(connection, in_flight)
+
+    def remaining_time(self):
+        """Secondi di esecuzione sul firmware dei comandi non ancora inviati (più quelli ancora in coda)."""
+        return self.total_duration - self.sent_duration
+
+    def iter_program_lines(self, file):
+        return iter_stream_lines(iter_instructions(file))
+
+    def check_program(self):
+        """Codifica e controlla l'intero programma senza inviarlo; restituisce (istruzioni, durata totale).
+
+        Solleva ValueError alla prima riga non trasmissibile, prima di toccare il dispositivo.
+        """
+        with span('check', 'stream') as timer, open(self.program_path, 'r') as file:
+            lines = 0
+            total_duration = 0
+            for line_number, line, duration in self.iter_program_lines(file):
+                if len(line) > min(self.rx_buffer_size, LINE_LENGTH):
+                    raise ValueError(f"La riga {line_number} è troppo lunga per il buffer del dispositivo")
+                lines += 1
+                total_duration += duration
+        self.timings['check'] = timer.duration
+        return lines, total_duration
+
+    def run(self):
+        """Esegue l'invio completo; restituisce True se il dispositivo ha accettato tutte le istruzioni."""
+        success = False
+        try:
+            if not os.path.isfile(self.program_path):
+                self.emit('error', f"Errore: Il file {self.program_path} non esiste.")
+                return False
+            with profiler.profiled(), span('stream_job', 'job', program=self.program_path):
+                lines, self.total_duration = self.check_program()
+                self.emit('info', f"{lines} istruzioni da inviare, circa {self.total_duration}s di lavorazione")
+                with span('stream', 'stream', port=self.port, flow=self.flow) as timer:
+                    with SerialConnection(self.port, self.baudrate) as connection, open(self.program_path, 'r') as file:
+                        self.emit('info', f"Connessione a {self.port} in corso...")
+                        self.wait_for_device(connection)
+                        self.emit('info', f"Invio in streaming su {self.port} in corso...")
+                        self.stream(connection, self.iter_program_lines(file))
+                count('lines_streamed', self.lines_sent)
+            self.timings['stream'] = timer.duration
+            self.emit('info', f"Programma inviato: {self.lines_sent} istruzioni in {self.timings['stream']:.1f}s")
+            success = True
+        except UploadCancelled:
+            self.emit('error', "Invio annullato")
+        except Exception as e:
+            self.emit('error', f"Errore: Impossibile inviare il programma: {e}")
+        finally:
+            self.emit('done', success)
+        return success
@@ -1,7 +1,19 @@
+import bisect
+import time
 import tkinter as tk
 from tkinter import ttk
-import matplotlib.pyplot as plt
-import math
+import numpy as np
+from gcode_parser import parse_gcode, OP_G0, OP_G1, OP_M30
+from toolpath import compute_toolpath, START_POSITION
+from gcode_view import VirtualListView
+from program_loader import MappedProgram
+from instrumentation import span, count
+
+FRAME_INTERVAL_MS = 30
+DEFAULT_VIEW = (0, 35, -20, 20)
+ZOOM_STEP = 1.25
+MAX_SPEED = 1000
+SPEED_CHOICES = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
 
 def prepare_simulation(app):
     """Prepara la simulazione delle istruzioni G-code."""
@@ -10,23 +22,25 @@ def prepare_simulation(app):
         app.show_message("Errore: Nessun programma selezionato", "error")
         return
 
-    program_path = app.program_listbox.get(selected_program_index)
+    program_path = app.program_listbox.get(selected_program_index[0])
     if not program_path.endswith('.gcode'):
         app.show_message("Errore: Seleziona un file G-code", "error")
         return
 
     app.clear_left_frame()
+    stop_frames(app)
 
-    # Mostra le istruzioni G-code
-    with open(program_path, 'r') as file:
-        gcode_instructions = file.readlines()
+    # Mostra le istruzioni G-code: il file resta mappato e la lista ne legge solo le righe visibili
+    close_mapped_program(app)
+    with span('simulation.prepare', 'ui', path=program_path):
+        app.mapped_program = MappedProgram(program_path)
+        app.gcode_program = parse_gcode(app.mapped_program.iter_lines())
+        app.toolpath = compute_toolpath(app.gcode_program)
 
-    app.gcode_listbox = tk.Listbox(app.left_frame)
+    app.gcode_listbox = VirtualListView(app.left_frame, app.mapped_program)
     app.gcode_listbox.pack(padx=10, pady=10, fill="both", expand=True)
-    for instruction in gcode_instructions:
-        app.gcode_listbox.insert(tk.END, instruction.strip())
 
-    app.start_simulation_button = ttk.Button(app.left_frame, text="Avvia Simulazione", command=lambda: simulate_program(app, gcode_instructions))
+    app.start_simulation_button = ttk.Button(app.left_frame, text="Avvia Simulazione", command=lambda: simulate_program(app, app.gcode_program))
     app.start_simulation_button.pack(pady=10)
 
     app.step_simulation_button = ttk.Button(app.left_frame, text="Esegui Istruzione", command=lambda: step_simulation(app))
@@ -38,10 +52,27 @@ def prepare_simulation(app):
     app.resume_simulation_button = ttk.Button(app.left_frame, text="Riprendi", command=lambda: resume_simulation(app))
     app.resume_simulation_button.pack(pady=10)
 
+    ttk.Label(app.left_frame, text="Velocità (x)").pack()
+    app.speed_var = tk.StringVar(value="1")
+    app.speed_var.trace_add('write', lambda *args: on_speed_change(app))
+    app.speed_spinbox = ttk.Spinbox(app.left_frame, values=SPEED_CHOICES, textvariable=app.speed_var, width=8)
+    app.speed_spinbox.pack(pady=10)
+
+    app.seek_scale = ttk.Scale(app.left_frame, from_=0, to=max(len(app.gcode_program) - 1, 0), orient="horizontal",
+                               command=lambda value: seek_simulation(app, int(float(value))))
+    app.seek_scale.pack(padx=10, pady=5, fill="x")
+
+    seek_frame = ttk.Frame(app.left_frame)
+    seek_frame.pack(pady=5)
+    app.seek_entry = ttk.Entry(seek_frame, width=12)
+    app.seek_entry.pack(side="left")
+    ttk.Button(seek_frame, text="Vai a", command=lambda: seek_from_entry(app)).pack(side="left", padx=5)
+
     app.back_button = ttk.Button(app.left_frame, text="Indietro", command=app.cancel_new_program)
     app.back_button.pack(pady=10)
 
-    app.show_message("Premi 'Avvia Simulazione' per iniziare o 'Esegui Istruzione' per eseguire un'istruzione alla volta.")
+    app.show_message("Premi 'Avvia Simulazione' per iniziare o 'Esegui Istruzione' per eseguire un'istruzione alla volta. "
+                     f"Tempo ciclo stimato: {app.toolpath.total_time:.1f}s")
 
     # Inizializza l'indice dell'istruzione corrente e la posizione
     reset_simulation(app)
@@ -50,160 +81,309 @@ def prepare_simulation(app):
     app.show_graph()
     initialize_graph(app)
 
+def close_mapped_program(app):
+    """Chiude la mappatura del programma simulato, così il file può essere riscritto."""
+    if app.mapped_program is not None:
+        app.mapped_program.close()
+        app.mapped_program = None
+
+def stop_frames(app):
+    """Interrompe il ciclo dei fotogrammi, se attivo."""
+    if app.frame_job is not None:
+        app.root.after_cancel(app.frame_job)
+        app.frame_job = None
+
 def reset_simulation(app):
     """Resetta la simulazione alle impostazioni iniziali."""
+    stop_frames(app)
+    app.sim_time = 0.0
+    app.stop_time = 0.0
+    app.stepping = False
     app.current_instruction_index = 0
-    app.current_position = [30, -10]  # Posizione iniziale
+    app.current_position = list(START_POSITION)  # Posizione iniziale
     app.simulation_paused = False
     initialize_graph(app)
     deselect_all_instructions(app)
 
 def initialize_graph(app):
     """Inizializza il grafico."""
+    from matplotlib.patches import Polygon
+
     app.ax.clear()
     app.ax.set_xlabel("X")
     app.ax.set_ylabel("Y")
-    app.ax.set_xlim([0, 35])
-    app.ax.set_ylim([-20, 20])
-    triangle = [[30, -10], [30-1, -10-1], [30+1, -10-1]]
-    app.ax.add_patch(plt.Polygon(triangle, closed=True, color='green'))
-    app.canvas.draw()
+    set_view_to_toolpath(app)
+    x0, y0 = START_POSITION
+    triangle = [[x0, y0], [x0-1, y0-1], [x0+1, y0-1]]
+    app.ax.add_patch(Polygon(triangle, closed=True, color='green'))
+    create_path_artists(app)
+    if app.draw_event_id is None:
+        app.draw_event_id = app.canvas.mpl_connect('draw_event', lambda event: on_canvas_draw(app))
+        app.canvas.mpl_connect('scroll_event', lambda event: on_scroll(app, event))
+    with span('canvas.draw', 'ui'):
+        app.canvas.draw()
+
+def set_view_to_toolpath(app):
+    """Adatta gli assi al percorso utensile, mantenendo almeno l'area di lavoro predefinita."""
+    xmin, xmax, ymin, ymax = DEFAULT_VIEW
+    if len(app.toolpath):
+        path_xmin, path_xmax, path_ymin, path_ymax = app.toolpath.bounds()
+        margin = max(path_xmax - path_xmin, path_ymax - path_ymin) * 0.05
+        xmin, xmax = min(xmin, path_xmin - margin), max(xmax, path_xmax + margin)
+        ymin, ymax = min(ymin, path_ymin - margin), max(ymax, path_ymax + margin)
+    app.ax.set_xlim([xmin, xmax])
+    app.ax.set_ylim([ymin, ymax])
+
+def create_path_artists(app):
+    """Crea il numero fisso di artisti usati per disegnare il percorso, aggiornati poi con set_data."""
+    app.rapid_path, = app.ax.plot([], [], 'ro-', animated=True)
+    app.feed_path, = app.ax.plot([], [], 'bo-', animated=True)
+    app.rapid_segment, = app.ax.plot([], [], 'ro-', animated=True)
+    app.feed_segment, = app.ax.plot([], [], 'bo-', animated=True)
+    app.completed_segments = 0
+    app.background = None
+
+def on_canvas_draw(app):
+    """Dopo ogni ridisegno completo ridisegna il percorso eseguito e salva lo sfondo per il blitting."""
+    if app.rapid_path.axes is not app.ax:
+        return
+    with span('draw', 'ui', segments=app.completed_segments):
+        view, size = current_view(app)
+        app.rapid_path.set_data(*app.toolpath.polyline(OP_G0, app.completed_segments, view=view, size=size))
+        app.feed_path.set_data(*app.toolpath.polyline(OP_G1, app.completed_segments, view=view, size=size))
+        app.ax.draw_artist(app.rapid_path)
+        app.ax.draw_artist(app.feed_path)
+        app.background = app.canvas.copy_from_bbox(app.ax.bbox)
+
+def current_view(app):
+    """Limiti visibili degli assi e dimensione in pixel dell'area del grafico."""
+    xmin, xmax = app.ax.get_xlim()
+    ymin, ymax = app.ax.get_ylim()
+    return (xmin, xmax, ymin, ymax), (app.ax.bbox.width, app.ax.bbox.height)
+
+def on_scroll(app, event):
+    """Zoom con la rotella attorno al punto indicato: il ridisegno completo rifinisce il dettaglio del percorso."""
+    if event.inaxes is not app.ax:
+        return
+    factor = 1 / ZOOM_STEP if event.button == 'up' else ZOOM_STEP
+    xmin, xmax = app.ax.get_xlim()
+    ymin, ymax = app.ax.get_ylim()
+    app.ax.set_xlim(event.xdata - (event.xdata - xmin) * factor, event.xdata + (xmax - event.xdata) * factor)
+    app.ax.set_ylim(event.ydata - (event.ydata - ymin) * factor, event.ydata + (ymax - event.ydata) * factor)
+    app.canvas.draw_idle()
+
+def segment_artist(app, segment):
+    """Restituisce l'artista usato per il segmento in corso (rapido o in lavoro)."""
+    return app.rapid_segment if app.toolpath.opcodes[segment] == OP_G0 else app.feed_segment
+
+def draw_segment_frame(app, segment, x, y):
+    """Disegna il segmento in corso fino al punto (x, y) sopra lo sfondo salvato."""
+    if app.background is None:
+        app.canvas.draw()
+    artist = segment_artist(app, segment)
+    artist.set_data([app.toolpath.x[segment], x], [app.toolpath.y[segment], y])
+    app.canvas.restore_region(app.background)
+    app.ax.draw_artist(artist)
+    app.canvas.blit(app.ax.bbox)
+
+def commit_segments(app, stop):
+    """Integra nello sfondo i segmenti completati fino a stop, così i fotogrammi successivi non li ridisegnano."""
+    if app.background is None:
+        app.canvas.draw()
+    start = app.completed_segments
+    view, size = current_view(app)
+    app.canvas.restore_region(app.background)
+    for opcode, artist in ((OP_G0, app.rapid_segment), (OP_G1, app.feed_segment)):
+        artist.set_data(*app.toolpath.polyline(opcode, stop, start, view=view, size=size))
+        app.ax.draw_artist(artist)
+    app.background = app.canvas.copy_from_bbox(app.ax.bbox)
+    app.completed_segments = stop
+    app.canvas.blit(app.ax.bbox)
 
 def deselect_all_instructions(app):
     """Deseleziona tutte le istruzioni nella listbox."""
-    for i in range(app.gcode_listbox.size()):
-        app.gcode_listbox.itemconfig(i, {'bg':'white'})
+    app.gcode_listbox.clear_highlight()
 
-def simulate_program(app, gcode_instructions):
+def simulate_program(app, gcode_program):
     """Simula tutte le istruzioni G-code sul grafico."""
     reset_simulation(app)
-    app.gcode_instructions = gcode_instructions
-    execute_next_instruction(app)
+    if gcode_program is not app.gcode_program:
+        app.gcode_program = gcode_program
+        app.toolpath = compute_toolpath(gcode_program)
+    app.stepping = False
+    start_clock(app, app.toolpath.total_time)
 
-def execute_next_instruction(app):
-    """Esegue la prossima istruzione G-code."""
-    if app.simulation_paused:
+def step_simulation(app):
+    """Esegue un'istruzione G-code alla volta sul grafico."""
+    if app.frame_job is not None:
         return
-
-    if app.current_instruction_index >= len(app.gcode_instructions):
-        app.show_message("Simulazione completata")
+    program = app.gcode_program
+    index = app.current_instruction_index
+    if index >= len(program):
+        app.show_message("Tutte le istruzioni sono state eseguite")
+        reset_simulation(app)
         return
 
-    # Deseleziona l'istruzione precedente
-    if app.current_instruction_index > 0:
-        app.gcode_listbox.itemconfig(app.current_instruction_index - 1, {'bg':'white'})
-
-    instruction = app.gcode_instructions[app.current_instruction_index].strip()
-    app.gcode_listbox.itemconfig(app.current_instruction_index, {'bg':'yellow'})  # Evidenzia l'istruzione corrente
-    app.canvas.draw()
-    app.root.update()
-
-    x, y = app.current_position
-    x, y, duration, feed_rate = execute_gcode_instruction(app, instruction, x, y)
-
-    if instruction.startswith('G00') or instruction.startswith('G01'):
-        if instruction.startswith('G00'):
-            draw_line(app, app.current_position, [x, y], 'ro-')
-        else:
-            draw_line_with_speed(app, app.current_position, [x, y], 'bo-', duration, feed_rate)
-        app.current_position = [x, y]
-        app.canvas.draw()
-        app.show_message(f"Eseguendo: {instruction}")
-
-    app.current_instruction_index += 1
-
-    if instruction.startswith('M30'):
+    highlight_instruction(app, index)
+    if program.opcodes[index] == OP_M30:
         app.show_message("Simulazione completata")
-        return
-
-    # Usa after per eseguire la prossima istruzione dopo la durata calcolata
-    app.root.after(int(duration * 1000), lambda: execute_next_instruction(app))
-
-def step_simulation(app):
-    """Esegue un'istruzione G-code alla volta sul grafico."""
-    if app.current_instruction_index >= app.gcode_listbox.size():
-        app.show_message("Tutte le istruzioni sono state eseguite")
         reset_simulation(app)
         return
 
-    # Deseleziona l'istruzione precedente
-    if app.current_instruction_index > 0:
-        app.gcode_listbox.itemconfig(app.current_instruction_index - 1, {'bg':'white'})
+    segment = app.toolpath.segment_for_instruction(index)
+    app.stepping = True
+    app.step_segment = segment
+    app.current_instruction_index = index + 1
+    if segment >= 0:
+        # Il movimento viene animato dal ciclo dei fotogrammi, che si ferma alla fine del segmento
+        start_clock(app, float(app.toolpath.end_times[segment]))
 
-    instruction = app.gcode_listbox.get(app.current_instruction_index).strip()
-    app.gcode_listbox.itemconfig(app.current_instruction_index, {'bg':'yellow'})  # Evidenzia l'istruzione corrente
-    app.canvas.draw()
-    app.root.update()
+def start_clock(app, stop_time):
+    """Avvia (o riallinea) l'orologio della simulazione e il ciclo dei fotogrammi fino a stop_time."""
+    app.simulation_paused = False
+    app.stop_time = stop_time
+    app.clock_origin = (time.monotonic(), app.sim_time)
+    if app.frame_job is None:
+        render_frame(app)
+
+def simulation_speed(app):
+    """Moltiplicatore di velocità scelto dall'operatore."""
+    try:
+        return max(1, min(MAX_SPEED, int(app.speed_var.get())))
+    except (tk.TclError, ValueError):
+        return 1
+
+def current_sim_time(app):
+    """Tempo simulato corrispondente all'istante attuale dell'orologio monotono."""
+    wall_start, sim_start = app.clock_origin
+    return min(app.stop_time, sim_start + (time.monotonic() - wall_start) * simulation_speed(app))
+
+def on_speed_change(app):
+    """Riallinea l'orologio quando cambia il moltiplicatore, senza salti del tempo simulato."""
+    if app.frame_job is not None:
+        app.sim_time = current_sim_time(app)
+        app.clock_origin = (time.monotonic(), app.sim_time)
+
+def render_frame(app):
+    """Disegna lo stato della macchina all'istante simulato corrente e pianifica il fotogramma successivo."""
+    app.frame_job = None
+    frame_start = time.monotonic()
+    app.sim_time = current_sim_time(app)
+    with span('frame', 'ui'):
+        advance_to(app, app.sim_time)
+    count('frames')
+
+    if app.sim_time >= app.stop_time:
+        on_clock_stop(app)
+        return
 
-    x, y = app.current_position
-    x, y, duration, feed_rate = execute_gcode_instruction(app, instruction, x, y)
+    # Se il disegno è stato lento il fotogramma successivo parte subito: il tempo simulato
+    # dipende solo dall'orologio, quindi i fotogrammi persi vengono saltati senza accumulare ritardo
+    elapsed_ms = (time.monotonic() - frame_start) * 1000
+    app.frame_job = app.root.after(max(1, int(FRAME_INTERVAL_MS - elapsed_ms)), lambda: render_frame(app))
+
+def advance_to(app, sim_time):
+    """Porta grafico, posizione e istruzione evidenziata all'istante sim_time."""
+    toolpath = app.toolpath
+    completed = int(np.searchsorted(toolpath.end_times, sim_time, side='right'))
+    if app.stepping:
+        # Un passo non deve completare anche i movimenti istantanei che seguono
+        completed = min(completed, app.step_segment + 1)
+    if completed > app.completed_segments:
+        commit_segments(app, completed)
+
+    if completed < len(toolpath):
+        x, y = toolpath.position_at(completed, sim_time - toolpath.start_times[completed])
+        draw_segment_frame(app, completed, x, y)
+        if not app.stepping:
+            # Nel passo singolo l'istruzione evidenziata è scelta da step_simulation
+            index = int(toolpath.instruction_indexes[completed])
+            highlight_instruction(app, index)
+            app.current_instruction_index = index + 1
+    else:
+        x, y = toolpath.x[-1], toolpath.y[-1]
+    app.current_position = [float(x), float(y)]
+
+def on_clock_stop(app):
+    """Gestisce l'arrivo dell'orologio a stop_time: fine del programma o fine del passo singolo."""
+    if not app.stepping:
+        app.current_instruction_index = len(app.gcode_program)
+        app.show_message("Simulazione completata")
 
-    if instruction.startswith('G00') or instruction.startswith('G01'):
-        if instruction.startswith('G00'):
-            draw_line(app, app.current_position, [x, y], 'ro-')
-        else:
-            draw_line_with_speed(app, app.current_position, [x, y], 'bo-', duration, feed_rate)
-        app.current_position = [x, y]
+def highlight_instruction(app, index):
+    """Evidenzia nella lista la riga dell'istruzione indicata, se non è già evidenziata."""
+    row = app.gcode_program.line_numbers[index] - 1
+    if row == app.gcode_listbox.highlighted_row:
+        return
+    app.gcode_listbox.see(row)
+    app.gcode_listbox.highlight(row)  # Evidenzia l'istruzione corrente e deseleziona la precedente
+    app.show_message(f"Eseguendo: {app.gcode_listbox.get(row)}")
+
+def seek_simulation(app, index):
+    """Porta la simulazione subito prima dell'istruzione index, senza rieseguire le precedenti."""
+    if index >= len(app.gcode_program):
+        index = len(app.gcode_program)
+    running = app.frame_job is not None
+    stop_frames(app)
+    state = app.toolpath.state_at_instruction(index)
+    jump_to(app, state.time, state.segment)
+    app.current_position = [state.x, state.y]
+    app.current_instruction_index = index
+    if index < len(app.gcode_program):
+        highlight_instruction(app, index)
+    resume_after_seek(app, running)
+
+def seek_simulation_time(app, sim_time):
+    """Porta la simulazione all'istante sim_time (in secondi dall'inizio del programma)."""
+    sim_time = max(0.0, min(sim_time, app.toolpath.total_time))
+    running = app.frame_job is not None
+    stop_frames(app)
+    state = app.toolpath.state_at_instruction(app.toolpath.instruction_at_time(sim_time))
+    jump_to(app, sim_time, state.segment)
+    advance_to(app, sim_time)
+    resume_after_seek(app, running)
+
+def jump_to(app, sim_time, completed_segments):
+    """Imposta tempo e segmenti completati, poi ridisegna: il percorso viene ricostruito dagli array precalcolati."""
+    app.sim_time = sim_time
+    app.completed_segments = completed_segments
+    app.stepping = False
+    with span('canvas.draw', 'ui'):
         app.canvas.draw()
-        app.show_message(f"Eseguendo: {instruction}")
 
-    app.current_instruction_index += 1
-
-    if instruction.startswith('M30'):
-        app.show_message("Simulazione completata")
-        reset_simulation(app)
+def resume_after_seek(app, running):
+    """Riprende il ciclo dei fotogrammi se era attivo, altrimenti lascia la simulazione in pausa nel nuovo punto.
+
+    Lo spostamento interrompe l'eventuale passo singolo: la simulazione prosegue fino alla fine del programma,
+    non fino al vecchio stop_time del passo, che può precedere il nuovo punto.
+    """
+    app.stop_time = app.toolpath.total_time
+    if running:
+        start_clock(app, app.stop_time)
+    else:
+        app.simulation_paused = True
+
+def seek_from_entry(app):
+    """Interpreta il campo 'Vai a': un numero di riga (es. 400000) o un istante in secondi (es. 125.5s)."""
+    text = app.seek_entry.get().strip()
+    try:
+        if text.endswith('s'):
+            seek_simulation_time(app, float(text[:-1]))
+        else:
+            seek_simulation(app, bisect.bisect_left(app.gcode_program.line_numbers, int(text)))
+    except ValueError:
+        app.show_message("Errore: Inserisci un numero di riga o un tempo in secondi (es. 12.5s)", "error")
 
 def pause_simulation(app):
     """Mette in pausa la simulazione."""
+    if app.frame_job is not None:
+        stop_frames(app)
+        app.sim_time = current_sim_time(app)
     app.simulation_paused = True
     app.show_message("Simulazione messa in pausa")
 
 def resume_simulation(app):
     """Riprende la simulazione."""
     if app.simulation_paused:
-        app.simulation_paused = False
         app.show_message("Simulazione ripresa")
-        execute_next_instruction(app)
-
-def execute_gcode_instruction(app, instruction, current_x, current_y):
-    """Esegue una singola istruzione G-code e aggiorna la posizione."""
-    x, y = current_x, current_y
-    feed_rate = None
-    duration = 0  # Inizializza la variabile duration
-    if instruction.startswith('G1') or instruction.startswith('G0') or instruction.startswith('G00') or instruction.startswith('G01'):
-        parts = instruction.split()
-        for part in parts:
-            if part.startswith('X'):
-                x = float(part[1:])  # Aggiorna la coordinata X
-            elif part.startswith('Y'):
-                y = float(part[1:])  # Aggiorna la coordinata Y
-            elif part.startswith('F'):
-                feed_rate = float(part[1:])
-                
-        # Calcola la durata basata sulla velocità di avanzamento (feed rate)
-        if feed_rate:
-            distance = math.sqrt((x - current_x)**2 + (y - current_y)**2)
-            duration = distance / feed_rate
-    return x, y, duration, feed_rate
-
-def draw_line_with_speed(app, start, end, style, duration, feed_rate):
-    """Disegna una linea sul grafico in modo incrementale rispettando la velocità di avanzamento."""
-    x0, y0 = start
-    x1, y1 = end
-    steps = int(duration * 1000 / 10)  # Numero di passi per l'animazione
-    dx = (x1 - x0) / steps
-    dy = (y1 - y0) / steps
-
-    def draw_step(step):
-        if step > steps:
-            return
-        app.ax.plot([x0 + dx * (step - 1), x0 + dx * step], [y0 + dy * (step - 1), y0 + dy * step], style)
-        app.canvas.draw()
-        app.root.after(10, lambda: draw_step(step + 1))
-    
-    draw_step(1)
-
-def draw_line(app, start, end, style):
-    """Disegna una linea sul grafico."""
-    app.ax.plot([start[0], end[0]], [start[1], end[1]], style)
-    app.canvas.draw()
\ No newline at end of file
+        start_clock(app, app.stop_time)
@@ -0,0 +1,33 @@
+import os
+import sys
+import pytest
+
+# I moduli dell'applicazione stanno nella radice del repository, non in un pacchetto
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def write_program(tmp_path):
+    """Scrive un programma G-code nella cartella temporanea del test e ne restituisce il percorso."""
+    def write(lines, name="program.gcode"):
+        program_path = tmp_path / name
+        program_path.write_text("".join(f"{line}\n" for line in lines))
+        return str(program_path)
+    return write
+
+
+@pytest.fixture
+def fake_device():
+    """FakeDevice su pseudo-terminale, non ancora avviato; viene fermato alla fine del test."""
+    pytest.importorskip('pty')
+    from fake_device import FakeDevice
+
+    devices = []
+
+    def create(**kwargs):
+        device = FakeDevice(**kwargs)
+        devices.append(device)
+        return device
+    yield create
+    for device in devices:
+        device.stop()
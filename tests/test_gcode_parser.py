@@ -0,0 +1,22 @@
+import math
+from gcode_parser import parse_gcode, iter_gcode_errors, OP_G1
+
+
+def test_comments_are_ignored():
+    program = parse_gcode(["G1 X1 Y1 Z1 ; retract to X9 Y0", "(intestazione del CAM)", "G1 (X7) X2 Y3", "; fine"])
+
+    assert list(program.x) == [1, 2]
+    assert list(program.y) == [1, 3]
+    assert list(program.line_numbers) == [1, 3]
+    assert program.errors == []
+
+
+def test_exponents_are_rejected():
+    lines = ["G1 X1e3 Y1", "G1 X2 Y1E-2", "G1 X3 Y1"]
+    program = parse_gcode(lines)
+
+    assert list(program.opcodes) == [OP_G1]
+    assert list(program.x) == [3]
+    assert math.isnan(program.z[0])
+    assert program.errors == [(1, "G1 X1e3 Y1"), (2, "G1 X2 Y1E-2")]
+    assert [line_num for line_num, line in iter_gcode_errors(lines)] == [1, 2]
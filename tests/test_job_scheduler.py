@@ -0,0 +1,108 @@
+import queue
+import time
+import pytest
+import serial_sender
+from device_registry import Device
+from job_scheduler import (JobScheduler, JOB_STREAM, STATUS_DONE, STATUS_FAILED, STATUS_RETRYING,
+                           STATUS_CANCELLED, STATUS_LABELS)
+from serial_sender import DEFAULT_BAUDRATE
+from upload_pipeline import DEFAULT_FQBN
+
+
+@pytest.fixture(autouse=True)
+def short_startup(monkeypatch):
+    # Un dispositivo muto fallisce l'avvio in pochi decimi di secondo invece che in STARTUP_TIMEOUT
+    monkeypatch.setattr(serial_sender, 'STARTUP_TIMEOUT', 0.3)
+
+
+def follow(scheduler, job, on_status=None, timeout=10.0):
+    """Legge gli eventi dello scheduler finché il lavoro non è concluso; restituisce i messaggi di stato.
+
+    Si guardano i messaggi e non job.status, che nel frattempo può essere già passato allo stato successivo.
+    """
+    statuses = []
+    deadline = time.monotonic() + timeout
+    while not job.finished:
+        try:
+            event_job, kind, message = scheduler.events.get(timeout=max(0.0, deadline - time.monotonic()))
+        except queue.Empty:
+            pytest.fail(f"Il lavoro non è terminato entro {timeout}s (stato {job.status})")
+        if event_job is job and kind == 'status':
+            statuses.append(message)
+            if on_status is not None:
+                on_status(message)
+    return statuses
+
+
+def retrying(message):
+    return message.endswith(STATUS_LABELS[STATUS_RETRYING])
+
+
+def make_scheduler(device, **kwargs):
+    return JobScheduler([Device("Tornio", device.port, DEFAULT_FQBN, DEFAULT_BAUDRATE)], **kwargs)
+
+
+def test_stream_job_completes_on_first_attempt(fake_device, write_program):
+    device = fake_device().start()
+    scheduler = make_scheduler(device)
+    job = scheduler.submit("Tornio", JOB_STREAM, write_program(["G1 X1 Y1 Z1", "G1 X2 Y2 Z1"]))
+
+    follow(scheduler, job)
+    assert job.status == STATUS_DONE
+    assert job.attempts == 1
+    scheduler.shutdown()
+
+
+def test_failed_attempts_are_retried_then_reported(fake_device, write_program):
+    device = fake_device()  # Mai avviato: ogni tentativo scade in attesa del firmware
+    scheduler = make_scheduler(device, max_retries=2, retry_delay=0.05)
+    job = scheduler.submit("Tornio", JOB_STREAM, write_program(["G1 X1 Y1 Z1"]))
+
+    statuses = follow(scheduler, job)
+    assert job.status == STATUS_FAILED
+    assert job.attempts == 3
+    assert sum(retrying(message) for message in statuses) == 2
+    assert "non risponde" in job.message
+    scheduler.shutdown()
+
+
+def test_retry_succeeds_once_the_device_answers(fake_device, write_program):
+    device = fake_device()
+    scheduler = make_scheduler(device, max_retries=2, retry_delay=0.3)
+    job = scheduler.submit("Tornio", JOB_STREAM, write_program(["G1 X1 Y1 Z1"]))
+
+    follow(scheduler, job, on_status=lambda message: retrying(message) and device.start())
+    assert job.status == STATUS_DONE
+    assert job.attempts == 2
+    scheduler.shutdown()
+
+
+def test_stream_is_not_retried_after_lines_were_sent(fake_device, write_program, monkeypatch):
+    device = fake_device().start()
+    # Senza il controllo preliminare la terza riga fallisce quando le prime due sono già state eseguite
+    monkeypatch.setattr(serial_sender.StreamJob, 'check_program', lambda self: (3, 0))
+    scheduler = make_scheduler(device, max_retries=2, retry_delay=0.05)
+    job = scheduler.submit("Tornio", JOB_STREAM, write_program(["G1 X1 Y1 Z1", "G1 X2 Y1 Z1", "G1 X99999 Y1 Z1"]))
+
+    statuses = follow(scheduler, job)
+    assert job.status == STATUS_FAILED
+    assert job.attempts == 1
+    assert not any(retrying(message) for message in statuses)
+    # Le righe confermate possono essere ancora in esecuzione quando il lavoro fallisce
+    deadline = time.monotonic() + 2.0
+    while len(device.executed) < 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    time.sleep(0.1)  # Nessuna esecuzione ripetuta dopo le prime due
+    assert device.executed == [(1, (1, 1, 1)), (1, (2, 1, 1))]
+    scheduler.shutdown()
+
+
+def test_cancel_stops_retrying(fake_device, write_program):
+    device = fake_device()
+    scheduler = make_scheduler(device, max_retries=5, retry_delay=5.0)
+    job = scheduler.submit("Tornio", JOB_STREAM, write_program(["G1 X1 Y1 Z1"]))
+
+    follow(scheduler, job, on_status=lambda message: retrying(message) and scheduler.cancel(job))
+    assert job.status == STATUS_CANCELLED
+    assert job.attempts == 1
+    scheduler.shutdown()
@@ -0,0 +1,106 @@
+import time
+from collections import deque
+import pytest
+from serial_sender import StreamJob, SerialConnection, DeviceError, FLOW_COUNT, FLOW_ACK
+
+
+def drain(events):
+    items = []
+    while not events.empty():
+        items.append(events.get())
+    return items
+
+
+def wait_executed(device, count, timeout=5.0):
+    """Il firmware conferma una riga quando entra in coda: l'esecuzione può finire dopo il sender."""
+    deadline = time.monotonic() + timeout
+    while len(device.executed) < count and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return device.executed
+
+
+@pytest.mark.parametrize('flow', [FLOW_COUNT, FLOW_ACK])
+def test_stream_delivers_every_line_without_overflow(fake_device, write_program, flow):
+    lines = [f"G1 X{n % 5} Y1 Z1" for n in range(200)]
+    device = fake_device(time_scale=0.0005).start()
+    job = StreamJob(write_program(lines), port=device.port, flow=flow)
+
+    assert job.run()
+    assert job.lines_sent == len(lines)
+    assert wait_executed(device, len(lines)) == [(1, (n % 5, 1, 1)) for n in range(200)]
+    assert device.overflow_bytes == 0
+    assert drain(job.events)[-1] == ('done', True)
+
+
+def test_stream_skips_untranslatable_instructions(fake_device, write_program):
+    device = fake_device().start()
+    job = StreamJob(write_program(["G0 X1 Y1", "G1 X2 Y2 Z1", "G2 X3 Y4 I1 J0", "G1 X5"]), port=device.port)
+
+    assert job.run()
+    assert wait_executed(device, 2) == [(1, (2, 2, 1)), (2, (3, 4, 0))]
+
+
+def test_negative_durations_do_not_stop_the_device(fake_device, write_program):
+    device = fake_device(time_scale=0.001).start()
+    job = StreamJob(write_program(["G1 X-1 Y1 Z1", "G1 X1 Y1 Z1"]), port=device.port)
+
+    assert job.run()
+    assert wait_executed(device, 2) == [(1, (-1, 1, 1)), (1, (1, 1, 1))]
+
+
+def test_rejected_line_raises_device_error(fake_device):
+    device = fake_device().start()
+    job = StreamJob("unused.gcode", port=device.port)
+    with SerialConnection(device.port) as connection:
+        job.wait_for_device(connection)
+        with pytest.raises(DeviceError, match="riga 7"):
+            job.stream(connection, [(7, b"G9 X1\n", 0)])
+    assert device.rejected == ["G9 X1"]
+
+
+def test_silent_device_times_out(fake_device):
+    device = fake_device()  # Mai avviato: non risponde a nulla
+    job = StreamJob("unused.gcode", port=device.port, ack_timeout=0.3)
+    with SerialConnection(device.port) as connection:
+        start = time.monotonic()
+        with pytest.raises(DeviceError, match="non risponde"):
+            job.wait_ack(connection, deque([(1, 12, 0)]))
+    assert time.monotonic() - start < 2.0
+
+
+def test_long_commands_do_not_count_as_silence(fake_device, write_program):
+    # Ogni comando blocca il dispositivo per 0.3s (10s scalati), ben oltre ack_timeout
+    device = fake_device(time_scale=0.03).start()
+    job = StreamJob(write_program(["G1 X5 Y1 Z1"] * 10), port=device.port, ack_timeout=0.1)
+
+    assert job.run(), drain(job.events)
+    assert len(wait_executed(device, 10)) == 10
+
+
+def test_remaining_time_follows_firmware_durations(fake_device, write_program):
+    device = fake_device().start()
+    job = StreamJob(write_program(["G1 X10 Y2 Z2", "G2 X3 Y5", "G1 X-1 Y1 Z1"]), port=device.port)
+
+    assert job.run()
+    assert job.total_duration == 10 * (2 + 2) + 5
+    assert job.remaining_time() == 0
+
+
+def test_out_of_range_value_is_refused_before_streaming(fake_device, write_program):
+    device = fake_device().start()
+    job = StreamJob(write_program(["G1 X1 Y1 Z1", "G1 X2 Y1 Z1", "G1 X99999 Y1 Z1"]), port=device.port)
+
+    assert not job.run()
+    assert "linea 3" in [message for kind, message in drain(job.events) if kind == 'error'][0]
+    assert job.lines_sent == 0
+    time.sleep(0.1)
+    assert device.executed == []
+
+
+def test_missing_program_fails_without_connecting(tmp_path):
+    job = StreamJob(str(tmp_path / "missing.gcode"), port=str(tmp_path / "no-port"))
+
+    assert not job.run()
+    events = drain(job.events)
+    assert events[0][0] == 'error'
+    assert events[-1] == ('done', False)
@@ -0,0 +1,76 @@
+import os
+import stat
+import threading
+import pytest
+from build_cache import METADATA_FILE
+from gcode_translator import MODE_UNROLLED, MODE_PROGMEM
+from upload_pipeline import UploadJob
+
+# arduino-cli finto: "compila" copiando nella cartella della build lo sketch trovato nella cartella indicata.
+# L'attesa prima della copia allarga la finestra in cui due compilazioni parallele possono mescolarsi.
+FAKE_CLI = """#!/bin/sh
+if [ "$1" = compile ]; then
+  previous=""
+  for argument; do
+    if [ "$previous" = "--output-dir" ]; then output="$argument"; fi
+    previous="$argument"
+    sketch="$argument"
+  done
+  sleep 0.3
+  cat "$sketch"/*.ino > "$output/compiled.ino"
+fi
+exit 0
+"""
+
+
+@pytest.fixture
+def fake_cli(tmp_path):
+    if os.name == 'nt':
+        pytest.skip("l'arduino-cli finto è uno script POSIX")
+    cli_path = tmp_path / "arduino-cli"
+    cli_path.write_text(FAKE_CLI)
+    cli_path.chmod(cli_path.stat().st_mode | stat.S_IXUSR)
+    return str(cli_path)
+
+
+def run_job(job, results):
+    results[job.mode] = job.run()
+
+
+def test_concurrent_uploads_of_one_program_keep_their_own_sketch(tmp_path, fake_cli, write_program):
+    program_path = write_program(["G1 X1 Y2 Z3", "G2 X4 Y5", "G3 X6 Y7"])
+    cache_dir = str(tmp_path / "cache")
+    jobs = [UploadJob(program_path, mode, port="fake", arduino_cli_path=fake_cli, cache_dir=cache_dir)
+            for mode in (MODE_UNROLLED, MODE_PROGMEM)]
+    results = {}
+    threads = [threading.Thread(target=run_job, args=(job, results)) for job in jobs]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == {MODE_UNROLLED: True, MODE_PROGMEM: True}
+    entries = [name for name in os.listdir(cache_dir) if os.path.isfile(os.path.join(cache_dir, name, METADATA_FILE))]
+    assert len(entries) == 2
+    compiled = {}
+    for name in entries:
+        with open(os.path.join(cache_dir, name, 'build', 'compiled.ino')) as compiled_file:
+            compiled[name] = compiled_file.read()
+    # Ogni voce della cache contiene la build dello sketch della propria modalità
+    progmem_entries = [name for name, sketch in compiled.items() if 'PROGMEM' in sketch]
+    assert len(progmem_entries) == 1
+    unrolled_entry = next(name for name in entries if name not in progmem_entries)
+    assert 'blink(1, 2, 3);' in compiled[unrolled_entry]
+    # Nessuna traduzione nella cartella del programma condivisa tra i lavori
+    assert not os.path.exists(os.path.join(os.path.dirname(program_path), "program"))
+
+
+def test_second_upload_reuses_the_cached_build(tmp_path, fake_cli, write_program):
+    program_path = write_program(["G1 X1 Y2 Z3"])
+    cache_dir = str(tmp_path / "cache")
+    first = UploadJob(program_path, port="fake", arduino_cli_path=fake_cli, cache_dir=cache_dir)
+    second = UploadJob(program_path, port="fake", arduino_cli_path=fake_cli, cache_dir=cache_dir)
+
+    assert first.run() and not first.cache_hit
+    assert second.run() and second.cache_hit
+    assert 'compile' not in second.timings
@@ -0,0 +1,254 @@
+from collections import namedtuple
+import numpy as np
+from gcode_parser import OP_G1, OP_G2, OP_G3, OP_G4
+from motion_planner import DEFAULT_LIMITS, plan_motion, distance_at
+from arc_engine import interpolate_arcs
+from modal_interpreter import compile_blocks
+from instrumentation import span
+
+START_POSITION = (30, -10)
+
+MachineState = namedtuple('MachineState', ('instruction_index', 'segment', 'time', 'x', 'y', 'feed_rate'))
+
+
+class Toolpath:
+    """Percorso utensile dell'intero programma, precalcolato come array NumPy.
+
+    Il segmento k va da (x[k], y[k]) a (x[k + 1], y[k + 1]), nasce dall'istruzione
+    instruction_indexes[k] del programma (un arco genera più segmenti consecutivi, una sosta G4 un segmento
+    di lunghezza nulla) e inizia all'istante start_times[k]; plan ne descrive il profilo di velocità calcolato
+    dal pianificatore con i limiti della macchina, e le durate includono le soste.
+    """
+
+    def __init__(self, program, instruction_indexes, opcodes, x, y, feed_rates, lengths, plan, limits=DEFAULT_LIMITS):
+        program_length = len(program)
+        self.program = program
+        self.instruction_indexes = instruction_indexes
+        self.opcodes = opcodes
+        self.x = x
+        self.y = y
+        self.feed_rates = feed_rates
+        self.lengths = lengths
+        self.plan = plan
+        self.limits = limits
+        self.durations = durations = plan.durations
+        self.end_times = np.cumsum(durations)
+        self.start_times = self.end_times - durations
+        self.total_time = float(self.end_times[-1]) if len(durations) else 0.0
+        # Per ogni istruzione del programma, l'indice del suo ultimo segmento (-1 se non è un movimento né una sosta)
+        self.instruction_segments = np.full(program_length, -1, dtype=np.int64)
+        last = np.flatnonzero(np.append(instruction_indexes[1:] != instruction_indexes[:-1], True)) if len(instruction_indexes) else []
+        self.instruction_segments[instruction_indexes[last]] = last
+
+    def __len__(self):
+        return len(self.instruction_indexes)
+
+    def segment_for_instruction(self, index):
+        """Restituisce l'indice dell'ultimo segmento generato dall'istruzione, o -1."""
+        return int(self.instruction_segments[index])
+
+    def state_at_instruction(self, index):
+        """Stato della macchina subito prima dell'istruzione index, senza rieseguire il programma.
+
+        Posizione, tempo e avanzamento si leggono dagli array precalcolati (ricerca binaria sui movimenti);
+        l'avanzamento è quello effettivo del segmento successivo, già convertito in mm e limitato dalla macchina.
+        """
+        index = max(0, min(index, len(self.program)))
+        segment = int(np.searchsorted(self.instruction_indexes, index))
+        time = float(self.end_times[segment - 1]) if segment else 0.0
+        feed_rate = float(self.feed_rates[min(segment, len(self) - 1)]) if len(self) else float('nan')
+        return MachineState(index, segment, time, float(self.x[segment]), float(self.y[segment]), feed_rate)
+
+    def instruction_at_time(self, time):
+        """Indice dell'istruzione in esecuzione all'istante indicato (len(program) se il programma è finito)."""
+        segment = int(np.searchsorted(self.end_times, time, side='right'))
+        if segment < len(self):
+            return int(self.instruction_indexes[segment])
+        return len(self.program)
+
+    def position_at(self, segment, elapsed):
+        """Posizione dell'utensile dopo elapsed secondi dall'inizio del segmento, tenendo conto di accelerazioni e frenate."""
+        length = self.lengths[segment]
+        fraction = distance_at(self.plan, segment, elapsed, length, self.limits.acceleration) / length if length > 0 else 0.0
+        x = self.x[segment] + (self.x[segment + 1] - self.x[segment]) * fraction
+        y = self.y[segment] + (self.y[segment + 1] - self.y[segment]) * fraction
+        return float(x), float(y)
+
+    def bounds(self):
+        """Estremi (xmin, xmax, ymin, ymax) del percorso, punto di partenza compreso."""
+        return float(self.x.min()), float(self.x.max()), float(self.y.min()), float(self.y.max())
+
+    def polyline(self, opcode, stop, start=0, view=None, size=None):
+        """Coordinate dei segmenti del tipo indicato tra start e stop, da disegnare con un unico Line2D.
+
+        I segmenti consecutivi formano tratti continui, separati da NaN. Se view = (xmin, xmax, ymin, ymax)
+        vengono scartati i segmenti fuori vista; se anche size = (larghezza, altezza) in pixel è indicata,
+        la polilinea viene decimata al livello di dettaglio che quella vista può mostrare.
+        """
+        selected = start + np.flatnonzero(self.opcodes[start:stop] == opcode)
+        if view is not None:
+            selected = selected[segments_in_view(self.x, self.y, selected, view)]
+
+        # Un tratto inizia dove il segmento non prosegue il precedente
+        run_start = np.ones(len(selected), dtype=bool)
+        run_start[1:] = selected[1:] != selected[:-1] + 1
+        xs, ys = join_segments(self.x[selected], self.y[selected], self.x[selected + 1], self.y[selected + 1], run_start)
+
+        if view is not None and size is not None:
+            xs, ys = decimate_polyline(xs, ys, view, size)
+        return xs, ys
+
+    def iter_segments(self):
+        """Produce i segmenti come tuple (opcode, x0, y0, x1, y1, durata)."""
+        return zip(self.opcodes.tolist(), self.x[:-1].tolist(), self.y[:-1].tolist(),
+                   self.x[1:].tolist(), self.y[1:].tolist(), self.durations.tolist())
+
+
+def segments_in_view(x, y, selected, view, margin=0.05):
+    """Maschera dei segmenti selezionati che possono intersecare la vista (con un piccolo margine)."""
+    xmin, xmax, ymin, ymax = view
+    dx = (xmax - xmin) * margin
+    dy = (ymax - ymin) * margin
+    x0, x1 = x[selected], x[selected + 1]
+    y0, y1 = y[selected], y[selected + 1]
+    return ~((np.maximum(x0, x1) < xmin - dx) | (np.minimum(x0, x1) > xmax + dx) |
+             (np.maximum(y0, y1) < ymin - dy) | (np.minimum(y0, y1) > ymax + dy))
+
+
+def join_segments(x0, y0, x1, y1, run_start):
+    """Polilinea dei segmenti (x0, y0)-(x1, y1): ogni tratto continuo inizia con NaN + punto iniziale.
+
+    run_start indica i segmenti che non proseguono il precedente; gli altri aggiungono solo il punto finale.
+    """
+    counts = 1 + 2 * run_start
+    offsets = np.cumsum(counts) - counts
+    xs = np.full(int(counts.sum()), np.nan)
+    ys = np.full(len(xs), np.nan)
+    xs[offsets + 2 * run_start] = x1
+    ys[offsets + 2 * run_start] = y1
+    xs[offsets[run_start] + 1] = x0[run_start]
+    ys[offsets[run_start] + 1] = y0[run_start]
+    return xs, ys
+
+
+# Campioni elaborati insieme da decimate_polyline: limitano la memoria sui programmi molto lunghi
+DECIMATION_CHUNK_SAMPLES = 1 << 20
+
+
+def decimate_polyline(xs, ys, view, size):
+    """Tiene solo i segmenti che disegnano almeno un pixel della vista non ancora disegnato.
+
+    Ogni segmento viene campionato a passi di un pixel; un segmento i cui pixel sono già stati coperti da
+    segmenti precedenti (passate ripetute, tratti sovrapposti, corde più corte di un pixel) viene scartato.
+    Ogni segmento rimasto è il primo a coprire almeno un pixel, quindi i segmenti sono al più
+    larghezza × altezza qualunque sia la lunghezza del programma, e l'immagine cambia al più di un pixel.
+    """
+    xmin, xmax, ymin, ymax = view
+    width, height = (max(int(np.ceil(side)), 1) for side in size)
+    px = (xs - xmin) * (width / ((xmax - xmin) or 1))
+    py = (ys - ymin) * (height / ((ymax - ymin) or 1))
+    gap = np.isnan(px) | np.isnan(py)
+    # Segmenti tra vertici consecutivi, più i tratti di un solo vertice come segmenti di lunghezza nulla
+    previous_gap = np.concatenate(([True], gap[:-1]))
+    next_gap = np.concatenate((gap[1:], [True]))
+    linked = np.flatnonzero(~gap[:-1] & ~gap[1:])
+    isolated = np.flatnonzero(~gap & previous_gap & next_gap)
+    first = np.sort(np.concatenate((linked, isolated)))
+    last = np.where(next_gap[first], first, first + 1)
+
+    x0, y0 = px[first], py[first]
+    dx, dy = px[last] - x0, py[last] - y0
+    steps = np.ceil(np.maximum(np.abs(dx), np.abs(dy))).astype(np.int64)
+    samples = steps + 1
+    totals = np.cumsum(samples)
+    covered = np.zeros(width * height, dtype=bool)
+    kept = np.zeros(len(first), dtype=bool)
+    start = 0
+    while start < len(first):
+        stop = max(start + 1, int(np.searchsorted(totals, totals[start] - samples[start] + DECIMATION_CHUNK_SAMPLES)))
+        segment = np.repeat(np.arange(start, stop), samples[start:stop])
+        offsets = np.cumsum(samples[start:stop]) - samples[start:stop]
+        fraction = (np.arange(len(segment)) - np.repeat(offsets, samples[start:stop])) / np.maximum(steps[segment], 1)
+        column = np.floor(x0[segment] + dx[segment] * fraction)
+        row = np.floor(y0[segment] + dy[segment] * fraction)
+        inside = (column >= 0) & (column < width) & (row >= 0) & (row < height)
+        cells = (row[inside] * width + column[inside]).astype(np.int64)
+        segment = segment[inside]
+        fresh = ~covered[cells]
+        # Il primo segmento che raggiunge un pixel nuovo è quello che lo disegna
+        cells, owners = np.unique(cells[fresh], return_index=True)
+        kept[segment[fresh][owners]] = True
+        covered[cells] = True
+        start = stop
+
+    first, last = first[kept], last[kept]
+    run_start = np.ones(len(first), dtype=bool)
+    run_start[1:] = first[1:] != last[:-1]
+    return join_segments(xs[first], ys[first], xs[last], ys[last], run_start)
+
+
+def compute_toolpath(program, start=START_POSITION, limits=DEFAULT_LIMITS):
+    """Calcola in blocco posizioni, lunghezze e durate di tutti i movimenti e le soste del programma.
+
+    Lo stato modale (unità, G90/G91, G92, G28, G4) viene risolto una volta sola dall'interprete modale,
+    quindi simulatore e stima del tempo ciclo lavorano su segmenti già in coordinate macchina. Gli archi
+    G2/G3 vengono convertiti in corde dal motore degli archi, con l'errore massimo limits.arc_tolerance;
+    una sosta è un segmento di lunghezza nulla che dura quanto la sosta, da cui la macchina riparte da ferma.
+    """
+    with span('toolpath', 'planner', instructions=len(program)):
+        return build_toolpath(program, start, limits)
+
+
+def build_toolpath(program, start, limits):
+    """Corpo di compute_toolpath, misurato da quella come fase 'toolpath'."""
+    blocks = compile_blocks(program, start, limits)
+    block_opcodes = blocks.opcodes
+
+    # Punti finali di ogni blocco, preceduti dalla posizione di partenza
+    targets_x = np.empty(len(block_opcodes) + 1)
+    targets_y = np.empty(len(block_opcodes) + 1)
+    targets_x[0], targets_y[0] = start
+    targets_x[1:] = blocks.x
+    targets_y[1:] = blocks.y
+
+    # Ogni blocco diventa un segmento, ogni arco tante corde quante ne richiede la tolleranza
+    counts = np.ones(len(block_opcodes), dtype=np.int64)
+    arcs = np.flatnonzero((block_opcodes == OP_G2) | (block_opcodes == OP_G3))
+    if len(arcs):
+        arc_counts, arc_x, arc_y = interpolate_arcs(
+            targets_x[arcs], targets_y[arcs], targets_x[arcs + 1], targets_y[arcs + 1],
+            blocks.i[arcs], blocks.j[arcs], blocks.r[arcs], block_opcodes[arcs] == OP_G2, limits.arc_tolerance)
+        counts[arcs] = arc_counts
+
+    ends = np.cumsum(counts)
+    x = np.empty(int(ends[-1]) + 1 if len(ends) else 1)
+    y = np.empty(len(x))
+    x[0], y[0] = start
+    x[ends] = targets_x[1:]
+    y[ends] = targets_y[1:]
+    if len(arcs):
+        # Le corde di ogni arco occupano le posizioni che precedono (e includono) il suo punto finale
+        arc_points = np.repeat(ends[arcs] - arc_counts, arc_counts) + 1
+        arc_points += np.arange(len(arc_points)) - np.repeat(np.cumsum(arc_counts) - arc_counts, arc_counts)
+        x[arc_points] = arc_x
+        y[arc_points] = arc_y
+
+    instruction_indexes = np.repeat(blocks.instruction_indexes, counts)
+    # Le corde degli archi sono movimenti di lavoro: vengono disegnate e pianificate come i G1
+    segment_opcodes = np.repeat(np.where((block_opcodes == OP_G2) | (block_opcodes == OP_G3), OP_G1,
+                                         block_opcodes).astype(np.int32), counts)
+    feed_rates = np.repeat(blocks.feed_rates, counts)
+
+    dx = np.diff(x)
+    dy = np.diff(y)
+    lengths = np.hypot(dx, dy)
+    dwells = np.flatnonzero(block_opcodes == OP_G4)
+    # Una sosta produce un solo segmento, che è l'ultimo (e unico) del suo blocco
+    dwell_segments = ends[dwells] - 1
+    plan = plan_motion(dx, dy, lengths, feed_rates, limits, stops=dwell_segments)
+    if len(dwells):
+        durations = plan.durations.copy()
+        durations[dwell_segments] += blocks.dwells[dwells]
+        plan = plan._replace(durations=durations)
+
+    return Toolpath(program, instruction_indexes, segment_opcodes, x, y, feed_rates, lengths, plan, limits)
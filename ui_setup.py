@@ -1,5 +1,6 @@
 import tkinter as tk
 from tkinter import ttk
+from gcode_translator import TRANSLATION_MODES, MODE_UNROLLED
 
 def setup_ui(app):
     """Configura l'interfaccia utente."""
@@ -12,6 +13,11 @@ def setup_ui(app):
     app.message_label = tk.Label(app.right_frame, text="", fg="red")
     app.message_label.pack(pady=5)
 
+    app.translation_mode = tk.StringVar(value=MODE_UNROLLED)
+    app.search_var = tk.StringVar()
+    app.device_var = tk.StringVar(value=next(iter(app.scheduler.devices), ""))
+    app.search_var.trace_add('write', lambda *args: app.load_existing_programs())
+
     initialize_left_frame(app)
     initialize_graph(app)
     plot_initial_graph(app)
@@ -22,9 +28,15 @@ def initialize_left_frame(app):
         widget.destroy()
 
     ttk.Label(app.left_frame, text="Vecchi Programmi").pack(pady=10)
+    ttk.Entry(app.left_frame, textvariable=app.search_var).pack(padx=10)
 
-    app.program_listbox = tk.Listbox(app.left_frame)
+    app.program_listbox = tk.Listbox(app.left_frame, selectmode=tk.EXTENDED)
     app.program_listbox.pack(padx=10, pady=10)
+    app.program_listbox.bind("<<ListboxSelect>>", lambda event: app.show_program_info())
+
+    ttk.Label(app.left_frame, text="Macchina:").pack()
+    ttk.Combobox(app.left_frame, textvariable=app.device_var, values=list(app.scheduler.devices),
+                 state="readonly").pack(padx=10, pady=(0, 10))
 
     button_width = 25
 
@@ -33,12 +45,22 @@ def initialize_left_frame(app):
         ("Modifica Programma", app.edit_selected_program),
         ("Simulazione", app.prepare_simulation),
         ("Carica su Arduino", app.upload_to_arduino),
-        ("Traduci G-code", app.translate_gcode)
+        ("Invia in Streaming", app.stream_to_arduino),
+        ("Annulla Caricamento", app.cancel_upload),
+        ("Stato Macchine", app.show_device_status),
+        ("Traduci G-code", app.translate_gcode),
+        ("Compila Selezionati", app.batch_selected_programs),
+        ("Aggiungi Cartella", app.add_library_directory),
+        ("Tempi e Profilazione", app.show_timings)
     ]
 
     for text, command in buttons:
         ttk.Button(app.left_frame, text=text, command=command, width=button_width).pack(pady=10)
 
+    ttk.Label(app.left_frame, text="Modalità dello sketch:").pack()
+    ttk.Combobox(app.left_frame, textvariable=app.translation_mode, values=TRANSLATION_MODES,
+                 state="readonly").pack(padx=10, pady=(0, 10))
+
 def initialize_graph(app):
     """Inizializza il grafico nel frame destro."""
     from matplotlib.figure import Figure
@@ -54,6 +76,7 @@ def initialize_graph(app):
     app.ax.set_ylim([-20, 20])
 
     app.canvas = FigureCanvasTkAgg(app.figure, app.right_frame)
+    app.draw_event_id = None
     app.canvas.get_tk_widget().pack(fill="both", expand=True)
 
 def plot_initial_graph(app):
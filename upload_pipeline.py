@@ -0,0 +1,161 @@
+import os
+import queue
+import subprocess
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from gcode_translator import translate_gcode_file, sketch_path_for, MODE_UNROLLED
+from instrumentation import span, count, mark, profiler
+from build_cache import CACHE_DIR, cache_key, lookup_build, create_staging_dir, discard_staging_dir, store_build, evict_cache
+
+DEFAULT_FQBN = "arduino:avr:uno"
+DEFAULT_PORT = "COM3"
+ARDUINO_CLI_PATH = os.path.join(os.path.dirname(__file__), 'arduino-cli', 'arduino-cli.exe')
+ERROR_TAIL_LINES = 20
+
+_executor = None
+
+
+class UploadCancelled(Exception):
+    """Sollevata quando un caricamento viene annullato dall'operatore."""
+
+
+class UploadJob:
+    """Traduzione, compilazione e caricamento di un programma, pensati per girare fuori dal thread di Tk.
+
+    Il lavoro non tocca mai l'interfaccia: pubblica tuple (tipo, messaggio) sulla coda events,
+    con tipo tra 'progress', 'info', 'error' e infine 'done' (messaggio = esito booleano).
+    """
+
+    def __init__(self, program_path, mode=MODE_UNROLLED, fqbn=DEFAULT_FQBN, port=DEFAULT_PORT,
+                 arduino_cli_path=ARDUINO_CLI_PATH, cache_dir=CACHE_DIR):
+        self.program_path = program_path
+        self.mode = mode
+        self.fqbn = fqbn
+        self.port = port
+        self.arduino_cli_path = arduino_cli_path
+        self.cache_dir = cache_dir
+        self.events = queue.Queue()
+        self.timings = {}
+        self.cache_hit = False
+        self._cancelled = threading.Event()
+        self._process = None
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def emit(self, kind, message):
+        if kind == 'error':
+            mark('error', 'upload', message=message)
+        self.events.put((kind, message))
+
+    def cancel(self):
+        """Richiede l'annullamento e termina il processo arduino-cli in corso, se presente."""
+        self._cancelled.set()
+        with self._lock:
+            if self._process is not None and self._process.poll() is None:
+                self._process.terminate()
+
+    def check_cancelled(self):
+        if self.cancelled:
+            raise UploadCancelled()
+
+    def run_cli(self, args):
+        """Esegue arduino-cli inoltrando l'output riga per riga; restituisce (codice, ultime righe)."""
+        tail = deque(maxlen=ERROR_TAIL_LINES)
+        with self._lock:
+            self.check_cancelled()
+            self._process = subprocess.Popen([self.arduino_cli_path] + args, stdout=subprocess.PIPE,
+                                             stderr=subprocess.STDOUT, text=True, bufsize=1)
+        try:
+            for line in self._process.stdout:
+                line = line.rstrip()
+                if line:
+                    tail.append(line)
+                    self.emit('progress', line)
+            returncode = self._process.wait()
+        finally:
+            with self._lock:
+                self._process.stdout.close()
+                self._process = None
+        self.check_cancelled()
+        return returncode, "\n".join(tail)
+
+    def compile(self):
+        """Restituisce la cartella della build, dalla cache o compilando; None se la compilazione fallisce."""
+        key = cache_key(self.program_path, self.fqbn, self.mode)
+        build_dir = lookup_build(key, self.cache_dir)
+        if build_dir is not None:
+            self.cache_hit = True
+            count('build_cache_hits')
+            self.emit('info', "Build già compilata trovata in cache")
+            return build_dir
+
+        # Lo sketch viene tradotto nella cartella temporanea di questo lavoro: due lavori sullo stesso
+        # programma (con modalità o FQBN diversi) non possono compilare l'uno lo sketch dell'altro
+        staging_dir = create_staging_dir(key, self.cache_dir)
+        try:
+            sketch_path = self.program_path
+            if self.program_path.endswith('.gcode'):
+                start = time.perf_counter()
+                staged_program = os.path.join(staging_dir, 'sketch', os.path.basename(self.program_path))
+                sketch_path = translate_gcode_file(self.program_path, sketch_path_for(staged_program), mode=self.mode)
+                self.timings['translate'] = time.perf_counter() - start
+                self.emit('info', "Programma tradotto")
+            self.check_cancelled()
+            self.emit('info', "Compilazione in corso...")
+            with span('compile', 'arduino-cli', fqbn=self.fqbn) as timer:
+                returncode, output = self.run_cli(["compile", "--fqbn", self.fqbn, "--output-dir",
+                                                   os.path.join(staging_dir, 'build'), os.path.dirname(sketch_path)])
+            self.timings['compile'] = timer.duration
+        except BaseException:
+            discard_staging_dir(staging_dir)
+            raise
+        if returncode != 0:
+            discard_staging_dir(staging_dir)
+            self.emit('error', f"Errore durante la compilazione: {output}")
+            return None
+        build_dir = store_build(key, staging_dir, sketch_path, self.fqbn, self.cache_dir)
+        evict_cache(self.cache_dir)
+        return build_dir
+
+    def upload(self, build_dir):
+        """Carica sulla scheda una build già compilata."""
+        self.emit('info', f"Caricamento su {self.port} in corso...")
+        with span('upload', 'arduino-cli', port=self.port) as timer:
+            returncode, output = self.run_cli(["upload", "-p", self.port, "--fqbn", self.fqbn, "--input-dir", build_dir])
+        self.timings['upload'] = timer.duration
+        if returncode != 0:
+            self.emit('error', f"Errore durante il caricamento: {output}")
+            return False
+        self.emit('info', "Programma caricato su Arduino con successo")
+        return True
+
+    def run(self):
+        """Esegue l'intera pipeline; restituisce True se il caricamento è riuscito."""
+        success = False
+        try:
+            if not os.path.isfile(self.program_path):
+                self.emit('error', f"Errore: Il file {self.program_path} non esiste.")
+                return False
+            with profiler.profiled(), span('upload_job', 'job', program=self.program_path):
+                build_dir = self.compile()
+                success = build_dir is not None and self.upload(build_dir)
+        except UploadCancelled:
+            self.emit('error', "Caricamento annullato")
+        except Exception as e:
+            self.emit('error', f"Errore: Impossibile caricare il programma su Arduino: {e}")
+        finally:
+            self.emit('done', success)
+        return success
+
+
+def submit_upload(job):
+    """Avvia il lavoro sul pool di thread dedicato ai caricamenti e restituisce il Future."""
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="upload")
+    return _executor.submit(job.run)